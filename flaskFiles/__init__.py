@@ -8,11 +8,14 @@ from pytest import main
 from flask import Flask, render_template, flash, url_for, redirect, session, request, send_from_directory
 from flask_login import current_user, login_user, logout_user
 from hashlib import sha512
-from requests import post, get
+from integration.transport import post, get
 from flaskFiles.forms import *
+from integration.bootstrap import runUserBootstrap, userBootstrap
 from integration.events.slackEvents import slackEvents
-from integration.events.zulipEvents import zulipEvents
+from integration.events.zulipEvents import handleZulipEvents
 from integration.markdown.emojis.shortCodeDict import emojiList
+from integration.markdown.emojis.emojiOverlay import invalidateEmojiOverlay
+from integration.directories.slackIdentity import invalidateBotIdentity
 from integration.reportGeneration.parseReport import parseReport
 from integration.utilities import parseZulipRC, slackHeader
 
@@ -145,6 +148,9 @@ def Signup():
 def RegisterQueue():
     if current_user.is_authenticated:
         if request.method == 'POST':
+            # set up the Slack stream and the bot's subscription once, before registering a queue narrowed to the stream
+            runUserBootstrap(current_user)
+
             # make a request to the Zulip endpoint and return back
             zulipAuth = parseZulipRC(current_user.zulipBotRC)
             registerQueue = {"narrow": '[["stream", "Slack"]]'}
@@ -164,6 +170,9 @@ def RegisterQueue():
 def RegisterSocket():
     if current_user.is_authenticated:
         if request.method == 'POST':
+            # set up the Slack stream and the bot's subscription once, the first route to run does the work
+            runUserBootstrap(current_user)
+
             # register a Slack socket using current user data
             openConnectionRequest = post("https://slack.com/api/apps.connections.open", headers=slackHeader(current_user.slackAppToken))
 
@@ -178,6 +187,17 @@ def RegisterSocket():
     return redirect(url_for("Home"))
 
 
+@app.route('/api/bootstrapProgress', methods=['GET'])
+def BootstrapProgress():
+    if current_user.is_authenticated:
+        # report how far setting up the Slack stream has got, e.g. while the members of a large workspace are subscribed
+        progress = userBootstrap(current_user).progress
+        return dumps({'state': progress['state'], 'subscribed': progress['subscribed']}), 200
+
+    flash("Unauthorised access", 'danger')
+    return redirect(url_for("Home"))
+
+
 @app.route('/generateTest', methods=['GET', 'POST'])
 def RunTests():
     if current_user.is_authenticated:
@@ -245,12 +265,14 @@ def slackEventRoute():
 def zulipEventRoute():
     """
     All Zulip events that are received via HTTP POST requests are sent to this endpoint and processed further.
-    Incoming Zulip events are generally passed from the JavaScript handler to here.
+    Incoming Zulip events are generally passed from the JavaScript handler to here, a whole poll at a time.
+    Returns the highest ID of the events handled, an event that failed is logged and skipped.
     """
     if current_user.is_authenticated:
         if request.method == 'POST':
             if 'result' in request.json and request.json['result'] == 'success':
-                zulipEvents(request.json['events'])
+                results, handledID = handleZulipEvents(request.json['events'])
+                return dumps({'last_event_id': handledID}), 200
         return "Authorised"
 
     flash("Unauthorised access", 'danger')
@@ -333,6 +355,7 @@ def EmojiAdditions():
         # convert to string representation of dictionary
         current_user.emojiAdditions = dumps(current_user.emojiAdditions)
         db.session.commit()
+        invalidateEmojiOverlay(current_user.id)
         return render_template('emojiAdditions.html', emoji=loads(current_user.emojiAdditions))
 
     flash("Unauthorised access you need to login first!", 'warning')
@@ -714,9 +737,11 @@ def SlackToken():
                 return render_template(url_for('Login'))
 
             # Add new slackToken to the database
+            invalidateBotIdentity(current_user.slackToken)
             current_user.slackToken = slackTokenForm.file.data
             current_user.slackTokenValidity = "Not Checked"
             db.session.commit()
+            invalidateBotIdentity(current_user.slackToken)
 
             flash("Slack Bot token submitted successfully", 'success')
             return redirect(slackTokenForm.hiddenRedirect.data)
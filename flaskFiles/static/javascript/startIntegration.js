@@ -2,6 +2,10 @@
 let socket = null;
 let queue_id = null;
 let lastEventID = -1;
+let zulipRetries = 0;
+
+// number of times a poll the endpoint could not handle is sent again before the error is shown
+const ZULIP_RETRY_LIMIT = 3;
 let controller = new AbortController();
 
 
@@ -184,27 +188,59 @@ function startZulip() {
         .then(response => response.json())
         .then(zulipData => {
             // if the request is of the correct format
-            if ('result' in zulipData && zulipData.result == 'success' && 'events' in zulipData && 'type' in zulipData.events[0] && zulipData.events[0].type !== 'presence' && zulipData.events[0].type !== 'heartbeat') {
-                // pass this fetch to the flask \api\zulipEvents endpoint for further processing
+            if ('result' in zulipData && zulipData.result == 'success' && 'events' in zulipData && zulipData.events.length > 0) {
+                // the highest event ID in the poll, every event up to it is handled by this poll
+                let pollEventID = Math.max(...zulipData.events.map(event => event.id));
+
+                // presence and heartbeat events are not bridged
+                let bridgedEvents = zulipData.events.filter(event => event.type !== 'presence' && event.type !== 'heartbeat');
+                if (bridgedEvents.length === 0) {
+                    lastEventID = Math.max(lastEventID, pollEventID);
+                    return startZulip();
+                }
+
+                // pass every event of the poll to the flask \api\zulipEvents endpoint, which handles them in order
                 return fetch("\\api\\zulipEvents", {
                         method: 'POST',
                         headers: {
                             'Content-Type': 'application/json'
                         },
                         signal: controller.signal,
-                        body: JSON.stringify(zulipData)
+                        body: JSON.stringify(Object.assign({}, zulipData, {events: bridgedEvents}))
                     })
                     .then(zulipEndpointData => {
-                        // increment the lastEventID so that the last event is ignored, otherwise, recursion will occur
                         if (zulipEndpointData.status === 200) {
-                            lastEventID++;
-                            // call the function again, this will continue until the signal is aborted
-                            startZulip();
+                            return zulipEndpointData.json()
+                                .then(handled => {
+                                    // poll from the last event the endpoint handled, the events it did not bridge count as handled
+                                    let handledEventID = lastEventID;
+                                    for (let event of zulipData.events.slice().sort((a, b) => a.id - b.id)) {
+                                        if (event.id > handled.last_event_id && bridgedEvents.includes(event)) {
+                                            break;
+                                        }
+                                        handledEventID = Math.max(handledEventID, event.id);
+                                    }
+
+                                    // events that failed were logged by the endpoint, and are skipped once they have failed too often
+                                    if (handledEventID < pollEventID && ++zulipRetries < ZULIP_RETRY_LIMIT) {
+                                        lastEventID = handledEventID;
+                                        return new Promise(resolve => setTimeout(resolve, 1000)).then(startZulip);
+                                    }
+
+                                    zulipRetries = 0;
+                                    lastEventID = Math.max(lastEventID, pollEventID);
+                                    // call the function again, this will continue until the signal is aborted
+                                    startZulip();
+                                })
+                        }
+
+                        // the endpoint could not handle the poll, so the same events are polled again shortly until it has failed too often
+                        if (++zulipRetries >= ZULIP_RETRY_LIMIT) {
+                            zulipRetries = 0;
+                            throw Error('Zulip events could not be handled, the endpoint answered ' + zulipEndpointData.status);
                         }
+                        return new Promise(resolve => setTimeout(resolve, 1000)).then(startZulip);
                     })
-            } else if('result' in zulipData && zulipData.result == 'success' && 'events' in zulipData && 'type' in zulipData.events[0] && (zulipData.events[0].type === 'presence' || zulipData.events[0].type === 'heartbeat')) {
-                lastEventID++;
-                startZulip();
             } else {
                 // something unknown went wrong did not catch so call again.
                 startZulip();
@@ -29,4 +29,34 @@ class User(db.Model, UserMixin):
     zulipPrefix = db.Column(db.String(), nullable=False, default='{name} from Slack |')
     emojiAdditions = db.Column(db.JSON(), nullable=False, default="{}")
 
-    testMode = db.Column(db.Boolean, default=False, nullable=False)
\ No newline at end of file
+    testMode = db.Column(db.Boolean, default=False, nullable=False)
+
+    bootstrapRecord = db.relationship('BootstrapRecord', uselist=False)
+
+    @property
+    def bootstrapProgress(self):
+        """
+        JSON string of the progress of setting up the user's Slack stream, "{}" if none has been saved.
+        """
+        if self.bootstrapRecord is None:
+            return "{}"
+        return self.bootstrapRecord.progress
+
+    @bootstrapProgress.setter
+    def bootstrapProgress(self, progress):
+        if self.bootstrapRecord is None:
+            self.bootstrapRecord = BootstrapRecord(progress=progress)
+        else:
+            self.bootstrapRecord.progress = progress
+
+
+class BootstrapRecord(db.Model):
+    """
+    Bootstrap progress table database structure, one row for each user. It is a table of its own so db.create_all() adds
+    it to databases created before it, which would not be given a new column of the user table.
+
+    :param db.model: database model object
+    :type db.model: SQLAlchemy database model
+    """
+    userID = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    progress = db.Column(db.JSON(), nullable=False, default="{}")
\ No newline at end of file
@@ -0,0 +1,334 @@
+import asyncio
+import json
+from atexit import register
+from base64 import b64encode
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from contextvars import ContextVar, copy_context
+from functools import partial
+from threading import Lock, Thread, get_ident
+from weakref import WeakKeyDictionary
+from aiohttp import ClientConnectionError, ClientConnectorError, ClientError, ClientSession, ClientTimeout, TCPConnector
+from werkzeug.local import LocalProxy
+from integration.transport import TIMEOUT
+
+# bridge operations running at once in one process, operations over this number wait their turn without holding a connection
+IN_FLIGHT_LIMIT = 1024
+
+# bridge operations of one tenant running at once, so one busy workspace cannot hold every in flight slot
+TENANT_LIMIT = 32
+
+# only connection failures are retried, as a request that reached Slack or Zulip may already have posted a message
+CONNECT_RETRIES = 3
+RETRY_BACKOFF = 0.3
+
+# threads running the directory refreshes, channel creation and bootstrap, which stay blocking
+BLOCKING_WORKERS = 16
+
+# True while a coroutine holds an in flight slot, so operations calling other operations do not take a second slot
+holdingSlot = ContextVar('holdingSlot', default=False)
+
+
+class AsyncResponse:
+    """
+    Response of an asyncio request, with the attributes of a requests response used by the integration. The body of a
+    request is read before it is returned, the body of a stream is read with iter_content.
+
+    :param response: Response from aiohttp
+    :type response: ClientResponse
+
+    :param content: Body of the response, None for a stream
+    :type content: Bytes
+    """
+    def __init__(self, response, content=None):
+        self.response = response
+        self.status_code = response.status
+        self.headers = response.headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode(self.response.charset or 'utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        self.response.raise_for_status()
+
+    def iter_content(self, chunkSize):
+        return self.response.content.iter_chunked(chunkSize)
+
+
+class AsyncTransport:
+    """
+    The aiohttp session and the in flight limits of one event loop. Connections are pooled by aiohttp for each host,
+    and the number of operations running at once is bounded by IN_FLIGHT_LIMIT and TENANT_LIMIT of each tenant.
+    """
+    def __init__(self):
+        self.session = None
+        self.inFlight = asyncio.Semaphore(IN_FLIGHT_LIMIT)
+        self.semaphores = {}
+
+    def clientSession(self):
+        """
+        Returns the session of the event loop, opening it on first use.
+        """
+        if self.session is None or self.session.closed:
+            # the number of connections is bounded by the operations in flight rather than by the connector, so a
+            # download held open while its file is uploaded can never wait on a connection held by another download
+            self.session = ClientSession(connector=TCPConnector(limit=0))
+        return self.session
+
+    def semaphore(self, key, limit):
+        """
+        Returns the semaphore of a key, created with limit slots on first use.
+
+        :param key: Name of what is limited e.g. ('tenant', token)
+        :type key: Tuple
+
+        :param limit: Slots of the semaphore
+        :type limit: Integer
+        """
+        semaphore = self.semaphores.get(key)
+        if semaphore is None:
+            semaphore = self.semaphores[key] = asyncio.Semaphore(limit)
+        return semaphore
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+
+# the transport of each event loop
+transports = WeakKeyDictionary()
+transportsLock = Lock()
+
+
+def asyncTransport():
+    """
+    Returns the transport of the running event loop, creating it on first use.
+    """
+    loop = asyncio.get_running_loop()
+    transport = transports.get(loop)
+    if transport is None:
+        with transportsLock:
+            transport = transports.get(loop)
+            if transport is None:
+                transport = transports[loop] = AsyncTransport()
+    return transport
+
+
+async def closeTransport():
+    """
+    Close the session of the running event loop and its connections, the next request opens a new session.
+    """
+    transport = transports.pop(asyncio.get_running_loop(), None)
+    if transport is not None:
+        await transport.close()
+
+
+@asynccontextmanager
+async def operationSlot(tenant):
+    """
+    Hold an in flight slot, and one of the tenant's slots, while a bridge operation runs. An operation started by
+    another operation uses the slot already held.
+
+    :param tenant: Key of the tenant e.g. its Slack token
+    :type tenant: String
+    """
+    if holdingSlot.get():
+        yield
+        return
+
+    # the tenant's slot is taken first, so a tenant at its limit waits without holding one of the shared slots
+    transport = asyncTransport()
+    async with transport.semaphore(('tenant', tenant), TENANT_LIMIT):
+        async with transport.inFlight:
+            held = holdingSlot.set(True)
+            try:
+                yield
+            finally:
+                holdingSlot.reset(held)
+
+
+def requestArguments(kwargs):
+    """
+    Returns the keyword arguments of a requests call as the keyword arguments of aiohttp, with the default TIMEOUT
+    if none is given.
+
+    :param kwargs: Keyword arguments taken by requests.request
+    :type kwargs: Dictionary
+    """
+    kwargs = dict(kwargs)
+    timeout = kwargs.pop('timeout', TIMEOUT)
+    connectTimeout, readTimeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+    kwargs['timeout'] = ClientTimeout(sock_connect=connectTimeout, sock_read=readTimeout)
+
+    # the email and key of a Zulip bot are sent as basic auth
+    auth = kwargs.pop('auth', None)
+    if auth is not None:
+        kwargs['headers'] = dict(kwargs.get('headers') or {}, Authorization='Basic ' + b64encode(':'.join(auth).encode()).decode())
+
+    # requests leaves out parameters that are None and sends the others as strings
+    if kwargs.get('params'):
+        kwargs['params'] = {key: str(value) for key, value in kwargs['params'].items() if value is not None}
+    return kwargs
+
+
+async def sendRequest(method, url, **kwargs):
+    """
+    Send a request, retrying it CONNECT_RETRIES times if a connection cannot be made, returns the aiohttp response.
+
+    :param method: HTTP method e.g. GET
+    :type method: String
+
+    :param url: Address the request is sent to
+    :type url: String
+    """
+    session = asyncTransport().clientSession()
+    for attempt in range(CONNECT_RETRIES + 1):
+        try:
+            return await session.request(method, url, **requestArguments(kwargs))
+        except ClientConnectorError:
+            if attempt == CONNECT_RETRIES:
+                raise
+            await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+        except ClientConnectionError as error:
+            # an error raised while a streamed body was read, e.g. a download over its size limit, is raised as it is
+            if isinstance(error.__cause__, Exception) and not isinstance(error.__cause__, (OSError, ClientError)):
+                raise error.__cause__
+            raise
+
+
+async def request(method, url, **kwargs):
+    """
+    Send a request through the session of the running event loop and read its body, with the default TIMEOUT if
+    none is given. Takes the same arguments as requests.request.
+
+    :param method: HTTP method e.g. GET
+    :type method: String
+
+    :param url: Address the request is sent to
+    :type url: String
+    """
+    response = await sendRequest(method, url, **kwargs)
+    async with response:
+        return AsyncResponse(response, await response.read())
+
+
+@asynccontextmanager
+async def stream(method, url, **kwargs):
+    """
+    Send a request and hold its response open once its headers have arrived, so the body can be read a chunk at a time
+    with iter_content. Takes the same arguments as requests.request.
+
+    :param method: HTTP method e.g. GET
+    :type method: String
+
+    :param url: Address the request is sent to
+    :type url: String
+    """
+    response = await sendRequest(method, url, **kwargs)
+    async with response:
+        yield AsyncResponse(response)
+
+
+async def get(url, params=None, **kwargs):
+    kwargs.setdefault('allow_redirects', True)
+    return await request('GET', url, params=params, **kwargs)
+
+
+async def post(url, data=None, json=None, **kwargs):
+    return await request('POST', url, data=data, json=json, **kwargs)
+
+
+async def patch(url, data=None, **kwargs):
+    return await request('PATCH', url, data=data, **kwargs)
+
+
+blockingExecutor = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix='bridgeBlocking')
+
+
+async def blocking(function, *args, **kwargs):
+    """
+    Run a blocking function on a worker thread with the context of the caller, returns its result.
+
+    :param function: Function that may wait on the network e.g. a directory lookup
+    :type function: Function
+    """
+    call = partial(copy_context().run, function, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(blockingExecutor, call)
+
+
+# the event loop running the bridge operations of the synchronous functions, started on first use
+bridgeLoop = None
+bridgeThread = None
+bridgeLock = Lock()
+
+
+def startBridgeLoop():
+    """
+    Returns the bridge event loop, starting it on a daemon thread on first use.
+    """
+    global bridgeLoop, bridgeThread
+    with bridgeLock:
+        if bridgeLoop is None:
+            bridgeLoop = asyncio.new_event_loop()
+            bridgeThread = Thread(target=bridgeLoop.run_forever, name='bridgeLoop', daemon=True)
+            bridgeThread.start()
+            register(stopBridgeLoop)
+        return bridgeLoop
+
+
+def stopBridgeLoop():
+    """
+    Close the session of the bridge event loop when the process exits, so its connections are closed cleanly.
+    """
+    try:
+        asyncio.run_coroutine_threadsafe(closeTransport(), bridgeLoop).result(timeout=5)
+    except:
+        pass
+
+
+def runSync(coroutine):
+    """
+    Run a bridge operation on the bridge event loop and wait for its result, for callers that are not running in an
+    event loop. The operation runs with the context of the caller.
+
+    :param coroutine: Bridge operation e.g. slackWebhookAsync(channel, content)
+    :type coroutine: Coroutine
+    """
+    loop = startBridgeLoop()
+    if bridgeThread.ident == get_ident():
+        coroutine.close()
+        raise RuntimeError("runSync cannot wait on the bridge loop from the bridge loop, await the operation instead")
+
+    result = Future()
+
+    def finished(task):
+        if task.cancelled():
+            result.cancel()
+        elif task.exception() is not None:
+            result.set_exception(task.exception())
+        else:
+            result.set_result(task.result())
+
+    # the task is created in the caller's context, so it sees the caller's context variables
+    def start():
+        loop.create_task(coroutine).add_done_callback(finished)
+
+    loop.call_soon_threadsafe(start, context=copy_context())
+    return result.result()
+
+
+def bridgedUser(user):
+    """
+    Returns the user behind Flask-Login's current_user, so it can be used by an operation running outside the request.
+
+    :param user: current_user, or the user itself
+    :type user: User
+    """
+    if isinstance(user, LocalProxy):
+        return user._get_current_object()
+    return user
@@ -0,0 +1,270 @@
+from json import dumps, loads
+from threading import Lock
+from time import monotonic
+from sqlalchemy.orm import object_session
+from integration.transport import post
+from integration.directories.zulipTopics import STREAM_NAME, topicIndex
+from integration.slackPagination import slackCursorPages
+from integration.utilities import parseZulipRC
+
+# emails subscribed to the Slack stream by each subscriptions request
+SUBSCRIBE_BATCH = 500
+
+# seconds before a bootstrap that failed is run again, so a Zulip or Slack outage is not retried on every event
+BOOTSTRAP_BACKOFF = 30
+
+# start of the error Zulip answers with when the bot is not subscribed to the stream it uses
+NOT_SUBSCRIBED = "Not subscribed to stream"
+
+
+def memberEmail(user):
+    """
+    Returns the email of a full member of the Slack workspace, or None for bots, guests, deactivated users and users
+    without an email, who are not members of the general channel.
+
+    :param user: Slack user object from users.list
+    :type user: Dictionary
+    """
+    if user.get('deleted') or user.get('is_bot') or user.get('is_restricted') or user.get('is_ultra_restricted') or user.get('id') == 'USLACKBOT':
+        return None
+    return user.get('profile', {}).get('email')
+
+
+class IntegrationBootstrap:
+    """
+    Makes sure the Slack stream exists in Zulip and the Zulip bot is subscribed to it, once for each bot and Slack workspace.
+    The result is recorded and the bootstrap only runs again once it has been reset, by a stream event or an error.
+    A bootstrap that failed is not run again until BOOTSTRAP_BACKOFF seconds have passed.
+    Progress holds the state of the bootstrap, the number of members subscribed so far and where users.list was left.
+    It is saved after every step, so a bootstrap interrupted by a restart carries on from the saved progress.
+
+    :param zulipRC: zuliprc of the Zulip bot
+    :type zulipRC: String
+
+    :param slackToken: Slack bot token of the workspace
+    :type slackToken: String
+
+    :param progress: Progress saved by an earlier bootstrap
+    :type progress: Dictionary
+    """
+    def __init__(self, zulipRC, slackToken, progress=None):
+        self.zulipRC = zulipRC
+        self.slackToken = slackToken
+        self.done = False
+        self.result = None
+        self.retryAfter = 0
+        self.progress = dict({'state': 'waiting', 'subscribed': 0, 'cursor': '', 'skip': 0}, **(progress or {}))
+        self.saveProgress = None
+        self.lock = Lock()
+
+    def record(self, **progress):
+        """
+        Update the progress and save it.
+
+        :param progress: Parts of the progress that changed
+        :type progress: Dictionary
+        """
+        self.progress.update(progress)
+        if self.saveProgress is not None:
+            self.saveProgress(dict(self.progress))
+
+    def subscribe(self, principals):
+        """
+        Subscribe emails to the Slack stream, creating it if it is missing. Returns True if Zulip subscribed them.
+
+        :param principals: Emails of the Zulip users to subscribe
+        :type principals: List of Strings
+        """
+        zulipAuth = parseZulipRC(self.zulipRC)
+        try:
+            subscribeRequest = post(zulipAuth['site'] + "/api/v1/users/me/subscriptions", auth=(zulipAuth['email'], zulipAuth['key']), data={'subscriptions': dumps([{"name": STREAM_NAME}]), 'principals': dumps(principals)})
+            return subscribeRequest.status_code == 200 and subscribeRequest.json().get('result') == 'success'
+        except:
+            return False
+
+    def subscribeMembers(self):
+        """
+        Subscribe the members of the Slack workspace to the Slack stream, reading users.list a page at a time and sending
+        their emails in batches. Progress is recorded after each batch, so an interrupted bootstrap carries on from the
+        page it stopped at. Returns False if Slack or Zulip did not answer.
+        """
+        pageCursor, skip = self.progress['cursor'], self.progress['skip']
+        pending = []
+
+        try:
+            for page, nextCursor in slackCursorPages("users.list", self.slackToken, 'members', cursor=pageCursor):
+                pageEmails = [email for email in map(memberEmail, page) if email is not None]
+                pending.extend(pageEmails[skip:])
+                skip = 0
+
+                # only full batches are sent until the last page, which sends whatever is left
+                while len(pending) >= SUBSCRIBE_BATCH or (pending and not nextCursor):
+                    batch, pending = pending[:SUBSCRIBE_BATCH], pending[SUBSCRIBE_BATCH:]
+                    if not self.subscribe(batch):
+                        return False
+                    subscribed = self.progress['subscribed'] + len(batch)
+
+                    # the emails left over all come from this page, so it is read again if the bootstrap is interrupted
+                    if pending:
+                        self.record(subscribed=subscribed, cursor=pageCursor, skip=len(pageEmails) - len(pending))
+                    else:
+                        self.record(subscribed=subscribed, cursor=nextCursor, skip=0)
+
+                pageCursor = nextCursor
+        except:
+            return False
+        return True
+
+    def run(self, saveProgress=None):
+        """
+        Verify the Slack stream and subscribe the Zulip bot to it. A missing stream is created and the members of the Slack
+        workspace subscribed to it. Returns the recorded result, which holds the stream ID and whether the bootstrap finished.
+
+        :param saveProgress: Called with the progress after every step
+        :type saveProgress: Function
+        """
+        # the bootstrap has already succeeded, or failed within the backoff, so nothing is asked of Zulip
+        if self.done or monotonic() < self.retryAfter:
+            return self.result
+
+        # only one thread bootstraps, the others wait and use its result
+        with self.lock:
+            if self.done or monotonic() < self.retryAfter:
+                return self.result
+
+            self.saveProgress = saveProgress
+            zulipAuth = parseZulipRC(self.zulipRC)
+            index = topicIndex(self.zulipRC)
+            index.expire()
+
+            # progress is only started again when Zulip answers that the stream does not exist, a stream created by an
+            # interrupted bootstrap, in this process or before a restart, keeps the progress of subscribing its members
+            streamID = index.streamID()
+            if streamID is None and index.missing:
+                self.record(state='members', subscribed=0, cursor='', skip=0)
+            elif streamID is not None and self.progress['state'] != 'members':
+                self.record(state='bot')
+
+            # subscribing is idempotent, so the bot is added whether or not it is already subscribed, unless Zulip could
+            # not say whether the stream exists and subscribing would create it without its members
+            subscribed = False
+            if streamID is not None or index.missing:
+                subscribed = self.subscribe([zulipAuth['email']])
+            if subscribed and self.progress['state'] == 'members':
+                subscribed = self.subscribeMembers()
+            if subscribed:
+                self.record(state='done')
+            self.saveProgress = None
+
+            # the stream may have just been created
+            index.expire()
+            self.result = {'stream_id': index.streamID(), 'subscribed': subscribed}
+            self.done = subscribed and self.result['stream_id'] is not None
+            self.retryAfter = 0 if self.done else monotonic() + BOOTSTRAP_BACKOFF
+            return self.result
+
+    def reset(self):
+        """
+        Run the bootstrap again on the next use, e.g. once the Slack stream has been deleted.
+        """
+        self.done = False
+
+    def applyEvent(self, event):
+        """
+        Reset the bootstrap on a Zulip event deleting the Slack stream or unsubscribing the bot from it.
+
+        :param event: A Zulip event
+        :type event: Dictionary
+        """
+        if event.get('type') == 'stream' and event.get('op') == 'delete':
+            if any(stream.get('name') == STREAM_NAME for stream in event.get('streams', [])):
+                self.reset()
+
+        elif event.get('type') == 'subscription' and event.get('op') == 'remove':
+            if any(stream.get('name') == STREAM_NAME for stream in event.get('subscriptions', [])):
+                self.reset()
+
+
+# the bootstrap of each Zulip bot and Slack workspace
+bootstraps = {}
+bootstrapsLock = Lock()
+
+
+def integrationBootstrap(zulipRC, slackToken, progress=None):
+    """
+    Returns the bootstrap of a Zulip bot and Slack workspace, creating it on first use.
+
+    :param zulipRC: zuliprc of the Zulip bot
+    :type zulipRC: String
+
+    :param slackToken: Slack bot token of the workspace
+    :type slackToken: String
+
+    :param progress: Progress saved by an earlier bootstrap, used if the bootstrap is created
+    :type progress: Dictionary
+    """
+    bootstrap = bootstraps.get((zulipRC, slackToken))
+    if bootstrap is None:
+        with bootstrapsLock:
+            bootstrap = bootstraps.setdefault((zulipRC, slackToken), IntegrationBootstrap(zulipRC, slackToken, progress))
+    return bootstrap
+
+
+def userBootstrap(user):
+    """
+    Returns the bootstrap of a user's Zulip bot and Slack workspace, carrying on from the progress saved on the user.
+
+    :param user: The user running the integration
+    :type user: User
+    """
+    try:
+        progress = loads(user.bootstrapProgress)
+    except:
+        progress = None
+    return integrationBootstrap(user.zulipBotRC, user.slackToken, progress)
+
+
+def saveUserProgress(user, progress):
+    """
+    Save the progress of a bootstrap on the user, so it survives a restart of the integration.
+
+    :param user: The user running the integration
+    :type user: User
+
+    :param progress: Progress of the bootstrap
+    :type progress: Dictionary
+    """
+    user.bootstrapProgress = dumps(progress)
+    try:
+        session = object_session(user)
+    except:
+        return
+    if session is not None:
+        session.commit()
+
+
+def runUserBootstrap(user):
+    """
+    Run the bootstrap of a user's Zulip bot and Slack workspace, saving its progress on the user.
+
+    :param user: The user running the integration
+    :type user: User
+    """
+    return userBootstrap(user).run(lambda progress: saveUserProgress(user, progress))
+
+
+def streamMissing(response):
+    """
+    Returns True if Zulip refused a message because the Slack stream does not exist or the bot is not subscribed to it.
+    Other errors, e.g. an invalid topic, are not fixed by running the bootstrap again.
+
+    :param response: Response of posting the message
+    :type response: Response
+    """
+    if response.status_code == 200:
+        return False
+    try:
+        error = response.json()
+    except:
+        return False
+    return error.get('code') == 'STREAM_DOES_NOT_EXIST' or error.get('msg', '').startswith(NOT_SUBSCRIBED)
@@ -0,0 +1,236 @@
+from threading import Lock, Thread
+from time import monotonic
+from integration.slackPagination import REFRESH_BACKOFF, slackItems
+
+# seconds before the channels are listed from Slack again, channel events keep the directory current in between
+CHANNEL_TTL = 600
+
+# seconds after listing the channels before a channel that cannot be found causes them to be listed again
+MISS_INTERVAL = 5
+
+
+class SlackChannelDirectory:
+    """
+    Channel names and IDs of a Slack workspace, listed once and then kept current by channel events.
+
+    :param token: Slack bot token of the workspace
+    :type token: String
+
+    :param ttl: Seconds before the channels are listed again
+    :type ttl: Integer
+    """
+    def __init__(self, token, ttl=CHANNEL_TTL):
+        self.token = token
+        self.ttl = ttl
+        self.nameToID = {}
+        self.idToName = {}
+        self.expires = 0
+        self.refreshed = None
+        self.backoffUntil = 0
+        self.resync = None
+        self.lock = Lock()
+        self.refreshLock = Lock()
+        self.creationLocks = {}
+
+    def refresh(self):
+        """
+        List the channels of the workspace and rebuild both indexes, returns False if Slack did not return the channels.
+        """
+        # only the name and ID of each channel are kept as the pages are read
+        try:
+            channels = slackItems("conversations.list", self.token, 'channels', {"exclude_archived": True})
+            idToName = {channel['id']: channel['name'] for channel in channels}
+        except:
+            # the channels already listed are kept whether Slack refused the listing or could not be reached, and the
+            # listing is not tried again until the backoff has passed
+            self.backoffUntil = monotonic() + REFRESH_BACKOFF
+            self.expires = max(self.expires, self.backoffUntil)
+            return False
+
+        with self.lock:
+            self.idToName = idToName
+            self.nameToID = {name: channelID for channelID, name in idToName.items()}
+            self.refreshed = monotonic()
+            self.expires = self.refreshed + self.ttl
+        return True
+
+    def ensureFresh(self):
+        """
+        List the channels if they have never been listed, or list them again in the background if the directory has expired.
+        Only the first listing is waited for, after that lookups use the expired directory until the new listing is done.
+        """
+        if monotonic() < self.expires:
+            return
+
+        if self.refreshed is None:
+            # only one thread lists the channels, the others wait and use its result
+            with self.refreshLock:
+                if self.refreshed is None and monotonic() >= self.expires:
+                    self.refresh()
+            return
+
+        # only one thread lists the channels again at a time
+        with self.lock:
+            if self.resync is not None and self.resync.is_alive():
+                return
+            self.resync = Thread(target=self.backgroundRefresh, daemon=True)
+            self.resync.start()
+
+    def backgroundRefresh(self):
+        """
+        List the channels again unless another listing finished while this one was starting.
+        """
+        with self.refreshLock:
+            if monotonic() >= self.expires:
+                self.refresh()
+
+    def refreshOnMiss(self):
+        """
+        List the channels again after a lookup missed, unless they were listed within the last MISS_INTERVAL seconds, the
+        last listing failed within REFRESH_BACKOFF seconds or they are being listed in the background.
+        """
+        # a lookup does not wait for the channels being listed again in the background
+        if self.resync is not None and self.resync.is_alive():
+            return False
+
+        with self.refreshLock:
+            if monotonic() < self.backoffUntil:
+                return False
+            if self.refreshed is None or monotonic() - self.refreshed > MISS_INTERVAL:
+                return self.refresh()
+        return False
+
+    def channelID(self, channelName):
+        """
+        Returns the ID of a channel, or None if there is no channel with that name.
+
+        :param channelName: Name of the channel
+        :type channelName: String
+        """
+        self.ensureFresh()
+        channelID = self.nameToID.get(channelName)
+
+        if channelID is None and self.refreshOnMiss():
+            channelID = self.nameToID.get(channelName)
+        return channelID
+
+    def channelName(self, channelID):
+        """
+        Returns the name of a channel, or None if there is no channel with that ID.
+
+        :param channelID: ID of the channel
+        :type channelID: String
+        """
+        self.ensureFresh()
+        channelName = self.idToName.get(channelID)
+
+        if channelName is None and self.refreshOnMiss():
+            channelName = self.idToName.get(channelID)
+        return channelName
+
+    def isKnown(self, channel):
+        """
+        Returns True if the directory holds a channel with the name or ID, a miss does not list the channels again.
+
+        :param channel: Name or ID of the channel
+        :type channel: String
+        """
+        self.ensureFresh()
+        return channel in self.nameToID or channel in self.idToName
+
+    def creationLock(self, channelName):
+        """
+        Returns the lock held while a channel is created, so concurrent messages to a new channel create it once.
+
+        :param channelName: Name of the channel
+        :type channelName: String
+        """
+        with self.lock:
+            return self.creationLocks.setdefault(channelName, Lock())
+
+    def created(self, channelName):
+        """
+        Forget the creation lock of a channel once it has been created or found to exist.
+
+        :param channelName: Name of the channel
+        :type channelName: String
+        """
+        with self.lock:
+            self.creationLocks.pop(channelName, None)
+
+    def channelNames(self):
+        """
+        Returns a copy of the channel ID to name index.
+        """
+        self.ensureFresh()
+        with self.lock:
+            return dict(self.idToName)
+
+    def addChannel(self, channelID, channelName):
+        """
+        Add a channel to the directory, or rename it if the ID is already known.
+
+        :param channelID: ID of the channel
+        :type channelID: String
+
+        :param channelName: Name of the channel
+        :type channelName: String
+        """
+        with self.lock:
+            oldName = self.idToName.get(channelID)
+            if oldName is not None and self.nameToID.get(oldName) == channelID:
+                del self.nameToID[oldName]
+
+            self.idToName[channelID] = channelName
+            self.nameToID[channelName] = channelID
+
+    def removeChannel(self, channelID):
+        """
+        Remove a channel from the directory, returns the name it had or None if it was not known.
+
+        :param channelID: ID of the channel
+        :type channelID: String
+        """
+        with self.lock:
+            channelName = self.idToName.pop(channelID, None)
+            if channelName is not None and self.nameToID.get(channelName) == channelID:
+                del self.nameToID[channelName]
+            return channelName
+
+    def applyEvent(self, events):
+        """
+        Update the directory from a Slack event, events that do not change the channels are ignored.
+
+        :param events: JSON message containing information on the Slack event
+        :type events: JSON payload
+        """
+        eventType = events.get('type')
+
+        if eventType in ['channel_created', 'channel_rename']:
+            self.addChannel(events['channel']['id'], events['channel']['name'])
+        elif eventType in ['channel_deleted', 'channel_archive']:
+            self.removeChannel(events['channel'])
+        elif eventType == 'channel_unarchive':
+            # the event does not hold the name of the channel so the channels are listed again on the next lookup
+            self.expires = 0
+        elif eventType == 'message' and events.get('subtype') == 'channel_name' and 'channel' in events:
+            self.addChannel(events['channel'], events['name'])
+
+
+# the channel directory of each Slack bot token
+channelDirectories = {}
+directoriesLock = Lock()
+
+
+def channelDirectory(token):
+    """
+    Returns the channel directory of the workspace the token belongs to, creating it on first use.
+
+    :param token: Slack bot token of the workspace
+    :type token: String
+    """
+    directory = channelDirectories.get(token)
+    if directory is None:
+        with directoriesLock:
+            directory = channelDirectories.setdefault(token, SlackChannelDirectory(token))
+    return directory
@@ -0,0 +1,97 @@
+from threading import Lock
+from integration.transport import get, post
+from integration.utilities import slackHeader, slackURL
+
+
+class BotIdentity:
+    """
+    The IDs Slack uses for the integration bot, found once for each bot token.
+
+    :param userID: User ID of the bot e.g. U012AB3CD
+    :type userID: String
+
+    :param botID: Bot ID of the bot e.g. B012AB3CD
+    :type botID: String
+
+    :param appID: ID of the Slack app the bot belongs to e.g. A012AB3CD
+    :type appID: String
+    """
+    def __init__(self, userID=None, botID=None, appID=None):
+        self.userID = userID
+        self.botID = botID
+        self.appID = appID
+
+    def sentEvent(self, events):
+        """
+        Returns True if the event was caused by the bot, checking the bot and app IDs Slack adds to the bot's messages
+        before the user ID of the event.
+
+        :param events: JSON message containing information on the Slack event
+        :type events: JSON payload
+        """
+        if self.botID is not None and events.get('bot_id') == self.botID:
+            return True
+        if self.appID is not None and events.get('app_id') == self.appID:
+            return True
+        return self.userID is not None and events.get('user') == self.userID
+
+
+# the identity of the bot each Slack bot token belongs to
+botIdentities = {}
+identitiesLock = Lock()
+
+
+def findBotIdentity(token):
+    """
+    Ask Slack for the IDs of the bot a token belongs to, returns None if the token is not valid.
+
+    :param token: Slack bot token
+    :type token: String
+    """
+    try:
+        authTestRequest = post(slackURL("auth.test"), headers=slackHeader(token)).json()
+        if not authTestRequest.get('ok'):
+            return None
+
+        identity = BotIdentity(authTestRequest.get('user_id'), authTestRequest.get('bot_id'))
+
+        # the app ID is only used to recognise the bot's messages, so the identity is still used without it
+        if identity.botID is not None:
+            botInfoRequest = get(slackURL("bots.info", {'bot': identity.botID}), headers=slackHeader(token)).json()
+            if botInfoRequest.get('ok'):
+                identity.appID = botInfoRequest['bot'].get('app_id')
+
+        return identity
+    except:
+        return None
+
+
+def botIdentity(token):
+    """
+    Returns the identity of the bot a token belongs to, Slack is only asked the first time for each token.
+    An empty identity is returned, and not cached, if Slack could not be asked.
+
+    :param token: Slack bot token
+    :type token: String
+    """
+    identity = botIdentities.get(token)
+    if identity is not None:
+        return identity
+
+    identity = findBotIdentity(token)
+    if identity is None:
+        return BotIdentity()
+
+    with identitiesLock:
+        return botIdentities.setdefault(token, identity)
+
+
+def invalidateBotIdentity(token):
+    """
+    Remove the cached identity of a bot token, called when a user uploads a new Slack bot token.
+
+    :param token: Slack bot token
+    :type token: String
+    """
+    with identitiesLock:
+        botIdentities.pop(token, None)
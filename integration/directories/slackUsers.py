@@ -0,0 +1,162 @@
+from threading import Lock, Thread
+from time import monotonic
+from integration.transport import get
+from integration.slackPagination import REFRESH_BACKOFF, slackItems
+from integration.utilities import slackHeader, slackURL
+
+# seconds before the users are listed from Slack again, user events keep the directory current in between
+USER_TTL = 3600
+
+
+def userSummary(user):
+    """
+    Returns the parts of a Slack user object used by the integration, so the directory stays small in large workspaces.
+
+    :param user: Slack user object from users.list, users.info or a user event
+    :type user: Dictionary
+    """
+    profile = user.get('profile', {})
+    summary = {'id': user['id'], 'name': user.get('name', ''), 'real_name': user.get('real_name', profile.get('real_name', '')), 'profile': {}}
+    if 'email' in profile:
+        summary['profile']['email'] = profile['email']
+    return summary
+
+
+class SlackUserDirectory:
+    """
+    Names and emails of the users of a Slack workspace, listed a page at a time and kept current by user events.
+
+    :param token: Slack bot token of the workspace
+    :type token: String
+
+    :param ttl: Seconds before the users are listed again
+    :type ttl: Integer
+    """
+    def __init__(self, token, ttl=USER_TTL):
+        self.token = token
+        self.ttl = ttl
+        self.users = {}
+        self.expires = 0
+        self.refreshed = None
+        self.resync = None
+        self.lock = Lock()
+        self.refreshLock = Lock()
+
+    def refresh(self):
+        """
+        List the users of the workspace, returns False if Slack did not return the users.
+        """
+        try:
+            users = {user['id']: userSummary(user) for user in slackItems("users.list", self.token, 'members')}
+        except:
+            # the users already listed are kept whether Slack refused the listing or could not be reached, and the
+            # listing is not tried again until the backoff has passed
+            self.expires = max(self.expires, monotonic() + REFRESH_BACKOFF)
+            return False
+
+        with self.lock:
+            self.users = users
+            self.refreshed = monotonic()
+            self.expires = self.refreshed + self.ttl
+        return True
+
+    def ensureFresh(self):
+        """
+        List the users if they have never been listed, or list them again in the background if the directory has expired.
+        Only the first listing is waited for, after that lookups use the expired directory until the new listing is done.
+        """
+        if monotonic() < self.expires:
+            return
+
+        if self.refreshed is None:
+            # only one thread lists the users, the others wait and use its result
+            with self.refreshLock:
+                if self.refreshed is None and monotonic() >= self.expires:
+                    self.refresh()
+            return
+
+        # only one thread lists the users again at a time
+        with self.lock:
+            if self.resync is not None and self.resync.is_alive():
+                return
+            self.resync = Thread(target=self.backgroundRefresh, daemon=True)
+            self.resync.start()
+
+    def backgroundRefresh(self):
+        """
+        List the users again unless another listing finished while this one was starting.
+        """
+        with self.refreshLock:
+            if monotonic() >= self.expires:
+                self.refresh()
+
+    def user(self, userID):
+        """
+        Returns the user with the ID, holding their id, name, real_name and profile email, or None if Slack does not know them.
+        A user who joined since the users were listed is looked up on their own.
+
+        :param userID: ID of the Slack user
+        :type userID: String
+        """
+        self.ensureFresh()
+        user = self.users.get(userID)
+        if user is not None:
+            return user
+
+        userInfoRequest = get(slackURL("users.info", {'user': userID}), headers=slackHeader(self.token)).json()
+        if userInfoRequest.get('ok') and 'user' in userInfoRequest:
+            return self.addUser(userInfoRequest['user'])
+        return None
+
+    def email(self, userID):
+        """
+        Returns the email of a user, or None if it is not known.
+
+        :param userID: ID of the Slack user
+        :type userID: String
+        """
+        user = self.user(userID)
+        if user is not None:
+            return user['profile'].get('email')
+        return None
+
+    def addUser(self, user):
+        """
+        Add or update a user in the directory, returns the stored summary of the user.
+
+        :param user: Slack user object
+        :type user: Dictionary
+        """
+        summary = userSummary(user)
+        with self.lock:
+            self.users[summary['id']] = summary
+        return summary
+
+    def applyEvent(self, events):
+        """
+        Update the directory from a Slack event, events that do not change the users are ignored.
+
+        :param events: JSON message containing information on the Slack event
+        :type events: JSON payload
+        """
+        if events.get('type') in ['user_change', 'team_join'] and isinstance(events.get('user'), dict):
+            self.addUser(events['user'])
+
+
+# the user directory of each Slack bot token
+userDirectories = {}
+directoriesLock = Lock()
+
+
+def userDirectory(token):
+    """
+    Returns the user directory of the workspace the token belongs to, creating it on first use.
+
+    :param token: Slack bot token of the workspace
+    :type token: String
+    """
+    directory = userDirectories.get(token)
+    if directory is None:
+        with directoriesLock:
+            directory = userDirectories.setdefault(token, SlackUserDirectory(token))
+    return directory
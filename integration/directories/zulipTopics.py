@@ -0,0 +1,273 @@
+from json import dumps
+from threading import Lock
+from time import monotonic
+from integration import asyncTransport
+from integration.transport import get
+from integration.utilities import parseZulipRC
+
+# name of the Zulip stream Slack channels are bridged to
+STREAM_NAME = 'Slack'
+
+# seconds before the topics are listed from Zulip again, message events keep the index current in between
+TOPIC_TTL = 600
+
+
+class ZulipTopicIndex:
+    """
+    ID of the Slack stream of a Zulip realm and the ID of the newest message in each of its topics, listed once and then
+    kept current by message, update_message and delete_message events.
+
+    :param zulipRC: zuliprc of the Zulip bot
+    :type zulipRC: String
+
+    :param ttl: Seconds before the topics are listed again
+    :type ttl: Integer
+    """
+    def __init__(self, zulipRC, ttl=TOPIC_TTL):
+        zulipAuth = parseZulipRC(zulipRC) or {'email': '', 'key': '', 'site': ''}
+        self.site = zulipAuth['site']
+        self.auth = (zulipAuth['email'], zulipAuth['key'])
+        self.ttl = ttl
+        self.slackStreamID = None
+        self.missing = False
+        self.topics = {}
+        self.expires = 0
+        self.lock = Lock()
+        self.refreshLock = Lock()
+
+    def refresh(self):
+        """
+        Look up the Slack stream and list its topics, returns False if the stream does not exist or Zulip did not answer.
+        Whether Zulip answered that the stream does not exist is kept in missing.
+        """
+        try:
+            streamIDResponse = get(self.site + "/api/v1/get_stream_id", auth=self.auth, params={'stream': STREAM_NAME})
+            streamIDRequest = streamIDResponse.json()
+            streamID = streamIDRequest.get('stream_id')
+            topics = {}
+            if streamID is not None:
+                topicsRequest = get(self.site + f"/api/v1/users/me/{streamID}/topics", auth=self.auth).json()
+                topics = {topic['name']: topic['max_id'] for topic in topicsRequest['topics']}
+        except:
+            # Zulip did not answer, so it is not known whether the stream exists
+            self.missing = False
+            return False
+
+        with self.lock:
+            self.slackStreamID = streamID
+            # Zulip refuses to look up a stream that does not exist with a 400, other errors do not say the stream is missing
+            self.missing = streamID is None and streamIDResponse.status_code == 400 and streamIDRequest.get('result') == 'error'
+            self.topics = topics
+            # a missing stream is looked up again on the next use, as the integration creates it
+            self.expires = monotonic() + self.ttl if streamID is not None else 0
+        return streamID is not None
+
+    def ensureFresh(self):
+        """
+        List the topics if they have never been listed or the index has expired.
+        """
+        if monotonic() < self.expires:
+            return
+
+        # only one thread lists the topics, the others wait and use its result
+        with self.refreshLock:
+            if monotonic() >= self.expires:
+                self.refresh()
+
+    def expire(self):
+        """
+        List the topics again on the next use, e.g. once the Slack stream has been created.
+        """
+        self.expires = 0
+
+    def streamID(self):
+        """
+        Returns the ID of the Slack stream, or None if it does not exist.
+        """
+        self.ensureFresh()
+        return self.slackStreamID
+
+    def hasTopic(self, topicName):
+        """
+        Returns True if the Slack stream has a topic with the name.
+
+        :param topicName: Name of the topic
+        :type topicName: String
+        """
+        self.ensureFresh()
+        return topicName in self.topics
+
+    def topicNames(self):
+        """
+        Returns the names of the topics in the Slack stream.
+        """
+        self.ensureFresh()
+        with self.lock:
+            return list(self.topics)
+
+    def latestMessageID(self, topicName):
+        """
+        Returns the ID of the newest message in a topic, or None if the topic is not known.
+
+        :param topicName: Name of the topic
+        :type topicName: String
+        """
+        self.ensureFresh()
+        return self.topics.get(topicName)
+
+    def addMessage(self, topicName, messageID):
+        """
+        Record a message in a topic, adding the topic if it is new.
+
+        :param topicName: Name of the topic
+        :type topicName: String
+
+        :param messageID: ID of the message
+        :type messageID: Integer
+        """
+        with self.lock:
+            self.topics[topicName] = max(self.topics.get(topicName, messageID), messageID)
+
+    def removeTopic(self, topicName):
+        """
+        Remove a topic from the index, returns the ID of its newest message or None if it was not known.
+
+        :param topicName: Name of the topic
+        :type topicName: String
+        """
+        with self.lock:
+            return self.topics.pop(topicName, None)
+
+    def renameTopic(self, oldName, newName, messageID=None):
+        """
+        Move the messages of a topic to a new name.
+
+        :param oldName: Name the topic had
+        :type oldName: String
+
+        :param newName: Name the topic has now
+        :type newName: String
+
+        :param messageID: Newest message moved, used if the old topic was not known
+        :type messageID: Integer
+        """
+        with self.lock:
+            moved = self.topics.pop(oldName, messageID)
+            if moved is not None:
+                self.topics[newName] = max(self.topics.get(newName, moved), moved)
+
+    def newestMessageID(self, topicName):
+        """
+        Ask Zulip for the ID of the newest message in a topic, returns None if the topic has no messages.
+        Raises an exception if Zulip did not answer.
+
+        :param topicName: Name of the topic
+        :type topicName: String
+        """
+        messages = get(self.site + "/api/v1/messages", auth=self.auth, params=newestMessageParams(topicName)).json()['messages']
+        return messages[-1]['id'] if messages else None
+
+    async def newestMessageIDAsync(self, topicName):
+        """
+        Ask Zulip for the ID of the newest message in a topic from asyncio, returns None if the topic has no messages.
+        Raises an exception if Zulip did not answer.
+
+        :param topicName: Name of the topic
+        :type topicName: String
+        """
+        messages = (await asyncTransport.get(self.site + "/api/v1/messages", auth=self.auth, params=newestMessageParams(topicName))).json()['messages']
+        return messages[-1]['id'] if messages else None
+
+    def applyEvent(self, event):
+        """
+        Update the index from a Zulip event, events outside the Slack stream are ignored.
+
+        :param event: A Zulip event
+        :type event: Dictionary
+        """
+        eventType = event.get('type')
+        streamID = self.streamID()
+
+        if eventType == 'message':
+            message = event.get('message', {})
+            if message.get('type') == 'stream' and (message.get('stream_id') == streamID or message.get('display_recipient') == STREAM_NAME):
+                self.addMessage(message['subject'], message['id'])
+
+        elif eventType == 'update_message' and 'orig_subject' in event and 'subject' in event:
+            if event.get('stream_id') not in [None, streamID]:
+                return
+            movedIDs = [messageID for messageID in event.get('message_ids') or [event.get('message_id')] if messageID is not None]
+            newest = max(movedIDs) if movedIDs else None
+
+            if event.get('propagate_mode') == 'change_all':
+                self.renameTopic(event['orig_subject'], event['subject'], newest)
+            else:
+                # only some messages moved, so Zulip is asked what is left in the old topic
+                if newest is not None:
+                    self.addMessage(event['subject'], newest)
+                self.checkTopic(event['orig_subject'])
+
+        elif eventType == 'delete_message' and event.get('message_type', 'stream') == 'stream':
+            if event.get('stream_id') not in [None, streamID] or 'topic' not in event:
+                return
+            deletedIDs = event.get('message_ids') or [event.get('message_id')]
+
+            # the topic keeps existing unless its newest message was deleted, only then is Zulip asked what is left
+            if self.topics.get(event['topic']) in deletedIDs:
+                self.checkTopic(event['topic'])
+
+        elif eventType == 'stream' and event.get('op') in ['create', 'delete']:
+            self.expire()
+
+    def checkTopic(self, topicName):
+        """
+        Ask Zulip for the newest message left in a topic, removing the topic if it has none.
+        If Zulip does not answer the topics are listed again on the next use.
+
+        :param topicName: Name of the topic
+        :type topicName: String
+        """
+        try:
+            newest = self.newestMessageID(topicName)
+        except:
+            self.expire()
+            return
+
+        with self.lock:
+            if newest is None:
+                self.topics.pop(topicName, None)
+            else:
+                self.topics[topicName] = newest
+
+
+# the topic index of each Zulip bot
+topicIndexes = {}
+indexesLock = Lock()
+
+
+def newestMessageParams(topicName):
+    """
+    Returns the parameters asking Zulip for the newest message in a topic of the Slack stream.
+
+    :param topicName: Name of the topic
+    :type topicName: String
+    """
+    return {'anchor': 'newest',
+            'num_before': 1,
+            'num_after': 0,
+            'narrow': dumps([{"operator": "stream", "operand": STREAM_NAME}, {"operator": "topic", "operand": topicName}])
+            }
+
+
+def topicIndex(zulipRC):
+    """
+    Returns the topic index of the Zulip realm the bot belongs to, creating it on first use.
+
+    :param zulipRC: zuliprc of the Zulip bot
+    :type zulipRC: String
+    """
+    index = topicIndexes.get(zulipRC)
+    if index is None:
+        with indexesLock:
+            index = topicIndexes.setdefault(zulipRC, ZulipTopicIndex(zulipRC))
+    return index
@@ -1,12 +1,13 @@
-from json import dumps
 from flask import session
 from flask_login import current_user
-from requests import get, post
+from integration.bootstrap import runUserBootstrap
+from integration.directories.slackChannels import channelDirectory
+from integration.directories.slackIdentity import botIdentity
+from integration.directories.slackUsers import userDirectory
+from integration.directories.zulipTopics import topicIndex
 from integration.markdown.toZulip import zulipMarkdown
 from integration.webhooks.slackWebHook import renameChannel, channelNameToID, slackWebhook
-from integration.webhooks.zulipWebHook import zulipWebhook, deleteTopic, renameTopic, getZulipTopicList
-from urllib import parse
-from integration.utilities import slackHeader, parseZulipRC
+from integration.webhooks.zulipWebHook import zulipWebhook, deleteTopic, renameTopic
 
 
 def channelIDToName(channelID):
@@ -16,10 +17,7 @@ def channelIDToName(channelID):
     :param channelID: ID of the channel you would like the name for
     :type channelID: String
     """
-    # channel list request
-    channelListRequest = get("https://slack.com/api/conversations.list?" + parse.urlencode({"exclude_archived": True, "limit": 1000}),headers=slackHeader(current_user.slackToken))
-    channelListRequest = channelListRequest.json()
-    return next((current['name'] for current in channelListRequest['channels'] if current['id'] == channelID), None)
+    return channelDirectory(current_user.slackToken).channelName(channelID)
 
 
 def handleFiles(files):
@@ -34,31 +32,15 @@ def handleFiles(files):
 
 def updateHistory(events):
     """
-    Maintains a reference of the Slack channels prior to the current event, used for determining the channel that was deleted
-    
+    Keeps the channel directory current from the event, a deleted channel is removed when the event is handled so its
+    name can still be found.
+
     :param events: JSON message containing event information
     :type events: JSON payload
     """
     if events['type'] != 'channel_deleted':
-        # get all the channels in Slack
-        channelListRequest = get("https://slack.com/api/users.conversations?" + parse.urlencode({"exclude_archived": True, "limit": 1000}),  headers=slackHeader(current_user.slackToken)).json()
-        channelDict = {}
-        for channel in channelListRequest['channels']:
-            channelDict[channel['id']] = channel['name']
-
-        session['slackChannels'] = channelDict
-
-
-def checkSlackStreamExists():
-    """
-    Ensure the Slack Stream is Zulip exists before processing events
-    """
-    zulipAuth = parseZulipRC(current_user.zulipBotRC)
-    streamIDRequest = get(zulipAuth['site'] + "/api/v1/get_stream_id?" + parse.urlencode({'stream': 'Slack'}), auth=(zulipAuth['email'], zulipAuth['key'])).json()
-    if 'stream_id' in streamIDRequest:
-        return True
-    else:
-        return False
+        # keep the channel directory current from the event rather than listing every channel again
+        channelDirectory(current_user.slackToken).applyEvent(events)
 
 
 def slackEvents(events):
@@ -68,34 +50,20 @@ def slackEvents(events):
     :param events: JSON message containing information on the Slack event
     :type events: JSON payload
     """
-    slackAuth = slackHeader(current_user.slackToken)
-    zulipAuth = parseZulipRC(current_user.zulipBotRC)
     updateHistory(events)
+    userDirectory(current_user.slackToken).applyEvent(events)
 
-    # if the Slack stream does not exist
-    if checkSlackStreamExists() is False:
-        # create the Slack stream
-        userList = []
-        membersRequest = get(f"https://slack.com/api/conversations.members?{parse.urlencode({'channel': channelNameToID('general')})}", headers=slackAuth).json()
-
-        if 'ok' in membersRequest and 'members' in membersRequest:
-            members = membersRequest['members']
-            for memberID in members:
-                userRequest = get(f"https://slack.com/api/users.profile.get?{parse.urlencode({'user': memberID})}", headers=slackAuth).json()
-                if 'ok' in userRequest and 'profile' in userRequest and 'email' in userRequest['profile']:  userList.append(userRequest['profile']['email'])
-        
-        # add the IntegrationBot to Zulip Slack Stream
-        userList.append(zulipAuth['email'])
-        post(zulipAuth['site'] + "/api/v1/users/me/subscriptions", auth=(zulipAuth['email'], zulipAuth['key']), data={'subscriptions': '[{"name": "Slack"}]', 'principals': dumps(userList)})
-
-    if 'user' in events:
-        # check if the user who initiated the event is the bot
-        checkBotRequest = get("https://slack.com/api/auth.test", headers=slackAuth).json()
-        # if the user is the integration bot then stop processing
-        if 'subtype' in events and events['subtype'] == 'channel_join':
-            pass
-        elif events['user'] == checkBotRequest['user_id']:
-            return None
+    # the Slack stream and the bot's subscription are only set up again if an error or Zulip event reset the bootstrap
+    runUserBootstrap(current_user)
+
+    # the identity of the integration bot is only looked up once for each token
+    identity = botIdentity(current_user.slackToken)
+
+    # if the event was sent by the integration bot then stop processing
+    if 'subtype' in events and events['subtype'] == 'channel_join':
+        pass
+    elif identity.sentEvent(events):
+        return None
 
 
     # if the Slack event is a message
@@ -104,14 +72,12 @@ def slackEvents(events):
         if 'subtype' in events:
             if events['subtype'] == 'channel_join':
                 # check if the user who initiated the event is the bot
-                checkBotRequest = get("https://slack.com/api/auth.test", headers=slackAuth).json()
-
-                if events['user'] == checkBotRequest['user_id']:
+                if events['user'] == identity.userID:
                     # if slack created a channel then send the message to Zulip, ignore otherwise
                     slackGetName = channelIDToName(events['channel'])
 
                     # if the topic does not already exist in Zulip then create it
-                    if slackGetName not in getZulipTopicList():
+                    if not topicIndex(current_user.zulipBotRC).hasTopic(slackGetName):
                         return zulipWebhook(slackGetName, "Slack created this channel")
                 else:
                     return None
@@ -137,22 +103,14 @@ def slackEvents(events):
 
         # get channel name from id
         channelID = events['channel']
-        channelName = "general"
-
-        channelListRequest = get("https://slack.com/api/conversations.list?" + parse.urlencode({"exclude_archived" : True, "limit" : 1000}), headers=slackAuth)
-        channelListRequest = channelListRequest.json()
-
-        # if the request was successful
-        if 'ok' in channelListRequest and channelListRequest['ok']:
-            channelName = next((current['name'] for current in channelListRequest['channels'] if current['id'] == channelID), "general")
+        channelName = channelIDToName(channelID) or "general"
 
         # need to get username of the sender rather than just the user_id
-        userNameRequest = get(f"https://slack.com/api/users.info?{parse.urlencode({'user': events['user']})}", headers=slackAuth)
-        userNameRequest = userNameRequest.json()
+        sender = userDirectory(current_user.slackToken).user(events['user']) if 'user' in events else None
 
-        if 'ok' in userNameRequest and userNameRequest['ok'] and 'user' in events:
+        if sender is not None:
             # preparation for the sending of the message to Zulip
-            customMessage = slackCustomPrefix(userNameRequest['user'], channelName)
+            customMessage = slackCustomPrefix(sender, channelName)
             return zulipWebhook(channelName, f"{customMessage} {slackMessage[0]}", files=slackMessage[1])
 
 
@@ -162,12 +120,13 @@ def slackEvents(events):
 
     # if a channel deleted event is detected
     elif events['type'] == 'channel_deleted':
-        # delete the channel using the old channel list as reference
-        if session.get('slackChannels') is not None:
-            deleteTopic(session['slackChannels'][events['channel']])
-            session['slackChannels'].pop(events['channel'], None)
+        # the directory returns the name the deleted channel had
+        channelName = channelDirectory(current_user.slackToken).removeChannel(events['channel'])
+
+        if channelName is not None:
+            deleteTopic(channelName)
             return "Slack deleted a channel"
-        # if the integration was started and the slackChannel session does not exist
+        # if the deleted channel was never seen by the integration
         else:
             slackWebhook("general", "Could not tell what channel was deleted")
 
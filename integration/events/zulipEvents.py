@@ -1,48 +1,101 @@
 import re
-from json import dumps
+import logging
 
 from flask import session
-from requests import get, post
+from integration.transport import post
 from flask_login import current_user
+from integration.bootstrap import runUserBootstrap, userBootstrap
+from integration.directories.zulipTopics import topicIndex
 from integration.utilities import parseZulipRC
 from integration.markdown.toSlack import slackMarkdown
 from integration.webhooks.slackWebHook import slackWebhook, renameChannel, deleteChannel
 from integration.webhooks.zulipWebHook import getZulipTopicList, getStreamID, renameTopic
 
 
+# failed events are logged so the rest of the poll can still be handled
+logger = logging.getLogger(__name__)
+
+
 def zulipEvents(events):
     """
-    All Zulip events are sent here, this function handles multiple events.
+    All Zulip events are sent here, this function handles every event of a poll in the order they were received.
+    Returns the result of the last event.
 
-    :param events: JSON message containing information on the Zulip event
+    :param events: JSON message containing information on the Zulip events
     :type events: JSON payload
     """
+    results, handledID = handleZulipEvents(events)
+    return results[-1] if results else None
+
+
+def handleZulipEvents(events):
+    """
+    Handle every event of a poll in the order they were received, an event that fails is logged and does not stop the
+    events after it. Returns the result of each event, None for an event that failed, and the highest ID of the events
+    that were handled, or -1 if none were.
+
+    :param events: JSON message containing information on the Zulip events
+    :type events: JSON payload
+    """
+    # the Slack stream and the bot's subscription are only set up again if an earlier event or error reset the bootstrap
+    runUserBootstrap(current_user)
+
+    results = []
+    handled = []
+    for event in events:
+        try:
+            results.append(zulipEvent(event))
+            handled.append(event)
+        except:
+            logger.exception("Zulip event %s could not be handled", event.get('id'))
+            results.append(None)
+    return results, lastEventID(handled)
+
+
+def lastEventID(events):
+    """
+    Returns the highest ID of the given Zulip events, or -1 if none have an ID.
+
+    :param events: JSON message containing information on the Zulip events
+    :type events: JSON payload
+    """
+    return max([event['id'] for event in events if 'id' in event], default=-1)
+
+
+def zulipEvent(event):
+    """
+    Handle a single Zulip event.
+
+    :param event: JSON message containing information on the Zulip event
+    :type event: JSON payload
+    """
     zulipAuth = parseZulipRC(current_user.zulipBotRC)
 
-    # add the IntegrationBot to Zulip
-    post(zulipAuth['site'] + "/api/v1/users/me/subscriptions", auth=(zulipAuth['email'], zulipAuth['key']), data={'subscriptions': '[{"name": "Slack"}]', 'principals': dumps([zulipAuth['email']])})
+    # keep the topic index current from the event rather than listing every topic again
+    topicIndex(current_user.zulipBotRC).applyEvent(event)
+    userBootstrap(current_user).applyEvent(event)
 
     # if the event is a message
-    if events[0]['type'] == 'message':
+    if event['type'] == 'message':
         # if the event wasn't sent by the integration bot
-        if events[0]['message']['sender_email'] != zulipAuth['email']:
+        if event['message']['sender_email'] != zulipAuth['email']:
             # convert message to slack markdown before being sent
-            if slackNamingValidation(events[0]['message']['subject']) and len(events[0]['message']['subject']) <= 80:
-                zulipMessage = slackMarkdown(events[0]['message']['content'])
-                customMessage = zulipCustomPrefix(events[0])
-                return slackWebhook(events[0]['message']['subject'], f"{customMessage} {zulipMessage[0]}", files=zulipMessage[1])
+            if slackNamingValidation(event['message']['subject']) and len(event['message']['subject']) <= 80:
+                zulipMessage = slackMarkdown(event['message']['content'])
+                customMessage = zulipCustomPrefix(event)
+                return slackWebhook(event['message']['subject'], f"{customMessage} {zulipMessage[0]}", files=zulipMessage[1])
             else: # the Zulip topic is named incorrectly
-                formatTopicName(events)
+                formatTopicName(event)
 
             return "Not a valid Slack topic"
 
     # the event is topic renaming
-    elif events[0]['type'] == 'update_message' and 'orig_subject' in events[0] and 'subject' in events[0]:
-        if slackNamingValidation(events[0]['subject']) and len(events[0]['subject']) <= 80:
-            return renameChannel(events[0]['orig_subject'], events[0]['subject'])
+    elif event['type'] == 'update_message' and 'orig_subject' in event and 'subject' in event:
+        if slackNamingValidation(event['subject']) and len(event['subject']) <= 80:
+            return renameChannel(event['orig_subject'], event['subject'])
         else:
             # format to Slack valid form
-            channelName = events[0]['subject'].lower().replace(' ', '')
+            channelName = event['subject'].lower().replace(' ', '')
             if len(channelName) > 80:
                 channelName = channelName[:80]
 
@@ -62,14 +115,14 @@ def zulipEvents(events):
                 counter += 1
 
             # rename the invalid Zulip topic
-            renameTopic(events[0]['subject'], newChannelName)
-            return renameChannel(events[0]['orig_subject'], newChannelName)
+            renameTopic(event['subject'], newChannelName)
+            return renameChannel(event['orig_subject'], newChannelName)
 
     # if the event is a delete message
-    elif events[0]['type'] == "delete_message":
+    elif event['type'] == "delete_message":
         # check if the topic still exists
-        if topicDeleted(events[0]['topic'], events[0]['stream_id']):
-            return deleteChannel(events[0]['topic'])
+        if topicDeleted(event['topic'], event['stream_id']):
+            return deleteChannel(event['topic'])
 
     else:
         return "Zulip can't handle this event"
@@ -77,20 +130,19 @@ def zulipEvents(events):
 
 def topicDeleted(topicName, streamID):
     """
-    Given a Zulip topic, delete it from Zulip
+    Check if a Zulip topic no longer has any messages, answered from the topic index
 
-    :param topicName: Name of the topic to delete
+    :param topicName: Name of the topic to check
     :type topicName: String
 
     :param streamID: `Slack` Stream ID in Zulip
     :type streamID: Integer
     """
-    zulipAuth = parseZulipRC(current_user.zulipBotRC)
+    index = topicIndex(current_user.zulipBotRC)
+    if streamID != index.streamID():
+        return False
 
-    getTopicsRequest = get(zulipAuth['site'] + f"/api/v1/users/me/{streamID}/topics", auth=(zulipAuth['email'], zulipAuth['key']))
-    getTopicsRequest = getTopicsRequest.json()
-
-    return list(filter(lambda topic: topic['name'] == topicName, getTopicsRequest['topics'])) == []
+    return not index.hasTopic(topicName)
 
 
 def slackNamingValidation(channelName):
@@ -109,15 +161,15 @@ def slackNamingValidation(channelName):
     return slackName.match(channelName) is not None
 
 
-def formatTopicName(events):
+def formatTopicName(event):
     """
     Given an invalid Zulip channel name change it to be Slack safe
 
-    :param channelName: Name of the invalid topic to change for Slack
-    :type: channelName: String
+    :param event: Zulip message event sent to the invalid topic
+    :type: event: JSON payload
     """
     # format to Slack valid form
-    channelName = events[0]['message']['subject'].lower().replace(' ', '')
+    channelName = event['message']['subject'].lower().replace(' ', '')
     if len(channelName) > 80:
         channelName = channelName[:80]
 
@@ -138,8 +190,9 @@ def formatTopicName(events):
 
     # delete the invalid Topic
     zulipAdminAuth = parseZulipRC(current_user.zulipAdminRC)
-    post(zulipAdminAuth['site'] + "/json/streams/" + str(getStreamID()) + "/delete_topic", data={"topic_name": events[0]['message']['subject']}, auth=(zulipAdminAuth['email'], zulipAdminAuth['key']))
-    return slackWebhook(newChannelName, f"{zulipCustomPrefix(events[0])} Zulip Topic renamed to be Slack safe")
+    post(zulipAdminAuth['site'] + "/json/streams/" + str(getStreamID()) + "/delete_topic", data={"topic_name": event['message']['subject']}, auth=(zulipAdminAuth['email'], zulipAdminAuth['key']))
+    topicIndex(current_user.zulipBotRC).removeTopic(event['message']['subject'])
+    return slackWebhook(newChannelName, f"{zulipCustomPrefix(event)} Zulip Topic renamed to be Slack safe")
 
 
 def zulipCustomPrefix(events, **kwargs):
@@ -0,0 +1,459 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from functools import partial
+from tempfile import SpooledTemporaryFile
+from threading import BoundedSemaphore, Lock
+from time import monotonic
+from uuid import uuid4
+from integration import asyncTransport
+from integration.transport import TIMEOUT, get
+
+# largest file Zulip accepts as an upload
+ZULIP_UPLOAD_LIMIT = 25_000_000
+
+# bytes read from a download and written to an upload at a time, the most of a file held in memory
+CHUNK_SIZE = 64 * 1024
+
+# bytes of a download without a Content-Length held in memory while its size is found, the rest is written to a temporary file
+SPOOL_SIZE = 1024 * 1024
+
+# files of one tenant relayed at once, and the threads relaying files for every tenant
+TENANT_FILE_LIMIT = 4
+RELAY_WORKERS = 32
+
+# seconds the files of a message have to be relayed, after which the files not yet relayed are given up on
+FILE_DEADLINE = 60
+
+# post the text of a message before its files have been relayed, rather than with them once they have
+TEXT_FIRST = False
+
+
+class FileTooLarge(Exception):
+    """
+    Raised when a download is too large for the upload it is relayed to.
+
+    :param limit: Size in bytes the file must be under
+    :type limit: Integer
+    """
+    def __init__(self, limit):
+        super().__init__(f"File is not under {limit} bytes")
+        self.limit = limit
+
+
+class RelayTimeout(Exception):
+    """
+    Raised when a file is still being relayed at its deadline.
+
+    :param deadline: Seconds the file had to be relayed
+    :type deadline: Float
+    """
+    def __init__(self, deadline):
+        super().__init__(f"File was not relayed within {deadline} seconds")
+        self.deadline = deadline
+
+
+def relayTimeout(deadline=None):
+    """
+    Returns the timeout of a download or upload relaying a file, so a request that stalls is given up on by the deadline.
+
+    :param deadline: Seconds left to relay the file in, None for the default timeout
+    :type deadline: Float
+    """
+    if deadline is None:
+        return TIMEOUT
+    seconds = max(deadline, 0.1)
+    return min(TIMEOUT[0], seconds), seconds
+
+
+def openDownload(url, **kwargs):
+    """
+    Start downloading a file, returns the response once its headers have arrived and before any of the file is read.
+    Takes the same keyword arguments as requests.get.
+
+    :param url: Address of the file
+    :type url: String
+    """
+    return get(url, stream=True, **kwargs)
+
+
+def contentLength(response):
+    """
+    Returns the size of a download from its Content-Length header, or None if it was not sent or is the size of the
+    compressed file.
+
+    :param response: Response of openDownload
+    :type response: Response
+    """
+    if response.headers.get('Content-Encoding', 'identity') != 'identity':
+        return None
+    try:
+        return int(response.headers['Content-Length'])
+    except:
+        return None
+
+
+def limitedChunks(response, limit=None, deadline=None):
+    """
+    Yield a download CHUNK_SIZE bytes at a time, raising FileTooLarge once limit bytes have been read and RelayTimeout
+    if it is still being read at the deadline.
+
+    :param response: Response of openDownload
+    :type response: Response
+
+    :param limit: Size in bytes the file must be under, None for no limit
+    :type limit: Integer
+
+    :param deadline: Seconds from now the file has to be read in, None for no deadline
+    :type deadline: Float
+    """
+    read = 0
+    expires = monotonic() + deadline if deadline is not None else None
+
+    for chunk in response.iter_content(CHUNK_SIZE):
+        read += len(chunk)
+        if limit is not None and read >= limit:
+            raise FileTooLarge(limit)
+        if expires is not None and monotonic() > expires:
+            raise RelayTimeout(deadline)
+        yield chunk
+
+
+def spooledChunks(spool):
+    """
+    Yield a spooled download CHUNK_SIZE bytes at a time from the start, closing the spool once it has been read.
+
+    :param spool: Temporary file holding the download
+    :type spool: SpooledTemporaryFile
+    """
+    with spool:
+        spool.seek(0)
+        yield from iter(partial(spool.read, CHUNK_SIZE), b'')
+
+
+def sizedChunks(download, deadline=None):
+    """
+    Returns the chunks of a download and its size in bytes, for uploads that must be told the size before they start.
+    A download without a Content-Length is read into a temporary file first to find its size.
+
+    :param download: Response of openDownload
+    :type download: Response
+
+    :param deadline: Seconds from now the file has to be read in, None for no deadline
+    :type deadline: Float
+    """
+    size = contentLength(download)
+    if size is not None:
+        return limitedChunks(download, deadline=deadline), size
+
+    spool = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    try:
+        for chunk in limitedChunks(download, deadline=deadline):
+            spool.write(chunk)
+    except:
+        spool.close()
+        raise
+    return spooledChunks(spool), spool.tell()
+
+
+class MultipartStream:
+    """
+    A multipart/form-data body holding one file, written as the chunks of the file are read so the file is never held in
+    memory. When the size of the file is known the body has a length and is sent with a Content-Length header,
+    otherwise body() is sent with chunked encoding.
+
+    :param fieldName: Name of the form field holding the file
+    :type fieldName: String
+
+    :param filename: Name of the file
+    :type filename: String
+
+    :param chunks: Iterable of the bytes of the file
+    :type chunks: Iterable
+
+    :param size: Size of the file in bytes, None if it is not known
+    :type size: Integer
+    """
+    def __init__(self, fieldName, filename, chunks, size=None):
+        self.boundary = uuid4().hex
+        self.chunks = chunks
+        self.size = size
+
+        filename = filename.replace('"', '%22').replace('\r', '').replace('\n', '')
+        self.head = (f'--{self.boundary}\r\n'
+                     f'Content-Disposition: form-data; name="{fieldName}"; filename="{filename}"\r\n'
+                     'Content-Type: application/octet-stream\r\n\r\n').encode()
+        self.tail = f'\r\n--{self.boundary}--\r\n'.encode()
+
+    @property
+    def contentType(self):
+        return 'multipart/form-data; boundary=' + self.boundary
+
+    def __iter__(self):
+        yield self.head
+        yield from self.chunks
+        yield self.tail
+
+    def __len__(self):
+        return len(self.head) + self.size + len(self.tail)
+
+    async def __aiter__(self):
+        yield self.head
+        if hasattr(self.chunks, '__aiter__'):
+            async for chunk in self.chunks:
+                yield chunk
+        else:
+            for chunk in self.chunks:
+                yield chunk
+        yield self.tail
+
+    def asyncBody(self):
+        """
+        Returns the body to send with asyncTransport and its headers, with a Content-Length when the length is known.
+        """
+        headers = {'Content-Type': self.contentType}
+        if self.size is not None:
+            headers['Content-Length'] = str(len(self))
+        return self.__aiter__(), headers
+
+    def body(self):
+        """
+        Returns the body to send, the stream itself when its length is known or a generator over it when it is not.
+        """
+        if self.size is None:
+            return iter(self)
+        return self
+
+
+def multipartBody(download, fieldName, filename, limit=None, deadline=None):
+    """
+    Returns the body and Content-Type of a multipart upload that reads a download as it is sent. Raises FileTooLarge
+    before any of the download is read if its Content-Length is limit bytes or more, or while it is sent if it has no
+    Content-Length and reaches limit bytes.
+
+    :param download: Response of openDownload
+    :type download: Response
+
+    :param fieldName: Name of the form field holding the file
+    :type fieldName: String
+
+    :param filename: Name of the file
+    :type filename: String
+
+    :param limit: Size in bytes the file must be under, None for no limit
+    :type limit: Integer
+
+    :param deadline: Seconds from now the file has to be sent in, None for no deadline
+    :type deadline: Float
+    """
+    size = contentLength(download)
+    if limit is not None and size is not None and size >= limit:
+        raise FileTooLarge(limit)
+
+    stream = MultipartStream(fieldName, filename, limitedChunks(download, limit, deadline), size)
+    return stream.body(), stream.contentType
+
+
+relayExecutor = ThreadPoolExecutor(max_workers=RELAY_WORKERS)
+
+# the semaphore of each tenant, limiting the files it relays at once
+tenantSlots = {}
+tenantSlotsLock = Lock()
+
+
+def tenantSlot(tenant):
+    """
+    Returns the semaphore limiting the files a tenant relays at once to TENANT_FILE_LIMIT, creating it on first use.
+
+    :param tenant: Key of the tenant e.g. its Slack token
+    :type tenant: String
+    """
+    slot = tenantSlots.get(tenant)
+    if slot is None:
+        with tenantSlotsLock:
+            slot = tenantSlots.setdefault(tenant, BoundedSemaphore(TENANT_FILE_LIMIT))
+    return slot
+
+
+def relayFiles(files, relay, tenant, deadline=FILE_DEADLINE):
+    """
+    Relay files at the same time, at most TENANT_FILE_LIMIT of a tenant at once, returns the result of each file in the
+    order the files were given. A file that failed has the exception raised as its result, and a file that was still
+    waiting for a slot or being relayed at the deadline has a RelayTimeout.
+
+    :param files: Filename and URL of each file
+    :type files: List of Tuples
+
+    :param relay: Function relaying one file, called with the filename, URL and the seconds left before the deadline
+    :type relay: Function
+
+    :param tenant: Key of the tenant e.g. its Slack token
+    :type tenant: String
+
+    :param deadline: Seconds the files have to be relayed in
+    :type deadline: Float
+    """
+    slot = tenantSlot(tenant)
+    expires = monotonic() + deadline
+    futures = []
+
+    # a file is only handed to a thread once the tenant has a free slot, so one tenant cannot hold every thread
+    for filename, fileurl in files:
+        if not slot.acquire(timeout=max(expires - monotonic(), 0)):
+            futures.append(None)
+            continue
+        try:
+            future = relayExecutor.submit(relay, filename, fileurl, max(expires - monotonic(), 0))
+        except:
+            slot.release()
+            raise
+        future.add_done_callback(lambda future: slot.release())
+        futures.append(future)
+
+    results = []
+    for future in futures:
+        # the thread of a file given up on keeps its slot until the relay's own deadline or timeouts stop it
+        try:
+            if future is None:
+                raise RelayTimeout(deadline)
+            results.append(future.result(timeout=max(expires - monotonic(), 0)))
+        except TimeoutError:
+            results.append(RelayTimeout(deadline))
+        except Exception as error:
+            results.append(error)
+    return results
+
+
+def openDownloadAsync(url, **kwargs):
+    """
+    Start downloading a file from asyncio, used as an async context manager giving the response once its headers have
+    arrived and before any of the file is read. Takes the same keyword arguments as requests.get.
+
+    :param url: Address of the file
+    :type url: String
+    """
+    return asyncTransport.stream('GET', url, **kwargs)
+
+
+async def limitedChunksAsync(response, limit=None, deadline=None):
+    """
+    Yield a download of openDownloadAsync CHUNK_SIZE bytes at a time, raising FileTooLarge once limit bytes have been
+    read and RelayTimeout if it is still being read at the deadline.
+
+    :param response: Response of openDownloadAsync
+    :type response: AsyncResponse
+
+    :param limit: Size in bytes the file must be under, None for no limit
+    :type limit: Integer
+
+    :param deadline: Seconds from now the file has to be read in, None for no deadline
+    :type deadline: Float
+    """
+    read = 0
+    expires = monotonic() + deadline if deadline is not None else None
+
+    async for chunk in response.iter_content(CHUNK_SIZE):
+        read += len(chunk)
+        if limit is not None and read >= limit:
+            raise FileTooLarge(limit)
+        if expires is not None and monotonic() > expires:
+            raise RelayTimeout(deadline)
+        yield chunk
+
+
+async def sizedChunksAsync(download, deadline=None):
+    """
+    Returns the chunks of a download of openDownloadAsync and its size in bytes, for uploads that must be told the size
+    before they start. A download without a Content-Length is read into a temporary file first to find its size.
+
+    :param download: Response of openDownloadAsync
+    :type download: AsyncResponse
+
+    :param deadline: Seconds from now the file has to be read in, None for no deadline
+    :type deadline: Float
+    """
+    size = contentLength(download)
+    if size is not None:
+        return limitedChunksAsync(download, deadline=deadline), size
+
+    spool = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    try:
+        async for chunk in limitedChunksAsync(download, deadline=deadline):
+            spool.write(chunk)
+    except:
+        spool.close()
+        raise
+    return spooledChunks(spool), spool.tell()
+
+
+def multipartBodyAsync(download, fieldName, filename, limit=None, deadline=None):
+    """
+    Returns the body and headers of a multipart upload from asyncio that reads a download as it is sent. Raises
+    FileTooLarge in the same way as multipartBody.
+
+    :param download: Response of openDownloadAsync
+    :type download: AsyncResponse
+
+    :param fieldName: Name of the form field holding the file
+    :type fieldName: String
+
+    :param filename: Name of the file
+    :type filename: String
+
+    :param limit: Size in bytes the file must be under, None for no limit
+    :type limit: Integer
+
+    :param deadline: Seconds from now the file has to be sent in, None for no deadline
+    :type deadline: Float
+    """
+    size = contentLength(download)
+    if limit is not None and size is not None and size >= limit:
+        raise FileTooLarge(limit)
+
+    return MultipartStream(fieldName, filename, limitedChunksAsync(download, limit, deadline), size).asyncBody()
+
+
+async def relayFilesAsync(files, relay, tenant, deadline=FILE_DEADLINE):
+    """
+    Relay files from asyncio at the same time, at most TENANT_FILE_LIMIT of a tenant at once, returns the result of each
+    file in the order the files were given. A file that failed has the exception raised as its result, and a file that
+    was still waiting for a slot or being relayed at the deadline is cancelled and has a RelayTimeout.
+
+    :param files: Filename and URL of each file
+    :type files: List of Tuples
+
+    :param relay: Coroutine function relaying one file, called with the filename, URL and the seconds left before the deadline
+    :type relay: Function
+
+    :param tenant: Key of the tenant e.g. its Slack token
+    :type tenant: String
+
+    :param deadline: Seconds the files have to be relayed in
+    :type deadline: Float
+    """
+    if not files:
+        return []
+
+    slot = asyncTransport.asyncTransport().semaphore(('files', tenant), TENANT_FILE_LIMIT)
+    expires = monotonic() + deadline
+
+    async def relayFile(filename, fileurl):
+        async with slot:
+            return await relay(filename, fileurl, max(expires - monotonic(), 0))
+
+    tasks = [asyncio.ensure_future(relayFile(filename, fileurl)) for filename, fileurl in files]
+    done, pending = await asyncio.wait(tasks, timeout=deadline)
+    # the files given up on are cancelled, closing their downloads and uploads
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.wait(pending)
+
+    results = []
+    for task in tasks:
+        if task in pending:
+            results.append(RelayTimeout(deadline))
+        elif task.exception() is not None:
+            results.append(task.exception())
+        else:
+            results.append(task.result())
+    return results
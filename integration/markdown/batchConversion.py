@@ -0,0 +1,91 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from integration.markdown.toSlack import SlackConverter
+from integration.markdown.toZulip import ZulipConverter
+
+# directions a message can be converted in, named after the markdown it is converted to
+TO_ZULIP = 'toZulip'
+TO_SLACK = 'toSlack'
+
+converters = {TO_ZULIP: ZulipConverter, TO_SLACK: SlackConverter}
+
+# number of messages sent to a worker process at a time
+CHUNK_SIZE = 500
+
+
+def messageChunks(messages, chunkSize):
+    """
+    Split an iterable of messages into lists of at most chunkSize messages, without reading ahead of the current chunk.
+
+    :param messages: The messages to split
+    :type messages: Iterable of Strings
+
+    :param chunkSize: Maximum number of messages in a chunk
+    :type chunkSize: Integer
+    """
+    chunk = []
+    for message in messages:
+        chunk.append(message)
+        if len(chunk) == chunkSize:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def convertChunk(converter, messages):
+    """
+    Convert a chunk of messages in a worker process, returns the list of results.
+
+    :param converter: The converter to use
+    :type converter: ZulipConverter or SlackConverter
+
+    :param messages: The messages to convert
+    :type messages: List of Strings
+    """
+    return [converter.convert(message) for message in messages]
+
+
+def convertMany(messages, direction, context, workers=None, chunkSize=CHUNK_SIZE):
+    """
+    Convert a stream of messages for backfills and replays, yielding the result of each message in the order given.
+    Results are the same tuples of message and files returned by zulipMarkdown and slackMarkdown.
+
+    Without workers the messages are converted in the calling thread one at a time. With workers the messages are sent
+    in chunks to a pool of processes, keeping at most two chunks per worker in flight so a large backfill is never held
+    in memory at once.
+
+    :param messages: The messages to convert
+    :type messages: Iterable of Strings
+
+    :param direction: TO_ZULIP or TO_SLACK
+    :type direction: String
+
+    :param context: The user the messages are converted for
+    :type context: ConversionContext
+
+    :param workers: Number of worker processes, by default no processes are used
+    :type workers: Integer
+
+    :param chunkSize: Number of messages sent to a worker process at a time
+    :type chunkSize: Integer
+    """
+    converter = converters[direction](context)
+
+    if not workers:
+        for message in messages:
+            yield converter.convert(message)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+
+        for chunk in messageChunks(messages, chunkSize):
+            pending.append(pool.submit(convertChunk, converter, chunk))
+
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+
+        while pending:
+            yield from pending.popleft().result()
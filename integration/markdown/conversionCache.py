@@ -0,0 +1,98 @@
+import sys
+from collections import OrderedDict
+from threading import Lock
+
+# bytes of messages and results kept by a cache when no size is given
+CACHE_BYTES = 16 * 1024 * 1024
+
+
+class ConversionCache:
+    """
+    Least recently used cache of converted messages, limited by the bytes of the messages and results it holds.
+    Entries are keyed by the direction, message and everything else the result depends on, such as the emoji overlay version.
+
+    :param maxBytes: Bytes of messages and results to keep
+    :type maxBytes: Integer
+    """
+    def __init__(self, maxBytes=CACHE_BYTES):
+        self.maxBytes = maxBytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.results = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        """
+        Returns the cached result of a conversion, or None if it has not been cached.
+
+        :param key: Tuple of the direction, message and conversion settings
+        :type key: Tuple
+        """
+        with self.lock:
+            cached = self.results.get(key)
+            if cached is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.results.move_to_end(key)
+            text, files, size = cached
+            return text, list(files)
+
+    def set(self, key, result):
+        """
+        Store the result of a conversion, removing the least recently used results until the cache fits in maxBytes.
+        A result larger than the whole cache is not stored.
+
+        :param key: Tuple of the direction, message and conversion settings
+        :type key: Tuple
+
+        :param result: Tuple of the converted message and a list of files
+        :type result: Tuple
+        """
+        text, files = result
+        size = resultSize(key, result)
+        if size > self.maxBytes:
+            return
+
+        with self.lock:
+            previous = self.results.pop(key, None)
+            if previous is not None:
+                self.size -= previous[2]
+
+            self.results[key] = (text, tuple(files), size)
+            self.size += size
+
+            while self.size > self.maxBytes:
+                self.size -= self.results.popitem(last=False)[1][2]
+
+    def clear(self):
+        with self.lock:
+            self.results.clear()
+            self.size = 0
+
+    def stats(self):
+        """
+        Returns the hit and miss counters and how full the cache is.
+        """
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.results), 'bytes': self.size}
+
+
+def resultSize(key, result):
+    """
+    Returns the approximate bytes held by a cached conversion, the message in the key and the converted message and files.
+
+    :param key: Tuple of the direction, message and conversion settings
+    :type key: Tuple
+
+    :param result: Tuple of the converted message and a list of files
+    :type result: Tuple
+    """
+    text, files = result
+    return sys.getsizeof(key[1]) + sys.getsizeof(text) + sum(sys.getsizeof(name) + sys.getsizeof(url) for name, url in files)
+
+
+# set to a ConversionCache to cache every message converted by zulipMarkdown and slackMarkdown, None turns caching off
+defaultCache = None
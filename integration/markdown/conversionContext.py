@@ -0,0 +1,49 @@
+from integration.markdown.emojis.emojiOverlay import emojiOverlay
+from integration.utilities import parseZulipRC
+
+
+class ConversionContext:
+    """
+    Everything a markdown conversion needs to know about the user it is converting for, so conversions do not rely on
+    the Flask request. Only plain values are held so a context can be pickled and sent to worker processes.
+
+    :param userID: ID of the user, used to cache their emoji overlay
+    :type userID: Integer
+
+    :param emojiAdditions: JSON string of Slack short codes to Zulip short codes added by the user
+    :type emojiAdditions: String
+
+    :param zulipSite: Address of the user's Zulip organisation, used to link to uploaded files
+    :type zulipSite: String
+
+    :param linkMode: How links are validated, VALIDATE or TRUST, by default the defaultMode of linkValidation
+    :type linkMode: String
+    """
+    def __init__(self, userID=None, emojiAdditions="{}", zulipSite="", linkMode=None):
+        self.userID = userID
+        self.emojiAdditions = emojiAdditions
+        self.zulipSite = zulipSite
+        self.linkMode = linkMode
+
+    @property
+    def emojis(self):
+        """
+        The emoji overlay of the user, built once per process and reused until the emojiAdditions change.
+        """
+        return emojiOverlay(self.userID, self.emojiAdditions)
+
+
+def userContext(user, linkMode=None):
+    """
+    Returns the conversion context for a user, e.g. current_user while handling a request.
+
+    :param user: The user the messages are converted for
+    :type user: User
+
+    :param linkMode: How links are validated, VALIDATE or TRUST
+    :type linkMode: String
+    """
+    zulipRC = parseZulipRC(user.zulipBotRC or "")
+    zulipSite = zulipRC['site'] if zulipRC else ""
+
+    return ConversionContext(user.id, user.emojiAdditions, zulipSite, linkMode)
@@ -0,0 +1,75 @@
+import json
+from hashlib import sha1
+from types import MappingProxyType
+from integration.markdown.emojis.shortCodeDict import slackToZulipTable, zulipToSlackTable
+
+
+class EmojiOverlay:
+    """
+    The emoji translation tables for one user, the shared tables merged with the user's emojiAdditions.
+
+    :param emojiAdditions: JSON string of Slack short codes to Zulip short codes added by the user
+    :type emojiAdditions: String
+    """
+    def __init__(self, emojiAdditions):
+        self.source = emojiAdditions
+        self.version = overlayVersion(emojiAdditions)
+
+        if emojiAdditions == "{}":
+            self.slackToZulip = slackToZulipTable
+            self.zulipToSlack = zulipToSlackTable
+        else:
+            additions = json.loads(emojiAdditions)
+
+            slackToZulip = dict(slackToZulipTable)
+            slackToZulip.update(additions)
+            zulipToSlack = dict(zulipToSlackTable)
+            zulipToSlack.update({value: key for key, value in additions.items()})
+
+            self.slackToZulip = MappingProxyType(slackToZulip)
+            self.zulipToSlack = MappingProxyType(zulipToSlack)
+
+
+# the most recent overlay for each user id
+overlayCache = {}
+
+
+def overlayVersion(emojiAdditions):
+    """
+    Returns a short hash of the emojiAdditions, used to tell apart overlays built from different additions.
+
+    :param emojiAdditions: JSON string of Slack short codes to Zulip short codes added by the user
+    :type emojiAdditions: String
+    """
+    return sha1(emojiAdditions.encode()).hexdigest()[:12]
+
+
+def emojiOverlay(userID, emojiAdditions):
+    """
+    Returns the emoji overlay for a user, it is only rebuilt when the user's emojiAdditions have changed.
+
+    :param userID: ID of the user the emojiAdditions belong to
+    :type userID: Integer
+
+    :param emojiAdditions: JSON string of Slack short codes to Zulip short codes added by the user
+    :type emojiAdditions: String
+    """
+    if not isinstance(emojiAdditions, str):
+        emojiAdditions = json.dumps(emojiAdditions)
+
+    overlay = overlayCache.get(userID)
+    if overlay is None or overlay.source != emojiAdditions:
+        overlay = EmojiOverlay(emojiAdditions)
+        overlayCache[userID] = overlay
+
+    return overlay
+
+
+def invalidateEmojiOverlay(userID):
+    """
+    Remove the cached emoji overlay of a user, called when the user's emojiAdditions are saved.
+
+    :param userID: ID of the user whose overlay should be rebuilt
+    :type userID: Integer
+    """
+    overlayCache.pop(userID, None)
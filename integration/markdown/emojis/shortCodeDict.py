@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+from types import MappingProxyType
 from requests import get
 
 
@@ -87,4 +88,9 @@ def zulipToSlackDict():
     """
     Swaps the slackToZulipDict() output, for messages coming from Zulip to Slack.
     """
-    return {value:key for key, value in slackToZulipDict().items()}
\ No newline at end of file
+    return {value:key for key, value in slackToZulipDict().items()}
+
+
+# read-only translation tables, built once so that converting an emoji does not rebuild the dictionaries above
+slackToZulipTable = MappingProxyType(slackToZulipDict())
+zulipToSlackTable = MappingProxyType(zulipToSlackDict())
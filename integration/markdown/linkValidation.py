@@ -0,0 +1,157 @@
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import Lock
+from time import monotonic
+from requests import get, head
+
+# link validation modes, VALIDATE checks each link responds with a 200 and TRUST accepts every link without a request
+VALIDATE = 'validate'
+TRUST = 'trust'
+
+# the mode used when none is given
+defaultMode = VALIDATE
+
+# seconds allowed for connecting to and reading from a link, and for all the links of a message to be checked
+LINK_TIMEOUT = (2, 3)
+LINK_DEADLINE = 5
+
+# maximum number of links checked at the same time
+LINK_WORKERS = 8
+
+
+class LinkCache:
+    """
+    Least recently used cache of link validation results, each result expires after ttl seconds.
+
+    :param maxSize: Number of links to keep results for
+    :type maxSize: Integer
+
+    :param ttl: Seconds a result is kept for
+    :type ttl: Integer
+    """
+    def __init__(self, maxSize=1024, ttl=300):
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.results = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, url):
+        """
+        Returns the cached result for a link, or None if the link has not been checked recently.
+
+        :param url: The link that was checked
+        :type url: String
+        """
+        with self.lock:
+            cached = self.results.get(url)
+            if cached is None:
+                return None
+
+            valid, expires = cached
+            if expires < monotonic():
+                del self.results[url]
+                return None
+
+            self.results.move_to_end(url)
+            return valid
+
+    def set(self, url, valid):
+        """
+        Store the result of checking a link, removing the least recently used result if the cache is full.
+
+        :param url: The link that was checked
+        :type url: String
+
+        :param valid: If the link responded with a 200
+        :type valid: Boolean
+        """
+        with self.lock:
+            self.results[url] = (valid, monotonic() + self.ttl)
+            self.results.move_to_end(url)
+
+            while len(self.results) > self.maxSize:
+                self.results.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.results.clear()
+
+
+linkCache = LinkCache()
+linkPool = ThreadPoolExecutor(max_workers=LINK_WORKERS, thread_name_prefix='linkValidation')
+
+
+def resetAfterFork():
+    """
+    Give a forked worker process its own link pool and cache lock, the threads of the parent's pool do not exist in the child.
+    """
+    global linkPool
+    linkPool = ThreadPoolExecutor(max_workers=LINK_WORKERS, thread_name_prefix='linkValidation')
+    linkCache.lock = Lock()
+
+
+# forking is only possible on Unix, Windows has no fork hooks
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=resetAfterFork)
+
+
+def checkLink(url):
+    """
+    Returns True if the link responds with a 200, a HEAD request is tried first and a streamed GET is used if HEAD is not supported.
+
+    :param url: The link to check
+    :type url: String
+    """
+    try:
+        response = head(url, allow_redirects=True, timeout=LINK_TIMEOUT)
+        if response.status_code in [405, 501]:
+            # only the status is needed so the body is never downloaded
+            response = get(url, stream=True, timeout=LINK_TIMEOUT)
+            response.close()
+
+        return response.status_code == 200
+    except:
+        return False
+
+
+def validateLinks(urls, mode=None):
+    """
+    Check a list of links at the same time, returns a dictionary of each link to True if it is valid.
+    Results are cached, and the checks of a message share one deadline of LINK_DEADLINE seconds. Links not checked by
+    then, including links still waiting for a free worker, are unverified and treated as not valid.
+
+    :param urls: Links to check
+    :type urls: List of Strings
+
+    :param mode: VALIDATE or TRUST, by default the defaultMode
+    :type mode: String
+    """
+    if (mode or defaultMode) == TRUST:
+        return {url: True for url in urls}
+
+    results = {}
+    checks = {}
+    expires = monotonic() + LINK_DEADLINE
+
+    for url in urls:
+        if url in results or url in checks:
+            continue
+
+        cached = linkCache.get(url)
+        if cached is not None:
+            results[url] = cached
+        else:
+            checks[url] = linkPool.submit(checkLink, url)
+
+    wait(checks.values(), timeout=max(expires - monotonic(), 0))
+    for url, check in checks.items():
+        if check.done():
+            results[url] = check.result()
+            linkCache.set(url, results[url])
+        else:
+            # unverified links are not cached so they are checked again next time, and checks not started are dropped
+            check.cancel()
+            results[url] = False
+
+    return results
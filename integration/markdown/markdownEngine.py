@@ -0,0 +1,257 @@
+import os
+from collections import deque
+from hashlib import sha1
+from importlib.util import find_spec
+
+
+class MarkdownToken:
+    """
+    A token of a message being converted, only the type and value are kept so large messages stay cheap to hold.
+
+    :param type: Name of the token e.g. BOLD
+    :type type: String
+
+    :param value: The text matched for the token
+    :type value: String
+    """
+    __slots__ = ('type', 'value')
+
+    def __init__(self, type, value):
+        self.type = type
+        self.value = value
+
+    def __repr__(self):
+        return "MarkdownToken(%r, %r)" % (self.type, self.value)
+
+
+class MessageState:
+    """
+    State of one message being emitted, shared by the emitters of its tokens.
+
+    :param converter: The converter emitting the message, used for its context and to convert nested markdown
+    :type converter: ZulipConverter or SlackConverter
+
+    :param validLinks: Each link in the message to True if it is valid
+    :type validLinks: Dictionary
+    """
+    __slots__ = ('converter', 'boldItalicOpened', 'validLinks', 'files')
+
+    def __init__(self, converter, validLinks=None):
+        self.converter = converter
+        self.boldItalicOpened = False
+        self.validLinks = validLinks or {}
+        self.files = []
+
+
+def lextabName(lextab, tokenRules):
+    """
+    Returns the module name of the generated lexer table for a set of token rules.
+    The name contains a digest of the rules so a table generated from older rules is never loaded.
+
+    :param lextab: Base name of the lexer table module e.g. zulipLextab
+    :type lextab: String
+
+    :param tokenRules: Namespace holding the PLY token list and token definitions, in the order they are defined
+    :type tokenRules: Dictionary
+    """
+    rules = [(name, rule) for name, rule in tokenRules.items() if name.startswith('t_') and isinstance(rule, str)]
+    digest = sha1(repr((list(tokenRules['tokens']), rules)).encode()).hexdigest()[:10]
+
+    return "integration.markdown." + lextab + "_" + digest
+
+
+def lextabOptions(lextab, tokenRules):
+    """
+    Returns the extra lex.lex() arguments needed to load a generated lexer table, if one exists for these token rules.
+    Without a table the lexer is built by reflecting over the token rules as normal.
+
+    :param lextab: Base name of the lexer table module e.g. zulipLextab
+    :type lextab: String
+
+    :param tokenRules: Namespace holding the PLY token list and token definitions, in the order they are defined
+    :type tokenRules: Dictionary
+    """
+    tableName = lextabName(lextab, tokenRules)
+
+    # only use the optimised mode when a table exists, otherwise PLY would write one on import
+    if find_spec(tableName) is not None:
+        return {'optimize': 1, 'lextab': tableName}
+    return {}
+
+
+def messageTokens(lexer, message):
+    """
+    Lex a message, yielding each token as a MarkdownToken.
+    Runs of STRING and SPACE tokens are joined into a single STRING token, apart from the first token of a line which is
+    kept as it is because the list passes rewrite it.
+
+    :param lexer: Lexer cloned for this message
+    :type lexer: PLY Lexer
+
+    :param message: The message to lex
+    :type message: String
+    """
+    lexer.input(message)
+    runStart, runEnd = None, None
+    previousType = None
+
+    for tok in iter(lexer.token, None):
+        if tok.type in ['STRING', 'SPACE'] and previousType != 'NEWLINE':
+            if runStart is None:
+                runStart = tok.lexpos
+            runEnd = tok.lexpos + len(tok.value)
+            continue
+
+        if runStart is not None:
+            yield MarkdownToken('STRING', message[runStart:runEnd])
+            runStart = None
+
+        yield MarkdownToken(tok.type, tok.value)
+        previousType = tok.type
+
+    if runStart is not None:
+        yield MarkdownToken('STRING', message[runStart:runEnd])
+
+
+def sanitiseBoldItalicStrike(tokenList, tokenType):
+    """
+    Prevent bold, italic and strike tokens spanning multiple lines without being ended, unmatched tokens become STRING tokens.
+
+    Gives the same result as rescanning the token list until no token changes, where each scan ends a line with an odd
+    running count of tokenType tokens by turning the last of them into a STRING token. Every line with tokenType tokens
+    only depends on which scans had an odd count before it, so these scans are tracked as runs and each line is visited once.
+
+    :param tokenList: Tokens of the message
+    :type tokenList: List of MarkdownTokens
+
+    :param tokenType: Name of token that requires sanitisation
+    :type tokenType: String
+    """
+    # the scans (1, 2, ...) that reach the end of the current line with an odd count, as [start, end) runs
+    oddScans = deque()
+    lineTokens = []
+    lastIndex = len(tokenList) - 1
+
+    for i, token in enumerate(tokenList):
+        if token.type == tokenType:
+            lineTokens.append(i)
+
+        if (token.type == 'NEWLINE' or i == lastIndex) and lineTokens:
+            remaining = sanitiseLine(oddScans, len(lineTokens))
+
+            # each scan that changed this line removed its last remaining token
+            for index in lineTokens[remaining:]:
+                tokenList[index].type = 'STRING'
+            lineTokens = []
+
+
+def sanitiseLine(oddScans, count):
+    """
+    Update the odd scans for a line holding count tokens of one type, returns how many of them are left unchanged.
+    While the line has tokens left, a scan changes it whenever the scan and the one before it disagree, the first scan is
+    compared against the parity of count. Once no tokens are left the line no longer affects the scans after it.
+
+    :param oddScans: Runs of scans with an odd count at the end of the previous line, updated in place
+    :type oddScans: Deque
+
+    :param count: Number of tokens of the type on this line
+    :type count: Integer
+    """
+    changes = []
+
+    # a line with an odd count acts as if the scan before the first one was odd
+    if count % 2 == 1:
+        if oddScans and oddScans[0][0] == 1:
+            oddScans[0] = [0, oddScans[0][1]]
+        else:
+            oddScans.appendleft([0, 1])
+
+    while oddScans and len(changes) < count:
+        start, end = oddScans.popleft()
+
+        if start > 0:
+            changes.append(start)
+            if len(changes) == count:
+                # the remainder of this run is passed through unchanged
+                if start + 1 < end:
+                    oddScans.appendleft([start + 1, end])
+                break
+
+        changes.append(end)
+
+    # the scans that changed this line are odd at its end, merged in front of the scans passed through
+    for scan in reversed(changes):
+        if oddScans and oddScans[0][0] == scan + 1:
+            oddScans[0][0] = scan
+        else:
+            oddScans.appendleft([scan, scan + 1])
+
+    return count - len(changes)
+
+
+def keepValue(value, state):
+    """
+    Emitter for tokens that are the same in both markdowns, returns the token value.
+    """
+    return value
+
+
+def emitNothing(value, state):
+    """
+    Emitter for tokens that are dropped from the converted message.
+    """
+    return ""
+
+
+def emitText(text):
+    """
+    Returns an emitter that replaces a token with the same text every time.
+
+    :param text: Text to emit
+    :type text: String
+    """
+    def emit(value, state):
+        return text
+    return emit
+
+
+def emitBoldItalic(value, state):
+    """
+    Emitter for bold italic tokens, only the first bold italic token of a message opens and every one after it closes.
+    """
+    if state.boldItalicOpened:
+        return "_*"
+    state.boldItalicOpened = True
+    return "*_"
+
+
+def emitTokens(tokenList, emitters, state):
+    """
+    Returns the converted message, made by joining the output of the emitter for each token's type.
+    Tokens without an emitter are dropped.
+
+    :param tokenList: Tokens of the message
+    :type tokenList: List of MarkdownTokens
+
+    :param emitters: Each token type to a function taking the token value and the message state, returning a string
+    :type emitters: Dictionary
+
+    :param state: State of the message being emitted
+    :type state: MessageState
+    """
+    return ''.join([emitters.get(tok.type, emitNothing)(tok.value, state) for tok in tokenList])
+
+
+def generateLextabs():
+    """
+    Write the lexer tables for both markdown converters into the integration/markdown/ directory, for a faster cold start.
+    """
+    from integration.markdown.toSlack import SlackTokens
+    from integration.markdown.toZulip import ZulipTokens
+
+    for tokenRules, lextab in [(ZulipTokens, 'zulipLextab'), (SlackTokens, 'slackLextab')]:
+        tokenRules.lexer.writetab(lextabName(lextab, vars(tokenRules)), os.path.dirname(__file__))
+
+
+if __name__ == '__main__':
+    generateLextabs()
@@ -1,22 +1,16 @@
-import json
 import re
 import ply.lex as lex
 from flask_login import current_user
-from integration.markdown.emojis.shortCodeDict import zulipToSlackDict
-from integration.utilities import parseZulipRC
+from integration.markdown import conversionCache
+from integration.markdown.conversionContext import userContext
+from integration.markdown.markdownEngine import MarkdownToken, MessageState, lextabOptions, messageTokens, sanitiseBoldItalicStrike, \
+    emitTokens, emitText, emitBoldItalic, keepValue
 
 
-def slackMarkdown(message):
+class SlackTokens:
     """
-    Converts from slack specific markdown to Zulip markdown.
-
-    :param message: Message from Zulip event
-    :type message: String
+    Token definitions for Zulip markdown, the lexer built from these rules is shared by every SlackConverter.
     """
-
-    boldCount, italicCount, strikeCount, biCount, multiBlockCount = 0, 0, 0, 0, 0
-    parsedList = []
-
     tokens = [
         'EMOJI',
         'NEWLINE',
@@ -53,197 +47,239 @@ def slackMarkdown(message):
     def t_error(t):
         pass
 
-    lexer = lex.lex(reflags=re.MULTILINE)
+    # built once from the definitions above, in the order they are written, and cloned for each message
+    lexer = lex.lex(reflags=re.MULTILINE, **lextabOptions('slackLextab', locals()))
 
-    # The Zulip message as input
-    lexer.input(message)
-    linkList = []
 
+slackLexer = SlackTokens.lexer
 
-    # go through each token and add to the final string
-    def parseToken(currentToken):
-        """
-        Returns a string based on the token type
+# characters and line starts that can begin a Zulip markdown token, a message without any of these is converted to itself
+zulipMarkup = re.compile(r"[*~`>:\[]|^[ ]*[\-\+][ ]|^[ ]{0,3}1\.[ ]|^[ ]{4}", re.MULTILINE)
 
-        :param currentToken: Token object generated by the lexer
-        :type currentToken: Token object
-        """
-        # get the type and value of the current token
-        Ttype = currentToken['type']
-        value = currentToken['value']
-
-        # perform a certain action depending on the type of token
-        if Ttype == 'BOLD':
-            return "*"
-        elif Ttype == "EMOJI":
-            if current_user.emojiAdditions == "{}":
-                return zulipToSlackDict().get(value, '')
-            else:
-                updateDict = zulipToSlackDict()
-                updateDict.update({value: key for key, value in json.loads(current_user.emojiAdditions).items()})
-                return updateDict.get(value, '')
-        elif Ttype == 'ITALIC':
-            return "_"
-        elif Ttype == 'STRIKE':
-            return "~"
-        elif Ttype == 'SPACE':
-            return value
-        elif Ttype == 'NEWLINE':
-            return value
-        elif Ttype == 'DOUBLELINE':
-            return value
-        elif Ttype == 'STRING':
-            return value
-        elif Ttype == 'LINK':
-            filename = value[1:value.find("]")]
-            fileurl = value[value.find("]") + 2:-1]
-
-            # if the link isn't a user_upload
-            if not fileurl.startswith("/user_uploads"):
-                # return the url
-                return "<" + fileurl + "|" + slackMarkdown(filename)[0] + ">"
-
-            # otherwise add the user upload to the linkList
-            linkList.append((filename, parseZulipRC(current_user.zulipBotRC)['site'] + fileurl))
-
-        elif Ttype == 'MULTILINEBLOCK':
-            return '```'
-
-        elif Ttype == 'BULLETLIST':
-            # remove all spaces and collect only the text in the list
-            splitValue = slackMarkdown(' '.join(value.strip().split()[1:]))[0]
-            return '• ' + splitValue
-
-        elif Ttype == 'NUMBERLIST':
-            # apply markdown conversion to the values after the numbers
-            return str(value.split()[0]) + ' ' + slackMarkdown(' '.join(value.strip().split()[1:]))[0]
-
-        elif Ttype == 'QUOTE':
-            if value.find('>') != -1:
-                return ">" + value[value.find('>') + 1:]
-            return ">" + value
-
-        elif Ttype == 'SINGLELINEBLOCK':
-            # ```testing``` = `testing` or ~~~testing~~~ = 'testing'
-            if value[:2] in ['``', '~~']:
-                return '`' + value[3:-3] + '`'
-
-            # if the first 4 characters are spaces then
-            elif value[:4] == ' ' * 4:
-                return '`' + value[4:] + '`'
-
-            return value
-
-        elif Ttype == 'BOLDITALIC':
-            if parsedList.count("*_") % 2 == 1:
-                return "_*"
-            return "*_"
-
-        return ""
-
-    tokenList = []
-
-    while True:
-        tok = lexer.token()
-        # end while loop
-        if not tok:
-            break
-
-        # converts tok object into a simple dictionary, with key as the type and value as the value e.g. {'STRING', 'this is a string token'}
-        tok = {'type': tok.__dict__['type'], 'value': tok.__dict__['value']}
-
-        # count the number of occurrences of bold, italic and strike
-        if tok['type'] == 'BOLD':
-            boldCount += 1
-        elif tok['type'] == 'ITALIC':
-            italicCount += 1
-        elif tok['type'] == 'STRIKE':
-            strikeCount += 1
-        elif tok['type'] == 'BOLDITALIC':
-            biCount += 1
-        elif tok['type'] == 'MULTILINEBLOCK':
-            multiBlockCount += 1
-
-        tokenList.append(tok)
-
-
-    def santiseBoldItalicStrike(tokenType):
+
+def convertQuoteBlocks(tokenList):
+    """
+    Replace ```quote blocks with Slack quotes, the block tags are emptied and every line inside the block starts with a quote.
+    Returns the new list of tokens.
+
+    :param tokenList: Tokens of the message
+    :type tokenList: List of MarkdownTokens
+    """
+    quotedList = []
+    inQuote = False
+
+    for count, tok in enumerate(tokenList):
+        if tok.type == 'MULTILINEBLOCK':
+            splitValue = tok.value.split()
+
+            if len(splitValue) == 1: splitValue.append(' ')
+            # any block tag closes the quote, only a quote tag opens one
+            if inQuote or splitValue[0] in ['```quote', '~~~quote'] or splitValue[1] == 'quote':
+                tok.type = 'STRING'
+                tok.value = ''
+                inQuote = not inQuote
+
+        quotedList.append(tok)
+
+        # if the token is a newline and the next token is not a multiline block then add quote token
+        if inQuote and tok.type == 'NEWLINE' and count + 1 < len(tokenList) and tokenList[count + 1].type != "MULTILINEBLOCK":
+            quotedList.append(MarkdownToken('STRING', '>'))
+
+    return quotedList
+
+
+def extendQuotes(tokenList):
+    """
+    Start every line before the first double line with a quote, returns the new list of tokens.
+
+    :param tokenList: Tokens of the message
+    :type tokenList: List of MarkdownTokens
+    """
+    quotedList = []
+
+    for count, quoteTok in enumerate(tokenList):
+        if quoteTok.type == 'DOUBLELINE':
+            return quotedList + tokenList[count:]
+
+        quotedList.append(quoteTok)
+        if quoteTok.type == 'NEWLINE' and count + 1 < len(tokenList) and tokenList[count + 1].type != "QUOTE":
+            quotedList.append(MarkdownToken('QUOTE', '>'))
+
+    return quotedList
+
+
+def numberListLines(tokenList):
+    """
+    Number every line after the first, up to the first double line, counting up from 2.
+
+    :param tokenList: Tokens of the message
+    :type tokenList: List of MarkdownTokens
+    """
+    lineCounter = 2
+
+    for count, numListTok in enumerate(tokenList):
+        if numListTok.type == 'DOUBLELINE': break
+        elif numListTok.type == 'NEWLINE' and count + 1 < len(tokenList):
+            tokenList[count + 1] = MarkdownToken('NUMBERLIST', str(lineCounter) + '. ' + ' '.join(tokenList[count + 1].value.split()[1:]))
+            lineCounter += 1
+
+
+def bulletListLines(tokenList):
+    """
+    Turn indented lines up to the first double line into bullet list lines.
+
+    :param tokenList: Tokens of the message
+    :type tokenList: List of MarkdownTokens
+    """
+    for count, numListTok in enumerate(tokenList):
+        if numListTok.type == 'DOUBLELINE': break
+        if numListTok.type == 'NEWLINE' and count + 1 < len(tokenList) and tokenList[count + 1].type == 'SINGLELINEBLOCK':
+            tokenList[count + 1].type = 'BULLETLIST'
+
+
+def emitEmoji(value, state):
+    return state.converter.context.emojis.zulipToSlack.get(value, '')
+
+
+def emitLink(value, state):
+    filename = value[1:value.find("]")]
+    fileurl = value[value.find("]") + 2:-1]
+
+    # if the link isn't a user_upload
+    if not fileurl.startswith("/user_uploads"):
+        # return the url
+        return "<" + fileurl + "|" + state.converter.convert(filename)[0] + ">"
+
+    # otherwise add the user upload to the files of the message
+    state.files.append((filename, state.converter.context.zulipSite + fileurl))
+    return ""
+
+
+def emitBulletList(value, state):
+    # remove all spaces and collect only the text in the list
+    splitValue = state.converter.convert(' '.join(value.strip().split()[1:]))[0]
+    return '• ' + splitValue
+
+
+def emitNumberList(value, state):
+    # apply markdown conversion to the values after the numbers
+    return str(value.split()[0]) + ' ' + state.converter.convert(' '.join(value.strip().split()[1:]))[0]
+
+
+def emitQuote(value, state):
+    if value.find('>') != -1:
+        return ">" + value[value.find('>') + 1:]
+    return ">" + value
+
+
+def emitSingleLineBlock(value, state):
+    # ```testing``` = `testing` or ~~~testing~~~ = 'testing'
+    if value[:2] in ['``', '~~']:
+        return '`' + value[3:-3] + '`'
+
+    # if the first 4 characters are spaces then
+    elif value[:4] == ' ' * 4:
+        return '`' + value[4:] + '`'
+
+    return value
+
+
+# the Slack markdown emitted for each type of Zulip token
+slackEmitters = {
+    'BOLD': emitText("*"),
+    'EMOJI': emitEmoji,
+    'ITALIC': emitText("_"),
+    'STRIKE': emitText("~"),
+    'SPACE': keepValue,
+    'NEWLINE': keepValue,
+    'DOUBLELINE': keepValue,
+    'STRING': keepValue,
+    'LINK': emitLink,
+    'MULTILINEBLOCK': emitText('```'),
+    'BULLETLIST': emitBulletList,
+    'NUMBERLIST': emitNumberList,
+    'QUOTE': emitQuote,
+    'SINGLELINEBLOCK': emitSingleLineBlock,
+    'BOLDITALIC': emitBoldItalic,
+}
+
+
+class SlackConverter:
+    """
+    Converts Zulip markdown to Slack markdown for a conversion context. Converters do not use the Flask request, so they
+    can be used from worker threads or pickled and sent to worker processes.
+
+    :param context: The user the messages are converted for
+    :type context: ConversionContext
+
+    :param cache: Cache of converted messages to use, by default messages are not cached
+    :type cache: ConversionCache
+    """
+    def __init__(self, context, cache=None):
+        self.context = context
+        self.cache = cache
+
+    def convert(self, message):
         """
-        Prevent bold, italic and strike tokens spanning multiple lines without being ended,
-        e.g. `*bold\n*` -> `*bold\n*`
+        Converts from Zulip specific markdown to Slack markdown, returns a tuple of the message and a list of files.
 
-        :param tokenType: Name of token that requires sanitisation
-        :type tokenType: String
+        :param message: Message from Zulip event
+        :type message: String
         """
-        for _ in tokenList:
-            sanitiseList = []
-            for i, token in enumerate(tokenList):
-                if token['type'] == tokenType: sanitiseList.append(i)
-                if (token['type'] == 'NEWLINE' or i == len(tokenList)-1) and (len(sanitiseList) % 2 == 1 and len(sanitiseList) > 0): tokenList[sanitiseList[-1]]['type'] = 'STRING'
+        # messages without any Zulip markdown are already valid Slack messages
+        if not zulipMarkup.search(message):
+            return message, []
 
+        # a result depends on the emoji overlay and the Zulip site of uploaded files as well as the message
+        if self.cache is not None:
+            key = ('toSlack', message, self.context.emojis.version, self.context.zulipSite)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
 
-    # remove multiline tokens as these aren't allowed in Slack or Zulip
-    [santiseBoldItalicStrike(tokType) for tokType in ['BOLD', 'ITALIC', 'STRIKE', 'BOLDITALIC']]
+        tokenList = list(messageTokens(slackLexer.clone(), message))
 
-    # Implementation of ```quote to Slack Quotes
-    for counter, tok in enumerate(tokenList):
-        if tok['type'] == 'MULTILINEBLOCK':
-            splitValue = tok['value'].split()
+        # remove multiline tokens as these aren't allowed in Slack or Zulip
+        [sanitiseBoldItalicStrike(tokenList, tokType) for tokType in ['BOLD', 'ITALIC', 'STRIKE', 'BOLDITALIC']]
 
-            if len(splitValue) == 1: splitValue.append(' ')
-            if splitValue[0] in ['```quote', '~~~quote'] or splitValue[1] == 'quote':
-                tok['type'] = 'STRING'
-                tok['value'] = ''
-                occuredAt = counter
-
-                for count, blockTok in enumerate(tokenList):
-                    if count > occuredAt:
-                        if blockTok['type'] == 'MULTILINEBLOCK':
-                            blockTok['type'] = 'STRING'
-                            blockTok['value'] = ''
-                            break
-
-                        # if the token is a newline and the next token is not a multiline block then add quote token
-                        elif blockTok['type'] == 'NEWLINE' and count + 1 < len(tokenList) and tokenList[count + 1]['type'] != "MULTILINEBLOCK":
-                            tokenList.insert(count + 1, {'type': 'STRING', 'value': '>'})
-    
-
-    # Modify quotes to add after each line a quote e.g. >4\n3\n2\n\n1 to >4\n>3\n>2\n\n1
-    for tok in tokenList:
-        if tok['type'] == 'QUOTE':
-            for count, quoteTok in enumerate(tokenList):
-                if quoteTok['type'] == 'DOUBLELINE': break
-                elif quoteTok['type'] == 'NEWLINE' and count + 1 < len(tokenList) and tokenList[count + 1]['type'] != "QUOTE":
-                    tokenList.insert(count + 1, {'type': 'QUOTE', 'value': '>'})
-
-
-    # For numbered quotes change to incremental values
-    for tok in tokenList:
-        if tok['type'] == 'NUMBERLIST':
-            lineCounter = 2
-
-            for count, numListTok in enumerate(tokenList):
-                if numListTok['type'] == 'DOUBLELINE': break
-                elif numListTok['type'] == 'NEWLINE' and count + 1 < len(tokenList):
-                    tokenList[count + 1] = {'type': 'NUMBERLIST', 'value': str(lineCounter) + '. ' + ' '.join(tokenList[count + 1]['value'].split()[1:])}
-                    lineCounter += 1
-
-
-    # For bullet lists e.g. - a\n- b\n    - c to - a\n- b\n- c
-    for tok in tokenList:
-        if tok['type'] == 'BULLETLIST':
-            for count, numListTok in enumerate(tokenList):
-                if numListTok['type'] == 'DOUBLELINE': break
-                if numListTok['type'] == 'NEWLINE' and count + 1 < len(tokenList) and tokenList[count + 1]['type'] == 'SINGLELINEBLOCK':
-                    tokenList[count + 1]['type'] = 'BULLETLIST'
-
-
-    # Force new line to the beginning of the message
-    if len(tokenList) > 1 and tokenList[0]['type'] in ['QUOTE', 'MULTILINEQUOTE', 'NUMBERLIST', 'BULLETLIST']:
-        tokenList.insert(0, {'type': 'NEWLINE', 'value': '\n'})
-
-    for tok in tokenList:
-        parsedList.append(parseToken(tok))
-
-    # return a tuple with a Slack formatted message and a list of files
-    return ''.join(parsedList), linkList
+        # Implementation of ```quote to Slack Quotes
+        tokenList = convertQuoteBlocks(tokenList)
+
+        # Modify quotes to add after each line a quote e.g. >4\n3\n2\n\n1 to >4\n>3\n>2\n\n1
+        if any(tok.type == 'QUOTE' for tok in tokenList):
+            tokenList = extendQuotes(tokenList)
+
+        # For numbered quotes change to incremental values
+        if any(tok.type == 'NUMBERLIST' for tok in tokenList):
+            numberListLines(tokenList)
+
+        # For bullet lists e.g. - a\n- b\n    - c to - a\n- b\n- c
+        if any(tok.type == 'BULLETLIST' for tok in tokenList):
+            bulletListLines(tokenList)
+
+
+        # Force new line to the beginning of the message
+        if len(tokenList) > 1 and tokenList[0].type in ['QUOTE', 'MULTILINEQUOTE', 'NUMBERLIST', 'BULLETLIST']:
+            tokenList.insert(0, MarkdownToken('NEWLINE', '\n'))
+
+        state = MessageState(self)
+        slackMessage = emitTokens(tokenList, slackEmitters, state)
+
+        if self.cache is not None:
+            self.cache.set(key, (slackMessage, state.files))
+
+        # return a tuple with a Slack formatted message and a list of files
+        return slackMessage, state.files
+
+
+def slackMarkdown(message, context=None):
+    """
+    Converts from Zulip specific markdown to Slack markdown.
+
+    :param message: Message from Zulip event
+    :type message: String
+
+    :param context: The user the message is converted for, by default the current_user of the request
+    :type context: ConversionContext
+    """
+    return SlackConverter(context or userContext(current_user), conversionCache.defaultCache).convert(message)
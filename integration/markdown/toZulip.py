@@ -1,23 +1,19 @@
-import json
 import re
 import ply.lex as lex
 from flask import session
 from flask_login import current_user
-from requests import get
-from integration.markdown.emojis.shortCodeDict import slackToZulipDict
+from integration.markdown.conversionContext import userContext
+from integration.markdown import conversionCache, linkValidation
+from integration.markdown.linkValidation import validateLinks, TRUST
+from integration.markdown.markdownEngine import MarkdownToken, MessageState, lextabOptions, messageTokens, sanitiseBoldItalicStrike, \
+    emitTokens, emitText, emitBoldItalic, keepValue
 import html
 
-def zulipMarkdown(message):
-    """
-    Converts from slack specific markdown to zulip markdown.
 
-    :param message: message from slack event
-    :type message: string
+class ZulipTokens:
+    """
+    Token definitions for Slack markdown, the lexer built from these rules is shared by every ZulipConverter.
     """
-
-    boldCount, italicCount, strikeCount, multiBlockCount = 0,0,0,0
-    message = html.unescape(message)
-
     # tokens used for simple markdown conversion
     tokens = [
         'EMOJI',
@@ -57,144 +53,213 @@ def zulipMarkdown(message):
     def t_error(t):
         pass
 
-    lexer = lex.lex(reflags=re.MULTILINE)
+    # built once from the definitions above, in the order they are written, and cloned for each message
+    lexer = lex.lex(reflags=re.MULTILINE, **lextabOptions('zulipLextab', locals()))
+
+
+zulipLexer = ZulipTokens.lexer
+
+# characters that can start a Slack markdown token, a message without any of these is converted to itself
+slackMarkup = re.compile(r"[*_~`<>:]|^[ ]*[\-\+\•]", re.MULTILINE)
+
+
+def separateMultilineBlocks(tokenList):
+    """
+    Add newlines before and after the multiline block tags, returns the new list of tokens.
+    A block tag that is not followed by a newline gets one after it, and one before it with the token before it made a STRING.
+    When the block starts the message the last token is made a STRING instead, or separated from a closing tag.
+
+    The tokens are linked to their neighbours while walking through them, so each newline is added in constant time.
+
+    :param tokenList: Tokens of the message
+    :type tokenList: List of MarkdownTokens
+    """
+    if not tokenList:
+        return tokenList
+
+    tokens = list(tokenList)
+    before = list(range(-1, len(tokens) - 1))
+    after = list(range(1, len(tokens) + 1))
+    after[-1] = -1
+    first, last = 0, len(tokens) - 1
+
+    def addNewline(previous, following):
+        nonlocal first, last
+        tokens.append(MarkdownToken('NEWLINE', '\n'))
+        newline = len(tokens) - 1
+        before.append(previous)
+        after.append(following)
+
+        if previous == -1:
+            first = newline
+        else:
+            after[previous] = newline
+        if following == -1:
+            last = newline
+        else:
+            before[following] = newline
+
+    current = first
+    while current != -1:
+        following = after[current]
+        if tokens[current].type == 'MULTILINEBLOCK' and following != -1 and tokens[following].type != 'NEWLINE':
+            addNewline(current, following)
+
+            if current == first:
+                # the block starts the message, compare against the last token
+                if tokens[last].type == 'MULTILINEBLOCK':
+                    if tokens[before[last]].type != 'NEWLINE':
+                        addNewline(before[last], last)
+                else:
+                    tokens[last].type = 'STRING'
+                    addNewline(-1, current)
+
+            else:
+                previous = before[current]
+                if tokens[previous].type == 'MULTILINEBLOCK':
+                    # the token before a block at the start of the message is the last token
+                    beforePrevious = before[previous] if previous != first else last
+                    if tokens[beforePrevious].type != 'NEWLINE':
+                        addNewline(before[previous], previous)
+                else:
+                    tokens[previous].type = 'STRING'
+                    addNewline(previous, current)
+
+        current = after[current]
+
+    separatedList = []
+    current = first
+    while current != -1:
+        separatedList.append(tokens[current])
+        current = after[current]
+
+    return separatedList
+
+
+def emitEmoji(value, state):
+    return state.converter.context.emojis.slackToZulip.get(value, '')
+
+
+def emitSimpleLink(value, state):
+    # if the link captured is valid then return it
+    if state.validLinks.get(value[1:-1]):
+        return value[1:-1]
+    return value
+
+
+def emitComplexLink(value, state):
+    # split at pipe
+    pipe = value.find("|")
+    beforePipe = value[1:pipe]
+    afterPipe = value[pipe+1:-1]
+
+    # if the before and after pipes are both urls e.g. <http://www.google.com|www.google.com>
+    if beforePipe.startswith("https://") or beforePipe.startswith("http://"):
+        return "[" + state.converter.convert(afterPipe)[0] + "]" + "(" + beforePipe + ")"
+    return ""
+
 
-    # The Slack message as input
-    lexer.input(message)
-    parsedList = []
+def emitStripped(value, state):
+    return value.strip()
 
 
-    def parseToken(currentToken):
+def emitList(value, state):
+    splitValue = state.converter.convert(''.join(value.strip())[1:])[0]
+    return '- ' + splitValue.strip()
+
+
+# the Zulip markdown emitted for each type of Slack token
+zulipEmitters = {
+    'BOLD': emitText("**"),
+    'EMOJI': emitEmoji,
+    'ITALIC': emitText("*"),
+    'STRIKE': emitText("~~"),
+    'SIMPLELINK': emitSimpleLink,
+    'COMPLEXLINK': emitComplexLink,
+    'SPACE': keepValue,
+    'NEWLINE': keepValue,
+    'DOUBLELINE': keepValue,
+    'SINGLELINEBLOCK': keepValue,
+    'MULTILINEBLOCK': emitStripped,
+    'QUOTE': emitStripped,
+    'LIST': emitList,
+    'STRING': keepValue,
+    'BOLDITALIC': emitBoldItalic,
+}
+
+
+class ZulipConverter:
+    """
+    Converts Slack markdown to Zulip markdown for a conversion context. Converters do not use the Flask request, so they
+    can be used from worker threads or pickled and sent to worker processes.
+
+    :param context: The user the messages are converted for
+    :type context: ConversionContext
+
+    :param cache: Cache of converted messages to use, by default messages are not cached
+    :type cache: ConversionCache
+    """
+    def __init__(self, context, cache=None):
+        self.context = context
+        self.cache = cache
+
+    def convert(self, message):
         """
-        Returns a string based on the token type
+        Converts from slack specific markdown to zulip markdown, returns a tuple of the message and a list of files.
 
-        :param currentToken: Token object generated by the lexer
-        :type currentToken: Token object
+        :param message: message from slack event
+        :type message: string
         """
-        # get the type and value of the current token
-        Ttype = currentToken['type']
-        value = currentToken['value']
-
-        # perform a certain action depending on the type of token
-        if Ttype == 'BOLD':
-            return "**"
-        elif Ttype == 'EMOJI':
-            if current_user.emojiAdditions == "{}":
-                return slackToZulipDict().get(value, '')
-            else:
-                updateDict = slackToZulipDict()
-                updateDict.update(json.loads(current_user.emojiAdditions))
-                return updateDict.get(value, '')
-        elif Ttype == 'ITALIC':
-            return "*"
-        elif Ttype == 'STRIKE':
-            return "~~"
-        elif Ttype == 'SIMPLELINK':
-            try:
-                # if the link captured is valid then return it
-                if get(value[1:-1]).status_code == 200:
-                    return value[1:-1]
-            except:
-                return value
-
-        elif Ttype == 'COMPLEXLINK':
-            # split at pipe
-            pipe = value.find("|")
-            beforePipe = value[1:pipe]
-            afterPipe = value[pipe+1:-1]
-
-            # if the before and after pipes are both urls e.g. <http://www.google.com|www.google.com>
-            if beforePipe.startswith("https://") or beforePipe.startswith("http://"):
-                    return "[" + zulipMarkdown(afterPipe)[0] + "]" + "(" + beforePipe + ")"
-
-        elif Ttype == 'SPACE':
-            return value
-        elif Ttype == 'NEWLINE':
-            return value
-        elif Ttype == 'DOUBLELINE':
-            return value
-        elif Ttype == 'SINGLELINEBLOCK':
-            return value
-        elif Ttype == 'MULTILINEBLOCK':
-            return value.strip()
-        elif Ttype == 'QUOTE':
-            return value.strip()
-        elif Ttype == 'LIST':
-            splitValue = zulipMarkdown(''.join(value.strip())[1:])[0]
-            return '- ' + splitValue.strip()
-        elif Ttype == 'STRING':
-            return value
-        elif Ttype == 'BOLDITALIC':
-            if parsedList.count("*_") % 2 == 1:
-                return "_*"
-            return "*_"
-
-        return ""
-
-    tokenList = []
-
-    while True:
-        tok = lexer.token()
-        if not tok:
-            break
-
-        # converts tok object into a simple dictionary, with key as the type and value as the value e.g. {'STRING', 'this is a string token'}
-        tok = {'type': tok.__dict__['type'], 'value': tok.__dict__['value']}
-
-        # count the number of occurrences of bold, italic and strike
-        if tok['type'] == 'BOLD':
-            boldCount += 1
-        elif tok['type'] == 'ITALIC':
-            italicCount += 1
-        elif tok['type'] == 'STRIKE':
-            strikeCount += 1
-        elif tok['type'] == 'MULTILINEBLOCK':
-            multiBlockCount += 1
-
-        tokenList.append(tok)
-
-
-    def santiseBoldItalicStrike(tokenType):
-        '''
-        Prevent bold, italic and strike tokens spanning multiple lines without being ended.
-
-        :param tokenType: Name of token that requires sanitisation
-        :type tokenType: String
-        '''
-        for _ in tokenList:
-            sanitiseList = []
-            for i, token in enumerate(tokenList):
-                if token['type'] == tokenType: sanitiseList.append(i)
-                if (token['type'] == 'NEWLINE' or i == len(tokenList) - 1) and len(sanitiseList) % 2 == 1 and len(sanitiseList) > 0:
-                    tokenList[sanitiseList[-1]]['type'] = 'STRING'
-
-
-    # remove multiline tokens as these aren't allowed in Slack or Zulip
-    [santiseBoldItalicStrike(tokType) for tokType in ['BOLD', 'ITALIC', 'STRIKE', 'BOLDITALIC']]
-
-    # Add newlines before and after the multiline block tags
-    for count, tok in enumerate(tokenList):
-        if tok['type'] == 'MULTILINEBLOCK':
-            # if the token is a MULTILINEBLOCK then check to see if the next token is a newline
-            if count + 1 < len(tokenList) and tokenList[count + 1]['type'] != "NEWLINE":
-                tokenList.insert(count + 1, {'type': 'NEWLINE', 'value': '\n'})
-
-                # for all token after the multi line block
-                for i in range(count-1, len(tokenList)):
-                    if tokenList[i]['type'] == 'MULTILINEBLOCK':
-                        if tokenList[i-1]['type'] != 'NEWLINE':
-                            tokenList.insert(i, {'type': 'NEWLINE', 'value': '\n'})
-                        break
-
-                    tokenList[i]['type'] = 'STRING'
-
-    # Force new line to the beginning of the message
-    if len(tokenList) > 1 and tokenList[0]['type'] in ['LIST', 'QUOTE', 'MULTILINEBLOCK']:
-        tokenList.insert(0, {'type': 'NEWLINE', 'value': '\n'})
-
-    # add each parsed token to a list to be returned
-    for tok in tokenList:
-        parsedList.append(parseToken(tok))
-
-    # return a tuple with a Slack formatted message and a list of files
-    return ''.join(parsedList), []
+        message = html.unescape(message)
+
+        # messages without any Slack markdown are already valid Zulip messages
+        if not slackMarkup.search(message):
+            return message, []
+
+        # a result depends on the emoji overlay and the link mode as well as the message
+        linkMode = self.context.linkMode or linkValidation.defaultMode
+        if self.cache is not None:
+            key = ('toZulip', message, self.context.emojis.version, linkMode)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        tokenList = list(messageTokens(zulipLexer.clone(), message))
+
+        # remove multiline tokens as these aren't allowed in Slack or Zulip
+        [sanitiseBoldItalicStrike(tokenList, tokType) for tokType in ['BOLD', 'ITALIC', 'STRIKE', 'BOLDITALIC']]
+
+        # Add newlines before and after the multiline block tags
+        tokenList = separateMultilineBlocks(tokenList)
+
+        # Force new line to the beginning of the message
+        if len(tokenList) > 1 and tokenList[0].type in ['LIST', 'QUOTE', 'MULTILINEBLOCK']:
+            tokenList.insert(0, MarkdownToken('NEWLINE', '\n'))
+
+        # check all the links in the message at the same time
+        validLinks = {}
+        linkTokens = [tok.value[1:-1] for tok in tokenList if tok.type == 'SIMPLELINK']
+        if linkTokens:
+            validLinks = validateLinks(linkTokens, linkMode)
+
+        zulipMessage = emitTokens(tokenList, zulipEmitters, MessageState(self, validLinks))
+
+        # links go up and down, so results that depended on checking them are not cached
+        if self.cache is not None and (not linkTokens or linkMode == TRUST):
+            self.cache.set(key, (zulipMessage, []))
+
+        # return a tuple with a Zulip formatted message and a list of files
+        return zulipMessage, []
+
+
+def zulipMarkdown(message, context=None):
+    """
+    Converts from slack specific markdown to zulip markdown.
+
+    :param message: message from slack event
+    :type message: string
+
+    :param context: The user the message is converted for, by default the current_user of the request
+    :type context: ConversionContext
+    """
+    return ZulipConverter(context or userContext(current_user), conversionCache.defaultCache).convert(message)
@@ -0,0 +1,110 @@
+from integration.slackRateLimit import slackRequest
+
+# number of items asked for in each page, Slack recommends no more than 200
+SLACK_PAGE_SIZE = 200
+
+# seconds before a listing that failed is tried again, so a rate limited listing is not repeated on every event
+REFRESH_BACKOFF = 30
+
+
+class SlackAPIError(Exception):
+    """
+    Raised when Slack does not return a page of a list, so a partial list is never mistaken for the whole list.
+
+    :param method: Slack API method that failed e.g. conversations.list
+    :type method: String
+
+    :param error: Error returned by Slack
+    :type error: String
+    """
+    def __init__(self, method, error):
+        super().__init__(method + ": " + str(error))
+        self.method = method
+        self.error = error
+
+
+def slackCursorPages(method, token, key, params=None, pageSize=SLACK_PAGE_SIZE, cursor=""):
+    """
+    Follow the cursor of a Slack list method from a given cursor, yielding the list of items in each page along with the
+    cursor of the page after it, which is empty after the last page. A list read in part can be continued from the cursor.
+
+    :param method: Slack API method e.g. conversations.list
+    :type method: String
+
+    :param token: Slack token used to authenticate
+    :type token: String
+
+    :param key: Key of the list of items in each response e.g. channels
+    :type key: String
+
+    :param params: Query string parameters sent with every page
+    :type params: Dictionary
+
+    :param pageSize: Number of items asked for in each page
+    :type pageSize: Integer
+
+    :param cursor: Cursor of the first page to request, empty for the start of the list
+    :type cursor: String
+    """
+    while True:
+        pageParams = dict(params or {}, limit=pageSize)
+        if cursor:
+            pageParams['cursor'] = cursor
+
+        # pages go through the scheduler, so each stays within the method's rate limit and a 429 waits for its Retry-After
+        pageRequest = slackRequest('GET', method, token, pageParams).json()
+        if not pageRequest.get('ok'):
+            raise SlackAPIError(method, pageRequest.get('error'))
+
+        cursor = pageRequest.get('response_metadata', {}).get('next_cursor') or ""
+        yield pageRequest.get(key, []), cursor
+
+        if not cursor:
+            return
+
+
+def slackPages(method, token, key, params=None, pageSize=SLACK_PAGE_SIZE):
+    """
+    Follow the cursor of a Slack list method, yielding the list of items in each page. Each page is only requested once
+    the previous page has been used, so large workspaces are never loaded all at once.
+
+    :param method: Slack API method e.g. conversations.list
+    :type method: String
+
+    :param token: Slack token used to authenticate
+    :type token: String
+
+    :param key: Key of the list of items in each response e.g. channels
+    :type key: String
+
+    :param params: Query string parameters sent with every page
+    :type params: Dictionary
+
+    :param pageSize: Number of items asked for in each page
+    :type pageSize: Integer
+    """
+    for page, cursor in slackCursorPages(method, token, key, params, pageSize):
+        yield page
+
+
+def slackItems(method, token, key, params=None, pageSize=SLACK_PAGE_SIZE):
+    """
+    Follow the cursor of a Slack list method, yielding each item of every page in turn.
+
+    :param method: Slack API method e.g. conversations.list
+    :type method: String
+
+    :param token: Slack token used to authenticate
+    :type token: String
+
+    :param key: Key of the list of items in each response e.g. channels
+    :type key: String
+
+    :param params: Query string parameters sent with every page
+    :type params: Dictionary
+
+    :param pageSize: Number of items asked for in each page
+    :type pageSize: Integer
+    """
+    for page in slackPages(method, token, key, params, pageSize):
+        yield from page
@@ -0,0 +1,296 @@
+import asyncio
+from threading import Lock
+from time import monotonic, sleep
+from integration import asyncTransport
+from integration.transport import request
+from integration.utilities import slackHeader, slackURL
+
+# calls allowed each minute by each Slack rate limit tier, https://api.slack.com/docs/rate-limits
+TIER_LIMITS = {1: 1, 2: 20, 3: 50, 4: 100}
+
+# the tier of each Slack method used by the integration, methods not listed are given DEFAULT_TIER
+METHOD_TIERS = {
+    'conversations.archive': 2,
+    'conversations.create': 2,
+    'conversations.invite': 3,
+    'conversations.list': 2,
+    'conversations.members': 4,
+    'conversations.rename': 2,
+    'files.completeUploadExternal': 4,
+    'files.getUploadURLExternal': 4,
+    'files.upload': 2,
+    'users.list': 2,
+    'users.info': 4,
+}
+DEFAULT_TIER = 3
+
+# chat.postMessage is limited to about one message a second in each channel rather than by a tier
+POST_MESSAGE_LIMIT = 60
+
+# number of times a call is sent again after Slack answers 429 Too Many Requests
+MAX_RETRIES = 3
+
+
+class TokenBucket:
+    """
+    Token bucket holding up to capacity calls, refilled at ratePerMinute. Callers reserve a call and are told how long
+    to wait for it, so calls made while the bucket is empty are queued in the order they arrive.
+
+    :param ratePerMinute: Calls added to the bucket each minute
+    :type ratePerMinute: Integer
+
+    :param capacity: Calls the bucket can hold, by default a minute of calls
+    :type capacity: Integer
+    """
+    def __init__(self, ratePerMinute, capacity=None):
+        self.rate = ratePerMinute / 60
+        self.capacity = capacity or ratePerMinute
+        self.tokens = self.capacity
+        self.updated = monotonic()
+        self.pausedUntil = 0
+        self.lock = Lock()
+
+    def reserve(self):
+        """
+        Take a call from the bucket, returns the seconds to wait before making it.
+        """
+        with self.lock:
+            now = monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+            return max(wait, self.pausedUntil - now)
+
+    def pause(self, seconds):
+        """
+        Stop calls for a number of seconds after Slack asked for them to be slowed down, and empty the bucket.
+
+        :param seconds: Seconds from Slack's Retry-After header
+        :type seconds: Float
+        """
+        with self.lock:
+            self.pausedUntil = max(self.pausedUntil, monotonic() + seconds)
+            self.tokens = min(self.tokens, 0)
+
+
+class SlackScheduler:
+    """
+    Schedules calls to Slack so each method stays within its rate limit for each token. Calls over the limit are delayed
+    rather than sent, and calls Slack answers with 429 are sent again after its Retry-After.
+    """
+    def __init__(self):
+        self.buckets = {}
+        self.lock = Lock()
+        self.queued = 0
+        self.delayed = 0
+        self.throttled = 0
+        self.waited = 0.0
+
+    def bucket(self, token, apiMethod, channel=None):
+        """
+        Returns the token bucket of a Slack method for a token, and for chat.postMessage the channel posted to.
+
+        :param token: Slack token used to authenticate
+        :type token: String
+
+        :param apiMethod: Slack API method e.g. conversations.create
+        :type apiMethod: String
+
+        :param channel: Channel a message is posted to
+        :type channel: String
+        """
+        if apiMethod == 'chat.postMessage':
+            key, limit = (token, apiMethod, channel), POST_MESSAGE_LIMIT
+        else:
+            key, limit = (token, apiMethod), TIER_LIMITS[METHOD_TIERS.get(apiMethod, DEFAULT_TIER)]
+
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = TokenBucket(limit)
+            return bucket
+
+    def wait(self, bucket):
+        """
+        Wait until the bucket allows another call.
+
+        :param bucket: Bucket of the Slack method being called
+        :type bucket: TokenBucket
+        """
+        delay = bucket.reserve()
+        if delay <= 0:
+            return
+
+        with self.lock:
+            self.queued += 1
+            self.delayed += 1
+        try:
+            sleep(delay)
+        finally:
+            with self.lock:
+                self.queued -= 1
+                self.waited += delay
+
+    async def waitAsync(self, bucket):
+        """
+        Wait until the bucket allows another call without holding up the event loop.
+
+        :param bucket: Bucket of the Slack method being called
+        :type bucket: TokenBucket
+        """
+        delay = bucket.reserve()
+        if delay <= 0:
+            return
+
+        with self.lock:
+            self.queued += 1
+            self.delayed += 1
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            with self.lock:
+                self.queued -= 1
+                self.waited += delay
+
+    def call(self, httpMethod, apiMethod, token, params=None, channel=None, requestBody=None, **kwargs):
+        """
+        Call a Slack method once its rate limit allows, returns the response.
+        Takes the same keyword arguments as requests.request.
+
+        :param httpMethod: HTTP method e.g. GET
+        :type httpMethod: String
+
+        :param apiMethod: Slack API method e.g. chat.postMessage
+        :type apiMethod: String
+
+        :param token: Slack token used to authenticate
+        :type token: String
+
+        :param params: Query string parameters
+        :type params: Dictionary
+
+        :param channel: Channel a message is posted to, only used by chat.postMessage
+        :type channel: String
+
+        :param requestBody: Function returning keyword arguments for each attempt, so a streamed body is opened again when a call is retried
+        :type requestBody: Function
+        """
+        bucket = self.bucket(token, apiMethod, channel)
+        kwargs.setdefault('headers', slackHeader(token))
+
+        for attempt in range(MAX_RETRIES + 1):
+            self.wait(bucket)
+            attemptArgs = dict(kwargs, **requestBody()) if requestBody is not None else kwargs
+            response = request(httpMethod, slackURL(apiMethod, params), **attemptArgs)
+            if response.status_code != 429 or attempt == MAX_RETRIES:
+                return response
+
+            with self.lock:
+                self.throttled += 1
+            bucket.pause(retryAfter(response))
+
+    async def callAsync(self, httpMethod, apiMethod, token, params=None, channel=None, **kwargs):
+        """
+        Call a Slack method from asyncio once its rate limit allows, returns the response. Shares its buckets with call,
+        so synchronous and asyncio calls of a token are limited together.
+        Takes the same keyword arguments as requests.request.
+
+        :param httpMethod: HTTP method e.g. GET
+        :type httpMethod: String
+
+        :param apiMethod: Slack API method e.g. chat.postMessage
+        :type apiMethod: String
+
+        :param token: Slack token used to authenticate
+        :type token: String
+
+        :param params: Query string parameters
+        :type params: Dictionary
+
+        :param channel: Channel a message is posted to, only used by chat.postMessage
+        :type channel: String
+        """
+        bucket = self.bucket(token, apiMethod, channel)
+        kwargs.setdefault('headers', slackHeader(token))
+
+        for attempt in range(MAX_RETRIES + 1):
+            await self.waitAsync(bucket)
+            response = await asyncTransport.request(httpMethod, slackURL(apiMethod, params), **kwargs)
+            if response.status_code != 429 or attempt == MAX_RETRIES:
+                return response
+
+            with self.lock:
+                self.throttled += 1
+            bucket.pause(retryAfter(response))
+
+    def metrics(self):
+        """
+        Returns the number of calls waiting now, and the calls delayed, calls throttled by Slack and seconds waited so far.
+        """
+        with self.lock:
+            return {'queued': self.queued, 'delayed': self.delayed, 'throttled': self.throttled, 'waited': self.waited}
+
+
+def retryAfter(response):
+    """
+    Returns the seconds Slack asked to wait in the Retry-After header of a 429 response, 1 if it is missing.
+
+    :param response: Response from Slack
+    :type response: Response
+    """
+    try:
+        return max(float(response.headers['Retry-After']), 0)
+    except:
+        return 1
+
+
+slackScheduler = SlackScheduler()
+
+
+def slackRequest(httpMethod, apiMethod, token, params=None, channel=None, requestBody=None, **kwargs):
+    """
+    Call a Slack method through the shared scheduler, returns the response.
+
+    :param httpMethod: HTTP method e.g. GET
+    :type httpMethod: String
+
+    :param apiMethod: Slack API method e.g. chat.postMessage
+    :type apiMethod: String
+
+    :param token: Slack token used to authenticate
+    :type token: String
+
+    :param params: Query string parameters
+    :type params: Dictionary
+
+    :param channel: Channel a message is posted to, only used by chat.postMessage
+    :type channel: String
+
+    :param requestBody: Function returning keyword arguments for each attempt, so a streamed body is opened again when a call is retried
+    :type requestBody: Function
+    """
+    return slackScheduler.call(httpMethod, apiMethod, token, params, channel, requestBody, **kwargs)
+
+
+async def slackRequestAsync(httpMethod, apiMethod, token, params=None, channel=None, **kwargs):
+    """
+    Call a Slack method from asyncio through the shared scheduler, returns the response.
+
+    :param httpMethod: HTTP method e.g. GET
+    :type httpMethod: String
+
+    :param apiMethod: Slack API method e.g. chat.postMessage
+    :type apiMethod: String
+
+    :param token: Slack token used to authenticate
+    :type token: String
+
+    :param params: Query string parameters
+    :type params: Dictionary
+
+    :param channel: Channel a message is posted to, only used by chat.postMessage
+    :type channel: String
+    """
+    return await slackScheduler.callAsync(httpMethod, apiMethod, token, params, channel, **kwargs)
@@ -0,0 +1,114 @@
+from threading import Lock
+from urllib import parse
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# seconds allowed to connect to, and then to read from, Slack and Zulip when a request does not give its own timeout
+TIMEOUT = (5, 30)
+
+# number of hosts a session keeps pools for, and the number of connections kept open to each host
+POOL_CONNECTIONS = 4
+POOL_SIZE = 16
+
+# only connection failures are retried, as a request that reached Slack or Zulip may already have posted a message
+RETRY = Retry(total=3, connect=3, read=False, status=0, backoff_factor=0.3, raise_on_status=False)
+
+# the session of each host and credential, so every call to the same upstream reuses its keep-alive connections
+sessions = {}
+sessionsLock = Lock()
+
+
+def sessionKey(url, headers=None, auth=None):
+    """
+    Returns the key of the session used for a request, made from the scheme and host of the url and the credential sent.
+
+    :param url: Address the request is sent to
+    :type url: String
+
+    :param headers: Headers of the request, the Authorization header is the credential for Slack
+    :type headers: Dictionary
+
+    :param auth: Email and key of the request, the credential for Zulip
+    :type auth: Tuple
+    """
+    splitURL = parse.urlsplit(url)
+    credential = (headers or {}).get('Authorization') or auth
+    return splitURL.scheme, splitURL.netloc, credential
+
+
+def newSession():
+    """
+    Returns a session whose connections are pooled and retried as set by POOL_CONNECTIONS, POOL_SIZE and RETRY.
+    """
+    session = Session()
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_SIZE, max_retries=RETRY)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def transportSession(url, headers=None, auth=None):
+    """
+    Returns the pooled session for the host and credential of a request, creating it on first use.
+
+    :param url: Address the request is sent to
+    :type url: String
+
+    :param headers: Headers of the request
+    :type headers: Dictionary
+
+    :param auth: Email and key of the request
+    :type auth: Tuple
+    """
+    key = sessionKey(url, headers, auth)
+    session = sessions.get(key)
+    if session is None:
+        with sessionsLock:
+            session = sessions.get(key)
+            if session is None:
+                session = sessions[key] = newSession()
+    return session
+
+
+def closeSessions():
+    """
+    Close every pooled session and its connections, the next request to each host opens a new session.
+    """
+    with sessionsLock:
+        for session in sessions.values():
+            session.close()
+        sessions.clear()
+
+
+def request(method, url, **kwargs):
+    """
+    Send a request through the pooled session of its host and credential, with the default TIMEOUT if none is given.
+    Takes the same arguments as requests.request.
+
+    :param method: HTTP method e.g. GET
+    :type method: String
+
+    :param url: Address the request is sent to
+    :type url: String
+    """
+    kwargs.setdefault('timeout', TIMEOUT)
+    return transportSession(url, kwargs.get('headers'), kwargs.get('auth')).request(method, url, **kwargs)
+
+
+def get(url, params=None, **kwargs):
+    kwargs.setdefault('allow_redirects', True)
+    return request('GET', url, params=params, **kwargs)
+
+
+def head(url, **kwargs):
+    kwargs.setdefault('allow_redirects', False)
+    return request('HEAD', url, **kwargs)
+
+
+def post(url, data=None, json=None, **kwargs):
+    return request('POST', url, data=data, json=json, **kwargs)
+
+
+def patch(url, data=None, **kwargs):
+    return request('PATCH', url, data=data, **kwargs)
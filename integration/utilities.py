@@ -1,3 +1,9 @@
+from urllib import parse
+
+# base address of the Slack Web API, changed to point the integration at a stand-in Slack during tests
+SLACK_API = "https://slack.com/api/"
+
+
 def parseZulipRC(zulipRC):
     """
     Generate dictionary for Zulip API based on a given zulipRC.
@@ -19,4 +25,19 @@ def slackHeader(token):
     :param token: Unique identified for a user/bot in Slack
     :type token: String
     """
-    return {"Authorization": "Bearer " + token}
\ No newline at end of file
+    return {"Authorization": "Bearer " + token}
+
+
+def slackURL(method, params=None):
+    """
+    Generate the URL of a Slack Web API method, with the given parameters in the query string.
+
+    :param method: Slack API method e.g. conversations.list
+    :type method: String
+
+    :param params: Query string parameters
+    :type params: Dictionary
+    """
+    if params:
+        return SLACK_API + method + "?" + parse.urlencode(params)
+    return SLACK_API + method
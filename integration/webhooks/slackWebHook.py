@@ -1,9 +1,17 @@
-from urllib import parse
+from functools import partial
 from flask_login import current_user
-from integration.utilities import parseZulipRC, slackHeader
-from requests import get, post
+from integration.directories.slackChannels import channelDirectory
+from integration.directories.slackIdentity import botIdentity
+from integration.slackPagination import SlackAPIError, slackItems
+from integration.slackRateLimit import slackRequest, slackRequestAsync
+from integration.asyncTransport import blocking, bridgedUser, operationSlot, post, runSync
+from integration.fileRelay import TEXT_FIRST, MultipartStream, openDownloadAsync, relayFilesAsync, relayTimeout, sizedChunksAsync
+from integration.utilities import parseZulipRC
 from datetime import datetime
 
+# most users Slack accepts in one conversations.invite call
+INVITE_BATCH = 1000
+
 
 def channelNameToID(channelName):
     """
@@ -12,14 +20,200 @@ def channelNameToID(channelName):
     :param channelName: The channel name to be converted
     :type channelName: String
     """
-    slackAuth = slackHeader(current_user.slackToken)
+    return runSync(channelNameToIDAsync(channelName, bridgedUser(current_user)))
+
+
+async def channelNameToIDAsync(channelName, user=None):
+    """
+    Converts a Slack channel name to its corresponding channel ID value from asyncio.
+
+    :param channelName: The channel name to be converted
+    :type channelName: String
+
+    :param user: The user running the integration, current_user by default
+    :type user: User
+    """
+    user = bridgedUser(user or current_user)
+
+    # the directory is only listed on first use or when a name is missed, which is done on a worker thread
+    return await blocking(channelDirectory(user.slackToken).channelID, channelName)
+
+
+def ensureChannel(channel, token):
+    """
+    Create a Slack channel and invite the workspace to it, unless the channel is already known.
+    Concurrent messages to the same new channel wait for one creation rather than each creating it.
+    Returns False if the members could not be invited to a new channel.
+
+    :param channel: Name or ID of the channel
+    :type channel: String
+
+    :param token: Slack bot token of the workspace
+    :type token: String
+    """
+    directory = channelDirectory(token)
+    if directory.isKnown(channel):
+        return True
+
+    with directory.creationLock(channel):
+        # another message may have created the channel while this one waited
+        if directory.isKnown(channel):
+            return True
+
+        try:
+            createChannelRequest = slackRequest('GET', "conversations.create", token, {'name': channel}).json()
+            if not createChannelRequest.get('ok') or 'channel' not in createChannelRequest:
+                # the channel exists but is not in the directory, so the channels are listed again
+                if createChannelRequest.get('error') == 'name_taken':
+                    directory.refreshOnMiss()
+                return True
+
+            channelID = createChannelRequest['channel']['id']
+            directory.addChannel(channelID, createChannelRequest['channel']['name'])
+            return inviteMembers(channelID, token)
+        finally:
+            directory.created(channel)
+
+
+def inviteMembers(channelID, token):
+    """
+    Invite the members of the general channel to a channel, INVITE_BATCH users at a time.
+    Returns False if an invite failed.
+
+    :param channelID: ID of the channel to invite the members to
+    :type channelID: String
+
+    :param token: Slack bot token of the workspace
+    :type token: String
+    """
+    # get a list of all members in the general channel, the bot is already a member of channels it created
+    try:
+        userIDList = list(slackItems("conversations.members", token, 'members', {'channel': channelDirectory(token).channelID("general")}))
+    except SlackAPIError:
+        userIDList = []
+
+    # the identity is looked up once, a failed lookup is not cached and would otherwise be repeated for every member
+    botUserID = botIdentity(token).userID
+    userIDList = [userID for userID in userIDList if userID != botUserID]
+
+    for start in range(0, len(userIDList), INVITE_BATCH):
+        batch = userIDList[start:start + INVITE_BATCH]
+        inviteUsersRequest = slackRequest('POST', "conversations.invite", token, json={"channel": channelID, "users": ",".join(batch)}).json()
+
+        # the batch contains a user that created the channel therefore if a specific error with the inviteUsersRequest occurred try again
+        if inviteUsersRequest.get('error') == 'cant_invite_self':
+            # remove all users already added to the channel
+            conflictedUsers = [conflictedUser.get('user') for conflictedUser in inviteUsersRequest.get('errors', [])]
+            batch = [userID for userID in batch if userID not in conflictedUsers]
+            if not batch:
+                continue
+
+            # try the invite again
+            inviteUsersRequest = slackRequest('POST', "conversations.invite", token, json={"channel": channelID, "users": ",".join(batch)}).json()
+
+        if 'error' in inviteUsersRequest:
+            return False
+    return True
+
+
+async def uploadToSlack(filename, fileurl, deadline, zulipAuth, token):
+    """
+    Stream a Zulip file into Slack without sharing it, returns the ID of the uploaded file. The files of a message are
+    shared with the channel together by shareFiles.
+
+    :param filename: Name of the file
+    :type filename: String
+
+    :param fileurl: URL of the file in Zulip
+    :type fileurl: String
+
+    :param deadline: Seconds the file has to be relayed in
+    :type deadline: Float
+
+    :param zulipAuth: Email and key of the Zulip bot
+    :type zulipAuth: Dictionary
+
+    :param token: Slack bot token of the workspace
+    :type token: String
+    """
+    async with openDownloadAsync(fileurl, auth=(zulipAuth['email'], zulipAuth['key']), timeout=relayTimeout(deadline)) as download:
+        download.raise_for_status()
+
+        # Slack is told the size of the file before it is uploaded
+        chunks, size = await sizedChunksAsync(download, deadline)
+        uploadURLRequest = (await slackRequestAsync('GET', "files.getUploadURLExternal", token, {'filename': filename, 'length': size})).json()
+        if not uploadURLRequest.get('ok'):
+            raise SlackAPIError("files.getUploadURLExternal", uploadURLRequest.get('error'))
 
-    # channel list request
-    channelListRequest = get("https://slack.com/api/conversations.list?" + parse.urlencode({"exclude_archived": True, "limit": 1000}), headers=slackAuth)
-    channelListRequest = channelListRequest.json()
+        body, headers = MultipartStream('filename', filename, chunks, size).asyncBody()
+        (await post(uploadURLRequest['upload_url'], data=body, headers=headers, timeout=relayTimeout(deadline))).raise_for_status()
+        return uploadURLRequest['file_id']
 
-    # get a list of all the channel names and id's
-    return next((current['id'] for current in channelListRequest['channels'] if current['name'] == channelName), None)
+
+def channelIDOf(channel, token):
+    """
+    Returns the ID of a channel given its name or ID.
+
+    :param channel: Name or ID of the channel
+    :type channel: String
+
+    :param token: Slack bot token of the workspace
+    :type token: String
+    """
+    directory = channelDirectory(token)
+    if channel in directory.idToName:
+        return channel
+    return directory.channelID(channel) or channel
+
+
+async def shareFiles(channel, comment, files, fileIDs, token):
+    """
+    Share the uploaded files of a message with a channel in one message, in the order the files were sent. The comment
+    and a link to each file that could not be relayed are posted with them, or on their own if no file was uploaded.
+
+    :param channel: Name or ID of the channel
+    :type channel: String
+
+    :param comment: Text posted with the files, may be empty
+    :type comment: String
+
+    :param files: Name and Zulip URL of each file
+    :type files: List of Tuples
+
+    :param fileIDs: ID of each uploaded file, or the exception that stopped it being uploaded
+    :type fileIDs: List
+
+    :param token: Slack bot token of the workspace
+    :type token: String
+    """
+    uploaded = [{'id': fileID, 'title': filename} for (filename, fileurl), fileID in zip(files, fileIDs) if not isinstance(fileID, Exception)]
+    if uploaded:
+        shareRequest = {'files': uploaded, 'channel_id': await blocking(channelIDOf, channel, token)}
+        failed = fileFailures(files, fileIDs)
+        if comment or failed:
+            shareRequest['initial_comment'] = "\n".join(([comment] if comment else []) + failed)
+
+        if (await slackRequestAsync('POST', "files.completeUploadExternal", token, json=shareRequest)).json().get('ok'):
+            return True
+
+        # the files could not be shared, so every file is linked as not relayed
+        fileIDs = [SlackAPIError("files.completeUploadExternal", "not shared")] * len(files)
+
+    await slackRequestAsync('GET', "chat.postMessage", token, {'channel': channel, 'text': "\n".join(([comment] if comment else []) + fileFailures(files, fileIDs))}, channel=channel)
+    return False
+
+
+def fileFailures(files, fileIDs):
+    """
+    Returns a line linking each file of a message that could not be relayed, in the order they were sent.
+
+    :param files: Name and Zulip URL of each file
+    :type files: List of Tuples
+
+    :param fileIDs: ID of each uploaded file, or the exception that stopped it being uploaded
+    :type fileIDs: List
+    """
+    return [f"File could not be relayed <{fileurl}|{filename}>" for (filename, fileurl), fileID in zip(files, fileIDs) if isinstance(fileID, Exception)]
 
 
 def slackWebhook(channel, content, **kwargs):
@@ -32,57 +226,46 @@ def slackWebhook(channel, content, **kwargs):
     :param content: A Slack formatted message
     :type content: String
 
-    :param kwargs: Files
-    :type kwargs: List of Tuples that for each element contain a filename and URL
+    :param kwargs: Files, and textFirst to post the content before the files have been relayed, TEXT_FIRST by default
+    :type kwargs: List of Tuples that for each element contain a filename and URL, Boolean
     """
+    return runSync(slackWebhookAsync(channel, content, bridgedUser(current_user), **kwargs))
 
-    zulipAuth = parseZulipRC(current_user.zulipBotRC)
-    slackAuth = slackHeader(current_user.slackToken)
 
-    # create the channel if it does not exist in the slack workplace
-    createChannelRequest = get(f"https://slack.com/api/conversations.create?{parse.urlencode({'name' : channel})}", headers=slackAuth).json()
-
-    # if the channel was created successfully
-    if createChannelRequest['ok']:
-        if 'channel' in createChannelRequest:
-            # get a list of all members in the general channel
-            targetID = channelNameToID("general")
-            channelMembersRequest = get(f"https://slack.com/api/conversations.members?{parse.urlencode({'channel': targetID})}", headers=slackAuth).json()
-
-            # add all members of the slack workplace into to the newly created channel
-            userIDList = []
-            if 'members' in channelMembersRequest:
-                userIDList = channelMembersRequest['members']
+async def slackWebhookAsync(channel, content, user=None, **kwargs):
+    """
+    Post a message to a Slack channel from asyncio.
 
-            # add users to the channel
-            params = {
-                "channel": channelNameToID(channel),
-                "users": userIDList
-            }
+    :param channel: Channel to send message to
+    :type channel: String
 
-            # add all members to the new channel
-            inviteUsersRequest = post(f"https://slack.com/api/conversations.invite?{parse.urlencode(params)}", headers=slackAuth, json=params).json()
+    :param content: A Slack formatted message
+    :type content: String
 
-            # the userIDList contains the user that created the channel therefore if a specific error with the inviteUsersRequest occurred try again
-            if 'error' in inviteUsersRequest and inviteUsersRequest['error'] == 'cant_invite_self':
-                # remove all users already added to the channel
-                [userIDList.remove(conflictedUser['user']) for conflictedUser in inviteUsersRequest['errors'] if conflictedUser['user'] in userIDList]
+    :param user: The user running the integration, current_user by default
+    :type user: User
 
-                # try the invite again
-                inviteUsersRequest = post(f"https://slack.com/api/conversations.invite?{parse.urlencode(params)}", headers=slackAuth, json=params).json()
-                if 'error' in inviteUsersRequest:
-                    return "Issue with inviting"
+    :param kwargs: Files, and textFirst to post the content before the files have been relayed, TEXT_FIRST by default
+    :type kwargs: List of Tuples that for each element contain a filename and URL, Boolean
+    """
+    user = bridgedUser(user or current_user)
+    zulipAuth = parseZulipRC(user.zulipBotRC)
 
-    # post the message content to the specific Slack channel
-    get(f"https://slack.com/api/chat.postMessage?{parse.urlencode({'channel' : channel, 'text': content})}", headers=slackAuth).json()
+    async with operationSlot(user.slackToken):
+        # create the channel if it does not exist in the slack workplace, new channels are created on a worker thread
+        if not await blocking(ensureChannel, channel, user.slackToken):
+            return "Issue with inviting"
 
-    # get the files parameter, if non specified then default to empty list
-    if kwargs.get('files') is not None:
-        for filename, fileurl in kwargs.get('files'):
-            sentFile = get(fileurl, auth=(zulipAuth['email'], zulipAuth['key']))
+        # post the message content to the specific Slack channel, unless it is shared with the files
+        files = kwargs.get('files')
+        if not files or kwargs.get('textFirst', TEXT_FIRST):
+            await slackRequestAsync('GET', "chat.postMessage", user.slackToken, {'channel': channel, 'text': content}, channel=channel)
+            content = ""
 
-            # post file to the same channel
-            post(f"https://slack.com/api/files.upload?{parse.urlencode({'channels': channel, 'filename': filename})}", headers=slackAuth, files={"file": sentFile.content})
+        # upload the files at the same time, then share them with the channel in the order they were sent
+        if files:
+            fileIDs = await relayFilesAsync(files, partial(uploadToSlack, zulipAuth=zulipAuth, token=user.slackToken), user.slackToken)
+            await shareFiles(channel, content, files, fileIDs, user.slackToken)
 
     return "Message sent"
 
@@ -97,17 +280,37 @@ def renameChannel(oldChannelName, newChannelName):
     :param newChannelName: The new name the channel should take on
     :type newChannelName: String
     """
+    return runSync(renameChannelAsync(oldChannelName, newChannelName, bridgedUser(current_user)))
 
-    # rename channel in slack
-    message = {
-        "channel": channelNameToID(oldChannelName),
-        "name": newChannelName
-    }
 
+async def renameChannelAsync(oldChannelName, newChannelName, user=None):
+    """
+    Renames a channel from asyncio.
 
-    renameRequest = post("https://slack.com/api/conversations.rename", headers=slackHeader(current_user.slackUserToken), json=message)
-    if renameRequest.status_code == 200:
-        return "Zulip renamed a Slack channel"
+    :param oldChannelName: The old channel name being renamed
+    :type oldChannelName: String
+
+    :param newChannelName: The new name the channel should take on
+    :type newChannelName: String
+
+    :param user: The user running the integration, current_user by default
+    :type user: User
+    """
+    user = bridgedUser(user or current_user)
+
+    async with operationSlot(user.slackToken):
+        # rename channel in slack
+        message = {
+            "channel": await channelNameToIDAsync(oldChannelName, user),
+            "name": newChannelName
+        }
+
+        renameRequest = await slackRequestAsync('POST', "conversations.rename", user.slackUserToken, json=message)
+        if renameRequest.status_code == 200:
+            # keep the channel directory current without waiting for the channel_rename event
+            if message['channel'] is not None and renameRequest.json().get('ok'):
+                channelDirectory(user.slackToken).addChannel(message['channel'], newChannelName)
+            return "Zulip renamed a Slack channel"
 
 
 def deleteChannel(channelName):
@@ -117,8 +320,23 @@ def deleteChannel(channelName):
     :param channelName: Name of the Slack channel to delete
     :type channelName: String
     """
+    return runSync(deleteChannelAsync(channelName, bridgedUser(current_user)))
+
+
+async def deleteChannelAsync(channelName, user=None):
+    """
+    Delete a channel from asyncio, by renaming and archiving it as deleteChannel does.
+
+    :param channelName: Name of the Slack channel to delete
+    :type channelName: String
+
+    :param user: The user running the integration, current_user by default
+    :type user: User
+    """
+    user = bridgedUser(user or current_user)
     renameTo = ''.join([char if char.isnumeric() else '_' for char in str(datetime.utcnow())])
-    renameChannel(channelName, renameTo)
 
-    post(f"https://slack.com/api/conversations.archive?{parse.urlencode({'channel' : channelNameToID(renameTo)})}", headers=slackHeader(current_user.slackUserToken))
-    return "Zulip deleted a Slack channel"
\ No newline at end of file
+    async with operationSlot(user.slackToken):
+        await renameChannelAsync(channelName, renameTo, user)
+        await slackRequestAsync('POST', "conversations.archive", user.slackUserToken, {'channel': await channelNameToIDAsync(renameTo, user)})
+    return "Zulip deleted a Slack channel"
@@ -1,6 +1,85 @@
+from functools import partial
 from flask_login import current_user
+from integration.bootstrap import runUserBootstrap, streamMissing, userBootstrap
+from integration.directories.zulipTopics import STREAM_NAME, topicIndex
+from integration.asyncTransport import blocking, bridgedUser, operationSlot, post, get, patch, runSync
+from integration.fileRelay import TEXT_FIRST, FileTooLarge, ZULIP_UPLOAD_LIMIT, multipartBodyAsync, openDownloadAsync, relayFilesAsync, relayTimeout
 from integration.utilities import slackHeader, parseZulipRC
-from requests import post, get, patch
+
+
+async def uploadToZulip(filename, fileurl, deadline, slackAuth, zulipAuth):
+    """
+    Stream a Slack file into Zulip, returns the Zulip formatted link to the file.
+
+    :param filename: Name of the file
+    :type filename: String
+
+    :param fileurl: Private URL of the file in Slack
+    :type fileurl: String
+
+    :param deadline: Seconds the file has to be relayed in
+    :type deadline: Float
+
+    :param slackAuth: Header authenticating with Slack
+    :type slackAuth: Dictionary
+
+    :param zulipAuth: Email, key and site of the Zulip bot
+    :type zulipAuth: Dictionary
+    """
+    # Stream the uploaded Slack file into Zulip, by providing authentication to private URL
+    async with openDownloadAsync(fileurl, headers=slackAuth, timeout=relayTimeout(deadline)) as fileFromSlack:
+        # ensure file is under the 25MB Zulip limit, checked from the headers before the file is read
+        try:
+            body, headers = multipartBodyAsync(fileFromSlack, 'filename', filename, ZULIP_UPLOAD_LIMIT, deadline)
+            result = await post(zulipAuth['site'] + '/api/v1/user_uploads', data=body, headers=headers, auth=(zulipAuth['email'], zulipAuth['key']), timeout=relayTimeout(deadline))
+            return f"[{filename}]({result.json()['uri']})"
+        except FileTooLarge:
+            return f"File too large to display directly [{filename}]({fileurl})"
+
+
+def recordMessage(topic, messageRequest, user):
+    """
+    Add a message posted to the Slack stream to the topic index, so the topic can be renamed without looking it up.
+
+    :param topic: Topic the message was posted to
+    :type topic: String
+
+    :param messageRequest: Response of posting the message
+    :type messageRequest: Response
+
+    :param user: The user running the integration
+    :type user: User
+    """
+    try:
+        messageID = messageRequest.json()['id']
+    except:
+        return
+    topicIndex(user.zulipBotRC).addMessage(topic, messageID)
+
+
+async def postMessage(message, zulipAuth, user):
+    """
+    Post a message to the Slack stream, recording it as the newest message of its topic.
+    If Zulip answers that the stream is missing the bootstrap is run again and the message posted once more.
+
+    :param message: Type, stream, topic and content of the message
+    :type message: Dictionary
+
+    :param zulipAuth: Email, key and site of the Zulip bot
+    :type zulipAuth: Dictionary
+
+    :param user: The user running the integration
+    :type user: User
+    """
+    messageRequest = await post(zulipAuth['site'] + "/api/v1/messages", auth=(zulipAuth['email'], zulipAuth['key']), data=message)
+    if streamMissing(messageRequest):
+        # the bootstrap saves its progress on the user, so it runs on a worker thread
+        userBootstrap(user).reset()
+        if (await blocking(runUserBootstrap, user))['subscribed']:
+            messageRequest = await post(zulipAuth['site'] + "/api/v1/messages", auth=(zulipAuth['email'], zulipAuth['key']), data=message)
+
+    recordMessage(message['topic'], messageRequest, user)
+    return messageRequest
 
 
 def zulipWebhook(topic, content, **kwargs):
@@ -13,12 +92,31 @@ def zulipWebhook(topic, content, **kwargs):
     :param content: A Zulip formatted string
     :type content: String
 
-    :param kwargs: Files
-    :type kwargs: List of Tuples that contains a filename and URL
+    :param kwargs: Files, and textFirst to post the content before the files have been relayed, TEXT_FIRST by default
+    :type kwargs: List of Tuples that contains a filename and URL, Boolean
     """
+    return runSync(zulipWebhookAsync(topic, content, bridgedUser(current_user), **kwargs))
 
-    zulipAuth = parseZulipRC(current_user.zulipBotRC)
-    slackAuth = slackHeader(current_user.slackToken)
+
+async def zulipWebhookAsync(topic, content, user=None, **kwargs):
+    """
+    Post a message to Zulip from asyncio.
+
+    :param topic: Topic to send the message to
+    :type topic: String
+
+    :param content: A Zulip formatted string
+    :type content: String
+
+    :param user: The user running the integration, current_user by default
+    :type user: User
+
+    :param kwargs: Files, and textFirst to post the content before the files have been relayed, TEXT_FIRST by default
+    :type kwargs: List of Tuples that contains a filename and URL, Boolean
+    """
+    user = bridgedUser(user or current_user)
+    zulipAuth = parseZulipRC(user.zulipBotRC)
+    slackAuth = slackHeader(user.slackToken)
 
     message = {
         "type": "stream",
@@ -27,20 +125,23 @@ def zulipWebhook(topic, content, **kwargs):
         "content": content
     }
 
-    files = kwargs.get('files')
-    if files is not None:
-        for (filename, fileurl) in files:
-            # Get the raw content of the uploaded Slack file, by providing authentication to private URL
-            fileFromSlack = get(fileurl, headers=slackAuth)
-            # ensure file is under the 25MB Zulip limit
-            if int(fileFromSlack.headers['content-Length']) < 25_000_000:
-                result = post(zulipAuth['site'] + '/api/v1/user_uploads', files={'filename': (filename, fileFromSlack.content)}, auth=(zulipAuth['email'], zulipAuth['key']))
-                message['content'] += f"[{filename}]({result.json()['uri']})" + "\n"
-            else:
-                message['content'] += f"File too large to display directly [{filename}]({fileurl})" + "\n"
-
-    # post the message to Zulip
-    post(zulipAuth['site'] + "/api/v1/messages", auth=(zulipAuth['email'], zulipAuth['key']), data=message)
+    async with operationSlot(user.slackToken):
+        files = kwargs.get('files')
+        if files:
+            # post the content straight away and follow it with a message linking the files
+            if kwargs.get('textFirst', TEXT_FIRST):
+                await postMessage(message, zulipAuth, user)
+                message = dict(message, content="")
+
+            # relay the files at the same time, their links are added in the order the files were sent
+            links = await relayFilesAsync(files, partial(uploadToZulip, slackAuth=slackAuth, zulipAuth=zulipAuth), user.slackToken)
+            for (filename, fileurl), link in zip(files, links):
+                if isinstance(link, Exception):
+                    link = f"File could not be relayed [{filename}]({fileurl})"
+                message['content'] += link + "\n"
+
+        # post the message to Zulip, recording it as the newest message of its topic
+        await postMessage(message, zulipAuth, user)
 
     return "Message sent"
 
@@ -49,12 +150,20 @@ def getZulipTopicList():
     """
     Get a list of topics in the Zulip workspace.
     """
-    zulipAuth = parseZulipRC(current_user.zulipBotRC)
+    return runSync(getZulipTopicListAsync(bridgedUser(current_user)))
+
 
-    getAllTopicsRequest = get(zulipAuth['site'] + f"/api/v1/users/me/{getStreamID()}/topics", auth=(zulipAuth['email'], zulipAuth['key']))
-    getAllTopicsRequest = getAllTopicsRequest.json()['topics']
+async def getZulipTopicListAsync(user=None):
+    """
+    Get a list of topics in the Zulip workspace from asyncio.
+
+    :param user: The user running the integration, current_user by default
+    :type user: User
+    """
+    user = bridgedUser(user or current_user)
 
-    return [topic['name'] for topic in getAllTopicsRequest]
+    # the topics are only listed when the index has expired, which is done on a worker thread
+    return await blocking(topicIndex(user.zulipBotRC).topicNames)
 
 
 def getStreamID(streamName='Slack'):
@@ -64,8 +173,29 @@ def getStreamID(streamName='Slack'):
     :param streamName: The stream name to find the ID of, by default 'Slack'
     :type streamName: String
     """
-    zulipAdminAuth = parseZulipRC(current_user.zulipAdminRC)
-    return get(zulipAdminAuth['site'] + "/api/v1/get_stream_id", auth=(zulipAdminAuth['email'], zulipAdminAuth['key']), params={'stream' : streamName}).json()['stream_id']
+    return runSync(getStreamIDAsync(streamName, bridgedUser(current_user)))
+
+
+async def getStreamIDAsync(streamName='Slack', user=None):
+    """
+    By default get the StreamID of the Slack stream in Zulip from asyncio.
+
+    :param streamName: The stream name to find the ID of, by default 'Slack'
+    :type streamName: String
+
+    :param user: The user running the integration, current_user by default
+    :type user: User
+    """
+    user = bridgedUser(user or current_user)
+
+    # the ID of the Slack stream is kept by the topic index
+    if streamName == STREAM_NAME:
+        streamID = await blocking(topicIndex(user.zulipBotRC).streamID)
+        if streamID is not None:
+            return streamID
+
+    zulipAdminAuth = parseZulipRC(user.zulipAdminRC)
+    return (await get(zulipAdminAuth['site'] + "/api/v1/get_stream_id", auth=(zulipAdminAuth['email'], zulipAdminAuth['key']), params={'stream' : streamName})).json()['stream_id']
 
 
 def deleteTopic(topicName):
@@ -75,10 +205,26 @@ def deleteTopic(topicName):
     :param topicName: Name of topic to delete
     :type topicName: String
     """
-    zulipAdminAuth = parseZulipRC(current_user.zulipAdminRC)
+    return runSync(deleteTopicAsync(topicName, bridgedUser(current_user)))
+
+
+async def deleteTopicAsync(topicName, user=None):
+    """
+    Given a topic name delete it from Zulip if it exists, from asyncio.
+
+    :param topicName: Name of topic to delete
+    :type topicName: String
+
+    :param user: The user running the integration, current_user by default
+    :type user: User
+    """
+    user = bridgedUser(user or current_user)
+    zulipAdminAuth = parseZulipRC(user.zulipAdminRC)
 
-    # Delete method from api, not currently added to documentation but live: https://github.com/zulip/zulip/commit/ac55a5222c977ae2c507fb34ec5081c6ab018c16
-    post(zulipAdminAuth['site'] + "/json/streams/" + str(getStreamID()) + "/delete_topic", data={"topic_name": topicName}, auth=(zulipAdminAuth['email'], zulipAdminAuth['key']))
+    async with operationSlot(user.slackToken):
+        # Delete method from api, not currently added to documentation but live: https://github.com/zulip/zulip/commit/ac55a5222c977ae2c507fb34ec5081c6ab018c16
+        await post(zulipAdminAuth['site'] + "/json/streams/" + str(await getStreamIDAsync(user=user)) + "/delete_topic", data={"topic_name": topicName}, auth=(zulipAdminAuth['email'], zulipAdminAuth['key']))
+        topicIndex(user.zulipBotRC).removeTopic(topicName)
 
 
 def renameTopic(oldName, newName):
@@ -92,26 +238,49 @@ def renameTopic(oldName, newName):
     :type newName: String
 
     """
-    zulipAuth = parseZulipRC(current_user.zulipBotRC)
+    return runSync(renameTopicAsync(oldName, newName, bridgedUser(current_user)))
 
-    params = {'anchor': 'newest',
-              'num_before': 1,
-              'num_after': 0,
-              'narrow': '[{"operator": "stream", "operand" : "Slack"}, {"operator" : "topic", "operand" : "' + oldName + '"}]'
-              }
 
-    messageID = get(zulipAuth['site'] + "/api/v1/messages", auth=(zulipAuth['email'], zulipAuth['key']), params=params)
-    messageID = messageID.json()
-    try:
-        messageID = messageID['messages'][0]['id']
-    except:
-        messageID = None
+async def renameTopicAsync(oldName, newName, user=None):
+    """
+    Rename a topic in the Zulip workplace from asyncio.
+
+    :param oldName: The old channel name
+    :type oldName: String
+
+    :param newName: The new channel name
+    :type newName: String
+
+    :param user: The user running the integration, current_user by default
+    :type user: User
+    """
+    user = bridgedUser(user or current_user)
+    zulipAuth = parseZulipRC(user.zulipBotRC)
+    index = topicIndex(user.zulipBotRC)
+
+    message = {
+        'topic': newName,
+        'propagate_mode': 'change_all'
+    }
+
+    async with operationSlot(user.slackToken):
+        # the newest message of the topic is kept by the topic index, so Zulip is only asked for it when the topic is not known
+        messageID = await blocking(index.latestMessageID, oldName)
+        if messageID is not None:
+            # change all the messages to have a new topic
+            renameRequest = await patch(zulipAuth['site'] + "/api/v1/messages/" + str(messageID), auth=(zulipAuth['email'], zulipAuth['key']), data=message)
+            if renameRequest.status_code == 200:
+                index.renameTopic(oldName, newName)
+                return
 
-    if messageID is not None:
-        message = {
-            'topic': newName,
-            'propagate_mode': 'change_all'
-        }
+        # the topic is not known or its newest message has gone, so the newest message is looked up
+        try:
+            messageID = await index.newestMessageIDAsync(oldName)
+        except:
+            messageID = None
 
-        # change all the messages to have a new topic
-        patch(zulipAuth['site'] + "/api/v1/messages/" + str(messageID), auth=(zulipAuth['email'], zulipAuth['key']), data=message)
\ No newline at end of file
+        if messageID is not None:
+            # change all the messages to have a new topic
+            renameRequest = await patch(zulipAuth['site'] + "/api/v1/messages/" + str(messageID), auth=(zulipAuth['email'], zulipAuth['key']), data=message)
+            if renameRequest.status_code == 200:
+                index.renameTopic(oldName, newName, messageID)
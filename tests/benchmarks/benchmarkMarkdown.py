@@ -0,0 +1,160 @@
+import json
+import sys
+import tracemalloc
+from argparse import ArgumentParser
+from time import perf_counter
+from integration.markdown.batchConversion import TO_SLACK, TO_ZULIP, converters
+from integration.markdown.conversionContext import ConversionContext
+from integration.markdown.linkValidation import TRUST
+from tests.benchmarks.markdownCorpus import CorpusSettings, generateCorpus
+
+# messages converted before timing starts, so the lexers and emoji tables are already built
+WARMUP = 20
+
+# fraction a result can be worse than the baseline before it counts as a regression
+TOLERANCE = 0.25
+
+# the corpora benchmarked in each direction
+benchmarks = {
+    direction + ' ' + name: settings
+    for direction in [TO_ZULIP, TO_SLACK]
+    for name, settings in {
+        'plain': CorpusSettings(direction, markupDensity=0),
+        'light': CorpusSettings(direction, markupDensity=0.1),
+        'heavy': CorpusSettings(direction, markupDensity=0.5, nestingDepth=2),
+        'nested': CorpusSettings(direction, markupDensity=0.5, nestingDepth=4),
+        'emoji': CorpusSettings(direction, emojiDensity=0.3),
+        'links': CorpusSettings(direction, linkCount=3),
+        'large': CorpusSettings(direction, messages=5, size=5000, markupDensity=0.2, emojiDensity=0.05, linkCount=20),
+    }.items()
+}
+
+
+def percentile(latencies, fraction):
+    """
+    Returns the latency below which the given fraction of the sorted latencies fall.
+
+    :param latencies: Seconds taken to convert each message, sorted
+    :type latencies: List of Floats
+
+    :param fraction: e.g. 0.99 for the 99th percentile
+    :type fraction: Float
+    """
+    return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))]
+
+
+def benchmarkCorpus(settings):
+    """
+    Convert a generated corpus, returns the messages per second, p50 and p99 latency in milliseconds and peak memory in bytes.
+    Links are trusted so the benchmark never makes a request.
+
+    :param settings: Settings of the corpus to generate
+    :type settings: CorpusSettings
+    """
+    corpus = generateCorpus(settings)
+    converter = converters[settings.direction](ConversionContext(linkMode=TRUST))
+
+    for message in corpus[:WARMUP]:
+        converter.convert(message)
+
+    latencies = []
+    for message in corpus:
+        start = perf_counter()
+        converter.convert(message)
+        latencies.append(perf_counter() - start)
+    latencies.sort()
+
+    # memory is measured in a separate pass as tracing slows down the conversions
+    tracemalloc.start()
+    for message in corpus:
+        converter.convert(message)
+    peakMemory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'messagesPerSecond': len(corpus) / sum(latencies),
+        'p50': percentile(latencies, 0.5) * 1000,
+        'p99': percentile(latencies, 0.99) * 1000,
+        'peakMemory': peakMemory,
+        'corpus': settings.describe(),
+    }
+
+
+def findRegressions(results, baseline, tolerance=TOLERANCE):
+    """
+    Returns a description of each benchmark that converts fewer messages per second, or uses more memory, than the
+    baseline by more than the tolerance. Latencies are reported but not compared as they vary too much between runs.
+
+    :param results: Results of this run, by benchmark name
+    :type results: Dictionary
+
+    :param baseline: Results of an earlier run, by benchmark name
+    :type baseline: Dictionary
+
+    :param tolerance: Fraction a result can be worse than the baseline
+    :type tolerance: Float
+    """
+    regressions = []
+
+    for name, previous in baseline.items():
+        current = results.get(name)
+        if current is None:
+            continue
+
+        if current['messagesPerSecond'] < previous['messagesPerSecond'] * (1 - tolerance):
+            regressions.append(f"{name}: {current['messagesPerSecond']:,.0f} messages/sec, was {previous['messagesPerSecond']:,.0f}")
+        if current['peakMemory'] > previous['peakMemory'] * (1 + tolerance):
+            regressions.append(f"{name}: peak memory {current['peakMemory']:,} bytes, was {previous['peakMemory']:,}")
+
+    return regressions
+
+
+def runBenchmarks(only=None):
+    """
+    Run every benchmark, or those with a name containing only, printing and returning the results by benchmark name.
+
+    :param only: Text the names of the benchmarks to run must contain
+    :type only: String
+    """
+    results = {}
+
+    for name, settings in benchmarks.items():
+        if only and only not in name:
+            continue
+
+        result = benchmarkCorpus(settings)
+        results[name] = result
+        print(f"{name:<16}{result['messagesPerSecond']:>12,.0f} messages/sec  p50 {result['p50']:>9.3f}ms  "
+              f"p99 {result['p99']:>9.3f}ms  peak {result['peakMemory'] / 1024:>9,.0f}KiB")
+
+    return results
+
+
+def main(arguments=None):
+    parser = ArgumentParser(description="Benchmark the markdown converters on generated corpora.")
+    parser.add_argument('--save', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="JSON file of earlier results, the run fails if any benchmark has regressed")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help="fraction a result can be worse than the earlier results")
+    parser.add_argument('--only', help="only run benchmarks with a name containing this text")
+    arguments = parser.parse_args(arguments)
+
+    results = runBenchmarks(arguments.only)
+
+    if arguments.save:
+        with open(arguments.save, 'w') as resultsFile:
+            json.dump(results, resultsFile, indent=4)
+
+    if arguments.compare:
+        with open(arguments.compare) as baselineFile:
+            regressions = findRegressions(results, json.load(baselineFile), arguments.tolerance)
+
+        for regression in regressions:
+            print("Regression " + regression)
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,152 @@
+from random import Random
+from integration.markdown.batchConversion import TO_SLACK, TO_ZULIP
+from integration.markdown.emojis.shortCodeDict import slackToZulipTable, zulipToSlackTable
+
+# words that make up the plain text of each message
+words = ("deploy release service check alert build queue worker channel stream topic message retry timeout "
+         "latency error warning update status config token user team project backup restore").split()
+
+# the markup written in each direction's source markdown, as (opening, closing) pairs
+markup = {
+    TO_ZULIP: [("*", "*"), ("_", "_"), ("~", "~"), ("***", "***"), ("`", "`")],
+    TO_SLACK: [("**", "**"), ("*", "*"), ("~~", "~~"), ("***", "***"), ("`", "`")],
+}
+
+# lists and quotes written at the start of lines in each direction's source markdown
+linePrefixes = {
+    TO_ZULIP: ["- ", "> ", "• "],
+    TO_SLACK: ["- ", "> ", "1. ", "    "],
+}
+
+emojis = {
+    TO_ZULIP: sorted(slackToZulipTable),
+    TO_SLACK: sorted(zulipToSlackTable),
+}
+
+
+class CorpusSettings:
+    """
+    Settings of a generated corpus of messages.
+
+    :param direction: TO_ZULIP for a corpus of Slack messages or TO_SLACK for a corpus of Zulip messages
+    :type direction: String
+
+    :param messages: Number of messages in the corpus
+    :type messages: Integer
+
+    :param size: Number of words in each message
+    :type size: Integer
+
+    :param markupDensity: Fraction of words that are formatted
+    :type markupDensity: Float
+
+    :param emojiDensity: Fraction of words followed by an emoji
+    :type emojiDensity: Float
+
+    :param linkCount: Number of links in each message
+    :type linkCount: Integer
+
+    :param nestingDepth: Number of markups wrapped around each formatted word, lists and quotes are nested to one less than this
+    :type nestingDepth: Integer
+    """
+    def __init__(self, direction, messages=200, size=40, markupDensity=0.1, emojiDensity=0.0, linkCount=0, nestingDepth=1):
+        self.direction = direction
+        self.messages = messages
+        self.size = size
+        self.markupDensity = markupDensity
+        self.emojiDensity = emojiDensity
+        self.linkCount = linkCount
+        self.nestingDepth = nestingDepth
+
+    def describe(self):
+        return dict(vars(self))
+
+
+def formatWord(random, word, direction, depth):
+    """
+    Wrap a word in depth randomly chosen markups.
+
+    :param random: Random number generator of the corpus
+    :type random: Random
+
+    :param word: The word to format
+    :type word: String
+
+    :param direction: TO_ZULIP or TO_SLACK
+    :type direction: String
+
+    :param depth: Number of markups to wrap the word in
+    :type depth: Integer
+    """
+    for opening, closing in random.sample(markup[direction], min(depth, len(markup[direction]))):
+        word = opening + word + closing
+    return word
+
+
+def makeLink(random, direction, number):
+    """
+    Returns a link in the source markdown of the direction, with and without a label.
+
+    :param random: Random number generator of the corpus
+    :type random: Random
+
+    :param direction: TO_ZULIP or TO_SLACK
+    :type direction: String
+
+    :param number: Number used to make each link in a message different
+    :type number: Integer
+    """
+    url = "https://example.com/" + random.choice(words) + "/" + str(number)
+
+    if direction == TO_ZULIP:
+        if random.random() < 0.5:
+            return "<" + url + ">"
+        return "<" + url + "|" + random.choice(words) + ">"
+    return "[" + random.choice(words) + "](" + url + ")"
+
+
+def generateMessage(random, settings):
+    """
+    Returns a single message of the corpus.
+
+    :param random: Random number generator of the corpus
+    :type random: Random
+
+    :param settings: Settings of the corpus
+    :type settings: CorpusSettings
+    """
+    direction = settings.direction
+    parts = []
+
+    for word in random.choices(words, k=settings.size):
+        if random.random() < settings.markupDensity:
+            word = formatWord(random, word, direction, settings.nestingDepth)
+        parts.append(word)
+
+        if random.random() < settings.emojiDensity:
+            parts.append(random.choice(emojis[direction]))
+
+    for number in range(settings.linkCount):
+        parts.insert(random.randrange(len(parts) + 1), makeLink(random, direction, number))
+
+    # split the message into lines of eight parts, with lists and quotes indented up to the nesting depth
+    lines = [' '.join(parts[i:i + 8]) for i in range(0, len(parts), 8)]
+    if settings.nestingDepth > 1:
+        for i in range(len(lines)):
+            lines[i] = "  " * (i % settings.nestingDepth) + random.choice(linePrefixes[direction]) + lines[i]
+
+    return '\n'.join(lines)
+
+
+def generateCorpus(settings, seed=0):
+    """
+    Returns a list of messages generated from the settings, the same seed always gives the same corpus.
+
+    :param settings: Settings of the corpus
+    :type settings: CorpusSettings
+
+    :param seed: Seed of the random number generator
+    :type seed: Integer
+    """
+    random = Random(seed)
+    return [generateMessage(random, settings) for _ in range(settings.messages)]
@@ -0,0 +1,34 @@
+from integration.markdown.batchConversion import TO_SLACK, TO_ZULIP
+from tests.benchmarks.benchmarkMarkdown import findRegressions, percentile
+from tests.benchmarks.markdownCorpus import CorpusSettings, generateCorpus
+
+
+class TestCorpus:
+    def test_sameSeedSameCorpus(self):
+        settings = CorpusSettings(TO_ZULIP, messages=20, markupDensity=0.5, emojiDensity=0.2, linkCount=2, nestingDepth=3)
+        assert generateCorpus(settings, seed=1) == generateCorpus(settings, seed=1)
+        assert generateCorpus(settings, seed=1) != generateCorpus(settings, seed=2)
+
+    def test_plainCorpus(self):
+        corpus = generateCorpus(CorpusSettings(TO_SLACK, messages=5, size=16, markupDensity=0))
+        assert len(corpus) == 5
+        assert all(len(message.split()) == 16 and '*' not in message for message in corpus)
+
+    def test_linkCount(self):
+        for message in generateCorpus(CorpusSettings(TO_SLACK, messages=5, linkCount=3)):
+            assert message.count('](https://example.com/') == 3
+
+    def test_nestedLists(self):
+        message = generateCorpus(CorpusSettings(TO_ZULIP, messages=1, size=40, nestingDepth=3))[0]
+        assert [len(line) - len(line.lstrip(' ')) for line in message.split('\n')] == [0, 2, 4, 0, 2]
+
+
+class TestRegressions:
+    def test_percentile(self):
+        assert percentile(list(range(100)), 0.5) == 50
+        assert percentile(list(range(100)), 0.99) == 99
+
+    def test_regressionFound(self):
+        baseline = {'toZulip plain': {'messagesPerSecond': 1000, 'peakMemory': 1000}}
+        assert findRegressions({'toZulip plain': {'messagesPerSecond': 900, 'peakMemory': 1100}}, baseline) == []
+        assert len(findRegressions({'toZulip plain': {'messagesPerSecond': 500, 'peakMemory': 2000}}, baseline)) == 2
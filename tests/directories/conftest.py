@@ -0,0 +1,16 @@
+from pytest import fixture
+from integration import utilities
+from tests.directories.slackStandIn import SlackStandIn, startSlackStandIn
+
+
+@fixture
+def slack(monkeypatch):
+    """
+    Starts the Slack stand-in with no items or responses and points the integration at it. Each test sets the items
+    and responses it needs on the stand-in that is returned.
+    """
+    server, api = startSlackStandIn()
+    monkeypatch.setattr(utilities, 'SLACK_API', api)
+
+    yield SlackStandIn
+    server.shutdown()
@@ -0,0 +1,80 @@
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from urllib import parse
+from integration import slackRateLimit
+
+
+class SlackStandIn(BaseHTTPRequestHandler):
+    """
+    Local stand-in for the Slack Web API. Each method returns the items held for it a page at a time, following the
+    limit and cursor parameters, and every call is recorded as a tuple of the method and its parameters. A response
+    function may return a tuple of the status, body and headers to answer with something other than 200.
+    """
+    calls = []
+    items = {}
+    responses = {}
+
+    def respond(self, params):
+        method = self.path.split('?')[0].rsplit('/', 1)[-1]
+        self.calls.append((method, params))
+
+        status, headers = 200, {}
+        if method in self.responses:
+            body = self.responses[method](params)
+            if isinstance(body, tuple):
+                status, body, headers = body
+        elif method in self.items:
+            key, items = self.items[method]
+            start = int(params.get('cursor') or 0)
+            end = start + int(params.get('limit', 100))
+            body = {'ok': True, key: items[start:end], 'response_metadata': {'next_cursor': str(end) if end < len(items) else ""}}
+        else:
+            body = {'ok': False, 'error': 'unknown_method'}
+
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        self.respond(dict(parse.parse_qsl(parse.urlsplit(self.path).query)))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode() if length else ""
+        params = dict(parse.parse_qsl(parse.urlsplit(self.path).query))
+        if self.headers.get('Content-Type', '').startswith('application/json') and body:
+            params.update(json.loads(body))
+        else:
+            params.update(parse.parse_qsl(body))
+        self.respond(params)
+
+    def log_message(self, *args):
+        pass
+
+
+def startSlackStandIn():
+    """
+    Start the stand-in on a free port with no items or calls, returns the server and the base address of its API.
+    The shared scheduler is replaced, so the rate limits used up by earlier tests do not delay this one.
+    """
+    SlackStandIn.calls = []
+    SlackStandIn.items = {}
+    SlackStandIn.responses = {}
+    slackRateLimit.slackScheduler = slackRateLimit.SlackScheduler()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SlackStandIn)
+    Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/api/"
+
+
+def channels(count):
+    """
+    Returns count Slack channel objects named channel0, channel1, ...
+    """
+    return [{'id': 'C' + str(i), 'name': 'channel' + str(i)} for i in range(count)]
@@ -0,0 +1,189 @@
+import json
+from types import SimpleNamespace
+from uuid import uuid4
+from pytest import fixture
+from integration import bootstrap, utilities
+from integration.asyncTransport import runSync
+from integration.bootstrap import IntegrationBootstrap, integrationBootstrap
+from integration.directories import zulipTopics
+from integration.webhooks.zulipWebHook import postMessage
+from tests.directories.slackStandIn import SlackStandIn
+from tests.directories.zulipStandIn import ZulipStandIn, startZulipStandIn
+
+
+def members(count):
+    """
+    Returns count Slack user objects with the emails user0@example.com, user1@example.com, ...
+    """
+    return [{'id': 'U' + str(i), 'name': 'user' + str(i), 'profile': {'email': 'user' + str(i) + '@example.com'}} for i in range(count)]
+
+
+@fixture
+def realm(slack, monkeypatch):
+    slack.items['users.list'] = ('members', members(2) + [{'id': 'UBOT', 'is_bot': True, 'profile': {'email': 'bot@example.com'}}, {'id': 'UGUEST', 'is_restricted': True, 'profile': {'email': 'guest@example.com'}}, {'id': 'UNOEMAIL', 'profile': {}}])
+
+    zulipServer, zulipRC = startZulipStandIn()
+    monkeypatch.setattr(zulipTopics, 'topicIndexes', {})
+    monkeypatch.setattr(bootstrap, 'bootstraps', {})
+
+    yield SimpleNamespace(zulip=ZulipStandIn, zulipRC=zulipRC, slackToken='xoxb-' + uuid4().hex)
+    zulipServer.shutdown()
+
+
+def subscriptionCalls(zulip):
+    return [json.loads(params['principals']) for path, params in zulip.calls if path == '/api/v1/users/me/subscriptions']
+
+
+class TestIntegrationBootstrap:
+    def test_subscribedOnce(self, realm):
+        setup = IntegrationBootstrap(realm.zulipRC, realm.slackToken)
+
+        assert setup.run() == {'stream_id': 7, 'subscribed': True}
+        assert setup.run() == {'stream_id': 7, 'subscribed': True}
+        assert subscriptionCalls(realm.zulip) == [['bot@zulip.example']]
+
+    def test_missingStreamCreatedWithMembers(self, realm):
+        realm.zulip.streamID = None
+        setup = IntegrationBootstrap(realm.zulipRC, realm.slackToken)
+
+        assert setup.run() == {'stream_id': 7, 'subscribed': True}
+        assert subscriptionCalls(realm.zulip) == [['bot@zulip.example'], ['user0@example.com', 'user1@example.com']]
+        assert setup.progress['state'] == 'done' and setup.progress['subscribed'] == 2
+
+    def test_membersBatched(self, realm, monkeypatch):
+        monkeypatch.setattr(bootstrap, 'SUBSCRIBE_BATCH', 120)
+        SlackStandIn.items['users.list'] = ('members', members(450))
+        realm.zulip.streamID = None
+        IntegrationBootstrap(realm.zulipRC, realm.slackToken).run()
+
+        batches = subscriptionCalls(realm.zulip)[1:]
+        assert [len(batch) for batch in batches] == [120, 120, 120, 90]
+        assert sum(batches, []) == [user['profile']['email'] for user in members(450)]
+        assert len([method for method, params in SlackStandIn.calls if method == 'users.list']) == 3
+
+    def test_interruptedBootstrapResumed(self, realm, monkeypatch):
+        monkeypatch.setattr(bootstrap, 'SUBSCRIBE_BATCH', 120)
+        SlackStandIn.items['users.list'] = ('members', members(450))
+        realm.zulip.streamID = None
+        setup = IntegrationBootstrap(realm.zulipRC, realm.slackToken)
+
+        # Zulip stops answering after the bot and two batches have been subscribed
+        answer = realm.zulip.do_POST
+        monkeypatch.setattr(realm.zulip, 'do_POST', lambda handler: answer(handler) if len(subscriptionCalls(handler)) < 3 else handler.respond(500, {'result': 'error'}))
+        assert setup.run()['subscribed'] is False
+        assert setup.progress == {'state': 'members', 'subscribed': 240, 'cursor': '200', 'skip': 40}
+
+        monkeypatch.setattr(realm.zulip, 'do_POST', answer)
+        SlackStandIn.calls.clear()
+        setup.retryAfter = 0
+        assert setup.run() == {'stream_id': 7, 'subscribed': True}
+
+        # the members are each subscribed once and users.list is read from the page the bootstrap stopped at
+        assert sorted(realm.zulip.subscribers) == sorted(['bot@zulip.example'] + [user['profile']['email'] for user in members(450)])
+        assert sum([batch for batch in subscriptionCalls(realm.zulip) if batch != ['bot@zulip.example']], []) == [user['profile']['email'] for user in members(450)]
+        assert [params.get('cursor') for method, params in SlackStandIn.calls if method == 'users.list'] == ['200', '400']
+        assert setup.progress['state'] == 'done' and setup.progress['subscribed'] == 450
+
+    def test_restartedBootstrapResumed(self, realm):
+        SlackStandIn.responses['users.list'] = lambda params: {'ok': False, 'error': 'ratelimited'}
+        realm.zulip.streamID = None
+        saved = []
+
+        # the stream is created but its members are not subscribed before the integration restarts
+        assert IntegrationBootstrap(realm.zulipRC, realm.slackToken).run(saved.append)['subscribed'] is False
+        assert saved[-1]['state'] == 'members' and realm.zulip.subscribers == ['bot@zulip.example']
+
+        del SlackStandIn.responses['users.list']
+        restarted = IntegrationBootstrap(realm.zulipRC, realm.slackToken, saved[-1])
+        assert restarted.run(saved.append) == {'stream_id': 7, 'subscribed': True}
+        assert realm.zulip.subscribers == ['bot@zulip.example', 'user0@example.com', 'user1@example.com']
+        assert saved[-1]['state'] == 'done'
+
+    def test_userProgressLoaded(self, realm):
+        user = SimpleNamespace(zulipBotRC=realm.zulipRC, slackToken=realm.slackToken, bootstrapProgress=json.dumps({'state': 'members', 'subscribed': 2, 'cursor': '', 'skip': 0}))
+        assert bootstrap.userBootstrap(user).progress['state'] == 'members'
+
+        bootstrap.runUserBootstrap(user)
+        assert json.loads(user.bootstrapProgress)['state'] == 'done'
+
+    def test_failureRetriedAfterBackoff(self, realm, monkeypatch):
+        setup = IntegrationBootstrap(realm.zulipRC, realm.slackToken)
+        answer = realm.zulip.do_POST
+        monkeypatch.setattr(realm.zulip, 'do_POST', lambda handler: handler.respond(500, {'result': 'error'}))
+
+        assert setup.run()['subscribed'] is False
+        calls = len(realm.zulip.calls)
+        monkeypatch.setattr(realm.zulip, 'do_POST', answer)
+
+        # the bootstrap is not run again until the backoff has passed
+        assert setup.run()['subscribed'] is False
+        assert len(realm.zulip.calls) == calls
+
+        setup.retryAfter = 0
+        assert setup.run()['subscribed'] is True
+
+    def test_progressKeptWhenZulipFails(self, realm, monkeypatch):
+        saved = {'state': 'members', 'subscribed': 240, 'cursor': '200', 'skip': 40}
+        setup = IntegrationBootstrap(realm.zulipRC, realm.slackToken, saved)
+
+        # the stream lookup fails, which does not say the stream is missing
+        monkeypatch.setattr(realm.zulip, 'do_GET', lambda handler: handler.respond(502, {'result': 'error', 'msg': 'Bad gateway'}))
+        assert setup.run()['subscribed'] is False
+        assert setup.progress == saved
+        assert subscriptionCalls(realm.zulip) == []
+
+    def test_resetByStreamEvent(self, realm):
+        setup = IntegrationBootstrap(realm.zulipRC, realm.slackToken)
+        setup.run()
+
+        setup.applyEvent({'type': 'stream', 'op': 'delete', 'streams': [{'name': 'general'}]})
+        setup.run()
+        assert len(subscriptionCalls(realm.zulip)) == 1
+
+        setup.applyEvent({'type': 'stream', 'op': 'delete', 'streams': [{'name': 'Slack'}]})
+        setup.run()
+        assert len(subscriptionCalls(realm.zulip)) == 2
+
+    def test_resetByUnsubscribe(self, realm):
+        setup = IntegrationBootstrap(realm.zulipRC, realm.slackToken)
+        setup.run()
+
+        setup.applyEvent({'type': 'subscription', 'op': 'remove', 'subscriptions': [{'name': 'Slack', 'stream_id': 7}]})
+        setup.run()
+        assert len(subscriptionCalls(realm.zulip)) == 2
+
+
+class TestStreamMissing:
+    def response(self, status, body):
+        return SimpleNamespace(status_code=status, json=lambda: body)
+
+    def test_missingStream(self):
+        assert bootstrap.streamMissing(self.response(400, {'result': 'error', 'code': 'STREAM_DOES_NOT_EXIST', 'msg': "Stream 'Slack' does not exist"}))
+        assert bootstrap.streamMissing(self.response(400, {'result': 'error', 'code': 'BAD_REQUEST', 'msg': "Not subscribed to stream 'Slack'"}))
+
+    def test_otherErrors(self):
+        assert not bootstrap.streamMissing(self.response(400, {'result': 'error', 'code': 'BAD_REQUEST', 'msg': "Invalid stream name 'Slack'"}))
+        assert not bootstrap.streamMissing(self.response(400, {'result': 'error', 'code': 'BAD_REQUEST', 'msg': "Not authorized to send to stream 'Slack'"}))
+        assert not bootstrap.streamMissing(self.response(200, {'result': 'success', 'id': 1}))
+
+
+class TestPostMessage:
+    def test_streamRecreated(self, realm):
+        user = SimpleNamespace(zulipBotRC=realm.zulipRC, slackToken=realm.slackToken)
+        integrationBootstrap(realm.zulipRC, realm.slackToken).run()
+
+        # the stream is deleted while the integration runs
+        realm.zulip.streamID = None
+        message = {'type': 'stream', 'to': 'Slack', 'topic': 'general', 'content': 'hello'}
+        response = runSync(postMessage(message, utilities.parseZulipRC(realm.zulipRC), user))
+
+        assert response.status_code == 200
+        assert realm.zulip.topics['general'] == [response.json()['id']]
+        assert subscriptionCalls(realm.zulip)[1:] == [['bot@zulip.example'], ['user0@example.com', 'user1@example.com']]
+
+    def test_noBootstrapWhenPosted(self, realm):
+        user = SimpleNamespace(zulipBotRC=realm.zulipRC, slackToken=realm.slackToken)
+        integrationBootstrap(realm.zulipRC, realm.slackToken).run()
+
+        runSync(postMessage({'type': 'stream', 'to': 'Slack', 'topic': 'general', 'content': 'hello'}, utilities.parseZulipRC(realm.zulipRC), user))
+        assert len(subscriptionCalls(realm.zulip)) == 1
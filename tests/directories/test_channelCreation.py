@@ -0,0 +1,183 @@
+import asyncio
+from threading import Lock, Thread
+from time import sleep
+from types import SimpleNamespace
+from uuid import uuid4
+from pytest import fixture
+from integration import asyncTransport, utilities
+from integration.asyncTransport import closeTransport
+from integration.webhooks import slackWebHook
+from integration.webhooks.slackWebHook import ensureChannel, inviteMembers, slackWebhook, slackWebhookAsync
+from tests.directories.slackStandIn import channels
+
+
+def created(params):
+    # a slow creation, so concurrent messages overlap it
+    sleep(0.1)
+    return {'ok': True, 'channel': {'id': 'CNEW', 'name': params['name']}}
+
+
+def listChannels(slack):
+    slack.items['conversations.list'] = ('channels', channels(3) + [{'id': 'CGEN', 'name': 'general'}])
+    slack.responses['conversations.create'] = created
+
+
+def listMembers(slack):
+    slack.items['conversations.members'] = ('members', ['UBOT'] + ['U' + str(i) for i in range(2500)])
+    slack.responses['auth.test'] = lambda params: {'ok': True, 'user_id': 'UBOT'}
+    slack.responses['conversations.invite'] = lambda params: {'ok': True}
+
+
+@fixture
+def token():
+    return 'xoxb-' + uuid4().hex
+
+
+def methods(slack, method):
+    return [params for calledMethod, params in slack.calls if calledMethod == method]
+
+
+async def uploaded(filename, fileurl, deadline, zulipAuth, token):
+    return 'F' + filename
+
+
+class TestEnsureChannel:
+    def test_knownChannelNotCreated(self, slack, token):
+        listChannels(slack)
+        assert ensureChannel('channel1', token)
+        assert ensureChannel('C2', token)
+        assert methods(slack, 'conversations.create') == []
+
+    def test_newChannelCreatedOnce(self, slack, token):
+        listChannels(slack)
+        assert ensureChannel('bridged', token)
+        assert ensureChannel('bridged', token)
+        assert len(methods(slack, 'conversations.create')) == 1
+
+    def test_concurrentCreationsCoalesced(self, slack, token):
+        listChannels(slack)
+        threads = [Thread(target=ensureChannel, args=('bridged', token)) for i in range(8)]
+        [thread.start() for thread in threads]
+        [thread.join() for thread in threads]
+        assert len(methods(slack, 'conversations.create')) == 1
+
+
+class TestInviteMembers:
+    def test_invitesBatched(self, slack, token):
+        listMembers(slack)
+        assert inviteMembers('CNEW', token)
+        invites = methods(slack, 'conversations.invite')
+        assert [len(invite['users'].split(',')) for invite in invites] == [1000, 1000, 500]
+        assert all('UBOT' not in invite['users'].split(',') for invite in invites)
+
+    def test_identityLookedUpOnce(self, slack, token):
+        listMembers(slack)
+        slack.responses['auth.test'] = lambda params: {'ok': False, 'error': 'invalid_auth'}
+        assert inviteMembers('CNEW', token)
+        assert len(methods(slack, 'auth.test')) == 1
+
+    def test_failedInvite(self, slack, token):
+        listMembers(slack)
+        slack.responses['conversations.invite'] = lambda params: {'ok': False, 'error': 'channel_not_found'}
+        assert not inviteMembers('CNEW', token)
+
+    def test_conflictedUsersRemoved(self, slack, token, monkeypatch):
+        listMembers(slack)
+        monkeypatch.setattr(slackWebHook, 'INVITE_BATCH', 3000)
+        responses = iter([{'ok': False, 'error': 'cant_invite_self', 'errors': [{'user': 'U0', 'ok': False}]}, {'ok': True}])
+        slack.responses['conversations.invite'] = lambda params: next(responses)
+
+        assert inviteMembers('CNEW', token)
+        retried = methods(slack, 'conversations.invite')[1]['users'].split(',')
+        assert 'U0' not in retried and len(retried) == 2499
+
+
+class TestSlackWebhookFiles:
+    def test_filesSharedInOrder(self, slack, token, monkeypatch):
+        listChannels(slack)
+        slack.responses['chat.postMessage'] = lambda params: {'ok': True}
+        slack.responses['files.completeUploadExternal'] = lambda params: {'ok': True}
+        monkeypatch.setattr(slackWebHook, 'current_user', SimpleNamespace(zulipBotRC="[api] email=bot@zulip.example key=key site=http://zulip.example", slackToken=token))
+        api = utilities.SLACK_API
+
+        # the first file takes the longest to download and the second cannot be downloaded
+        def download(params):
+            sleep(float(params['delay']))
+            if params['name'] == 'broken.txt':
+                return 500, {'error': 'broken'}, {}
+            return {'file': params['name']}
+        slack.responses['download'] = download
+        slack.responses['files.getUploadURLExternal'] = lambda params: {'ok': True, 'file_id': 'F' + params['filename'], 'upload_url': api + 'upload'}
+        slack.responses['upload'] = lambda params: {'ok': True}
+
+        files = [(name, f"{api}download?name={name}&delay={delay}") for name, delay in [('a.txt', 0.2), ('broken.txt', 0), ('c.txt', 0.05)]]
+        slackWebhook('channel1', 'hello', files=files)
+
+        assert methods(slack, 'chat.postMessage') == []
+        shared, = methods(slack, 'files.completeUploadExternal')
+        assert shared['files'] == [{'id': 'Fa.txt', 'title': 'a.txt'}, {'id': 'Fc.txt', 'title': 'c.txt'}]
+        assert shared['channel_id'] == 'C1'
+        assert shared['initial_comment'] == f"hello\nFile could not be relayed <{files[1][1]}|broken.txt>"
+        assert len(methods(slack, 'upload')) == 2
+
+    def test_filesLinkedWhenNotShared(self, slack, token, monkeypatch):
+        listChannels(slack)
+        slack.responses['chat.postMessage'] = lambda params: {'ok': True}
+        slack.responses['files.completeUploadExternal'] = lambda params: {'ok': False, 'error': 'not_in_channel'}
+        monkeypatch.setattr(slackWebHook, 'current_user', SimpleNamespace(zulipBotRC="[api] email=bot@zulip.example key=key site=http://zulip.example", slackToken=token))
+        monkeypatch.setattr(slackWebHook, 'uploadToSlack', uploaded)
+
+        slackWebhook('channel1', 'hello', files=[('a.txt', 'https://zulip.example/a.txt')])
+        assert [post['text'] for post in methods(slack, 'chat.postMessage')] == ["hello\nFile could not be relayed <https://zulip.example/a.txt|a.txt>"]
+
+    def test_textFirst(self, slack, token, monkeypatch):
+        listChannels(slack)
+        slack.responses['chat.postMessage'] = lambda params: {'ok': True}
+        slack.responses['files.completeUploadExternal'] = lambda params: {'ok': True}
+        monkeypatch.setattr(slackWebHook, 'current_user', SimpleNamespace(zulipBotRC="[api] email=bot@zulip.example key=key site=http://zulip.example", slackToken=token))
+        monkeypatch.setattr(slackWebHook, 'uploadToSlack', uploaded)
+
+        slackWebhook('channel1', 'hello', files=[('a.txt', 'https://zulip.example/a.txt')], textFirst=True)
+        assert [post['text'] for post in methods(slack, 'chat.postMessage')] == ['hello']
+        shared, = methods(slack, 'files.completeUploadExternal')
+        assert 'initial_comment' not in shared
+
+    def test_textPostedWithoutFiles(self, slack, token, monkeypatch):
+        listChannels(slack)
+        slack.responses['chat.postMessage'] = lambda params: {'ok': True}
+        monkeypatch.setattr(slackWebHook, 'current_user', SimpleNamespace(zulipBotRC="[api] email=bot@zulip.example key=key site=http://zulip.example", slackToken=token))
+
+        slackWebhook('channel1', 'hello')
+        assert [post['text'] for post in methods(slack, 'chat.postMessage')] == ['hello']
+        assert methods(slack, 'files.completeUploadExternal') == []
+
+
+class TestSlackWebhookAsync:
+    def test_manyTenantsBounded(self, slack, monkeypatch):
+        monkeypatch.setattr(asyncTransport, 'IN_FLIGHT_LIMIT', 20)
+        monkeypatch.setattr(asyncTransport, 'TENANT_LIMIT', 4)
+        listChannels(slack)
+        running = {'now': 0, 'most': 0}
+        lock = Lock()
+
+        def posted(params):
+            with lock:
+                running['now'] += 1
+                running['most'] = max(running['most'], running['now'])
+            sleep(0.02)
+            with lock:
+                running['now'] -= 1
+            return {'ok': True}
+        slack.responses['chat.postMessage'] = posted
+
+        users = [SimpleNamespace(zulipBotRC="[api] email=bot@zulip.example key=key site=http://zulip.example", slackToken='xoxb-' + uuid4().hex) for _ in range(10)]
+
+        async def bridge():
+            try:
+                return await asyncio.gather(*[slackWebhookAsync('channel' + str(i % 3), str(i), users[i % 10]) for i in range(400)])
+            finally:
+                await closeTransport()
+
+        assert asyncio.run(bridge()) == ["Message sent"] * 400
+        assert len(methods(slack, 'chat.postMessage')) == 400
+        assert 4 < running['most'] <= 20
@@ -0,0 +1,101 @@
+import threading
+from time import perf_counter
+from integration.directories import slackChannels
+from integration.directories.slackChannels import SlackChannelDirectory, channelDirectory
+from tests.directories.slackStandIn import channels
+
+
+def listCalls(slack):
+    return [method for method, params in slack.calls if method == 'conversations.list']
+
+
+class TestChannelDirectory:
+    def test_bothIndexes(self, slack):
+        slack.items['conversations.list'] = ('channels', channels(5))
+        directory = SlackChannelDirectory('xoxb-test')
+        assert directory.channelID('channel3') == 'C3'
+        assert directory.channelName('C1') == 'channel1'
+        assert len(listCalls(slack)) == 1
+
+    def test_unknownChannel(self, slack, monkeypatch):
+        slack.items['conversations.list'] = ('channels', channels(5))
+        directory = SlackChannelDirectory('xoxb-test')
+        assert directory.channelName('C1') == 'channel1'
+
+        # a lookup that misses lists the channels again, but not within MISS_INTERVAL of the last listing
+        monkeypatch.setattr(slackChannels, 'MISS_INTERVAL', 0)
+        assert directory.channelID('missing') is None
+        assert len(listCalls(slack)) == 2
+
+        monkeypatch.setattr(slackChannels, 'MISS_INTERVAL', 60)
+        assert directory.channelID('missing') is None
+        assert len(listCalls(slack)) == 2
+
+    def test_expiredDirectoryListedAgain(self, slack):
+        slack.items['conversations.list'] = ('channels', channels(5))
+        directory = SlackChannelDirectory('xoxb-test', ttl=0)
+        directory.channelID('channel0')
+        directory.channelID('channel0')
+        directory.resync.join()
+        assert len(listCalls(slack)) == 2
+
+    def test_expiredDirectoryUsedWhileListed(self, slack):
+        slack.items['conversations.list'] = ('channels', channels(5))
+        directory = SlackChannelDirectory('xoxb-test', ttl=0)
+        directory.channelID('channel0')
+
+        # the channels are listed again slowly, the lookups made meanwhile use the expired directory
+        listed = threading.Event()
+        slack.responses['conversations.list'] = lambda params: listed.wait(5) and {'ok': True, 'channels': channels(6)}
+        start = perf_counter()
+        assert directory.channelID('channel4') == 'C4'
+        assert directory.channelID('channel4') == 'C4'
+        assert perf_counter() - start < 1
+
+        # one listing was started for both lookups
+        listed.set()
+        directory.resync.join()
+        assert len(listCalls(slack)) == 2
+        assert directory.channelID('channel5') == 'C5'
+
+    def test_directoryPerToken(self, slack):
+        assert channelDirectory('xoxb-one') is channelDirectory('xoxb-one')
+        assert channelDirectory('xoxb-one') is not channelDirectory('xoxb-two')
+
+
+class TestChannelEvents:
+    def test_created(self, slack):
+        slack.items['conversations.list'] = ('channels', channels(5))
+        directory = SlackChannelDirectory('xoxb-test')
+        directory.channelID('channel0')
+        directory.applyEvent({'type': 'channel_created', 'channel': {'id': 'C9', 'name': 'new'}})
+        assert directory.channelID('new') == 'C9'
+        assert len(listCalls(slack)) == 1
+
+    def test_renamed(self, slack):
+        slack.items['conversations.list'] = ('channels', channels(5))
+        directory = SlackChannelDirectory('xoxb-test')
+        directory.channelID('channel0')
+        directory.applyEvent({'type': 'channel_rename', 'channel': {'id': 'C2', 'name': 'renamed'}})
+        assert directory.channelName('C2') == 'renamed'
+        assert directory.nameToID.get('channel2') is None
+
+        directory.applyEvent({'type': 'message', 'subtype': 'channel_name', 'channel': 'C2', 'old_name': 'renamed', 'name': 'again'})
+        assert directory.channelID('again') == 'C2'
+
+    def test_deletedAndArchived(self, slack):
+        slack.items['conversations.list'] = ('channels', channels(5))
+        directory = SlackChannelDirectory('xoxb-test')
+        directory.channelID('channel0')
+        directory.applyEvent({'type': 'channel_deleted', 'channel': 'C3'})
+        directory.applyEvent({'type': 'channel_archive', 'channel': 'C4', 'user': 'U1'})
+        assert directory.channelNames() == {'C0': 'channel0', 'C1': 'channel1', 'C2': 'channel2'}
+
+    def test_unarchivedListedAgain(self, slack):
+        slack.items['conversations.list'] = ('channels', channels(5))
+        directory = SlackChannelDirectory('xoxb-test')
+        directory.channelID('channel0')
+        directory.applyEvent({'type': 'channel_unarchive', 'channel': 'C4'})
+        directory.channelID('channel0')
+        directory.resync.join()
+        assert len(listCalls(slack)) == 2
@@ -0,0 +1,66 @@
+from pytest import raises
+from integration.directories.slackChannels import SlackChannelDirectory
+from integration.slackPagination import SlackAPIError, slackCursorPages, slackItems, slackPages
+from tests.directories.slackStandIn import channels
+
+
+class TestSlackPagination:
+    def test_everyPageFollowed(self, slack):
+        slack.items['conversations.list'] = ('channels', channels(2050))
+        assert list(slackItems('conversations.list', 'xoxb-test', 'channels', pageSize=200)) == channels(2050)
+        assert len(slack.calls) == 11
+
+    def test_cursorSent(self, slack):
+        slack.items['conversations.list'] = ('channels', channels(2050))
+        list(slackPages('conversations.list', 'xoxb-test', 'channels', {'exclude_archived': True}, pageSize=1000))
+        assert [params.get('cursor') for method, params in slack.calls] == [None, '1000', '2000']
+        assert all(params['exclude_archived'] == 'True' for method, params in slack.calls)
+
+    def test_pagesRequestedLazily(self, slack):
+        slack.items['conversations.list'] = ('channels', channels(2050))
+        pages = slackPages('conversations.list', 'xoxb-test', 'channels', pageSize=100)
+        assert len(next(pages)) == 100
+        assert len(slack.calls) == 1
+
+    def test_resumedFromCursor(self, slack):
+        slack.items['conversations.list'] = ('channels', channels(2050))
+        pages = list(slackCursorPages('conversations.list', 'xoxb-test', 'channels', pageSize=1000, cursor='1000'))
+        assert [cursor for page, cursor in pages] == ['2000', '']
+        assert pages[0][0][0] == channels(2050)[1000]
+
+    def test_rateLimitedPageRetried(self, slack):
+        answers = iter([(429, {'ok': False, 'error': 'ratelimited'}, {'Retry-After': '0'}), {'ok': True, 'channels': channels(3)}])
+        slack.responses['conversations.list'] = lambda params: next(answers)
+        assert list(slackItems('conversations.list', 'xoxb-test', 'channels')) == channels(3)
+        assert len(slack.calls) == 2
+
+    def test_errorRaised(self, slack):
+        with raises(SlackAPIError):
+            list(slackItems('conversations.unknown', 'xoxb-test', 'channels'))
+
+
+class TestLargeWorkspace:
+    def test_directoryHoldsEveryChannel(self, slack):
+        slack.items['conversations.list'] = ('channels', channels(2050))
+        directory = SlackChannelDirectory('xoxb-test')
+        assert directory.channelID('channel2049') == 'C2049'
+        assert len(directory.channelNames()) == 2050
+
+    def test_failedPageKeepsDirectory(self, slack):
+        slack.items['conversations.list'] = ('channels', channels(2050))
+        directory = SlackChannelDirectory('xoxb-test')
+        directory.channelID('channel0')
+
+        slack.responses['conversations.list'] = lambda params: {'ok': False, 'error': 'ratelimited'}
+        assert directory.refresh() is False
+        assert len(directory.channelNames()) == 2050
+
+    def test_failedRefreshBacksOff(self, slack):
+        slack.responses['conversations.list'] = lambda params: {'ok': False, 'error': 'ratelimited'}
+        directory = SlackChannelDirectory('xoxb-test')
+
+        # lookups after the failed listing do not list the channels again until the backoff has passed
+        assert directory.channelID('channel0') is None
+        assert directory.channelID('channel1') is None
+        assert directory.channelName('C2') is None
+        assert len(slack.calls) == 1
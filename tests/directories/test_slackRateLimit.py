@@ -0,0 +1,136 @@
+import asyncio
+from threading import Thread
+from time import monotonic
+from integration import slackRateLimit
+from integration.asyncTransport import closeTransport
+from integration.slackRateLimit import SlackScheduler, TokenBucket
+
+
+def throttledOnce(retryAfter):
+    """
+    Returns a response function answering 429 with the Retry-After on the first call and ok after that.
+    """
+    calls = []
+
+    def respond(params):
+        calls.append(params)
+        if len(calls) == 1:
+            return 429, {'ok': False, 'error': 'ratelimited'}, {'Retry-After': retryAfter}
+        return {'ok': True}
+    return respond
+
+
+class TestTokenBucket:
+    def test_burstAllowed(self):
+        bucket = TokenBucket(60, capacity=5)
+        assert [bucket.reserve() for i in range(5)] == [0] * 5
+
+    def test_callsQueuedAtRate(self):
+        bucket = TokenBucket(60, capacity=1)
+        bucket.reserve()
+        waits = [bucket.reserve() for i in range(3)]
+        assert [round(wait) for wait in waits] == [1, 2, 3]
+
+    def test_pause(self):
+        bucket = TokenBucket(6000)
+        bucket.pause(2)
+        assert 1.9 < bucket.reserve() <= 2
+
+
+class TestSlackScheduler:
+    def test_bucketPerMethodAndToken(self):
+        scheduler = SlackScheduler()
+        assert scheduler.bucket('xoxb-a', 'conversations.create') is scheduler.bucket('xoxb-a', 'conversations.create')
+        assert scheduler.bucket('xoxb-a', 'conversations.create') is not scheduler.bucket('xoxb-b', 'conversations.create')
+        assert scheduler.bucket('xoxb-a', 'conversations.create') is not scheduler.bucket('xoxb-a', 'conversations.rename')
+        assert scheduler.bucket('xoxb-a', 'conversations.create').capacity == 20
+
+    def test_postMessageBucketPerChannel(self):
+        scheduler = SlackScheduler()
+        assert scheduler.bucket('xoxb-a', 'chat.postMessage', 'a') is not scheduler.bucket('xoxb-a', 'chat.postMessage', 'b')
+
+    def test_retryAfterHonoured(self, slack):
+        slack.responses['chat.postMessage'] = throttledOnce('1')
+        scheduler = SlackScheduler()
+
+        start = monotonic()
+        response = scheduler.call('GET', 'chat.postMessage', 'xoxb-test', {'channel': 'general', 'text': 'hi'}, channel='general')
+        assert response.json()['ok']
+        assert monotonic() - start >= 1
+        assert len(slack.calls) == 2
+        assert scheduler.metrics()['throttled'] == 1
+
+    def test_requestBodyOpenedEachAttempt(self, slack):
+        slack.responses['files.upload'] = throttledOnce('0')
+        bodies = iter([b'first', b'second'])
+        requestBody = lambda: {'data': next(bodies)}
+
+        response = SlackScheduler().call('POST', 'files.upload', 'xoxb-test', {'channels': 'general'}, requestBody=requestBody)
+        assert response.json()['ok']
+        assert len(slack.calls) == 2
+
+    def test_missingRetryAfter(self, slack, monkeypatch):
+        monkeypatch.setattr(slackRateLimit, 'MAX_RETRIES', 1)
+        slack.responses['conversations.rename'] = lambda params: (429, {'ok': False}, {})
+        response = SlackScheduler().call('POST', 'conversations.rename', 'xoxp-test', json={'channel': 'C1', 'name': 'new'})
+        assert response.status_code == 429
+        assert len(slack.calls) == 2
+
+    def test_sustainedLoadDelivered(self, slack, monkeypatch):
+        monkeypatch.setitem(slackRateLimit.TIER_LIMITS, 2, 600)
+        slack.responses['conversations.create'] = lambda params: {'ok': True}
+        scheduler = SlackScheduler()
+        scheduler.bucket('xoxb-test', 'conversations.create').tokens = 0
+
+        threads = [Thread(target=scheduler.call, args=('GET', 'conversations.create', 'xoxb-test', {'name': str(i)})) for i in range(5)]
+        start = monotonic()
+        [thread.start() for thread in threads]
+        [thread.join() for thread in threads]
+
+        # every call is delivered, spaced at 10 a second
+        assert len(slack.calls) == 5
+        assert monotonic() - start >= 0.45
+        metrics = scheduler.metrics()
+        assert metrics['delayed'] == 5 and metrics['queued'] == 0 and metrics['throttled'] == 0
+
+
+class TestSlackSchedulerAsync:
+    def test_retryAfterHonoured(self, slack):
+        slack.responses['chat.postMessage'] = throttledOnce('1')
+        scheduler = SlackScheduler()
+
+        async def post():
+            try:
+                return await scheduler.callAsync('GET', 'chat.postMessage', 'xoxb-test', {'channel': 'general', 'text': 'hi'}, channel='general')
+            finally:
+                await closeTransport()
+
+        start = monotonic()
+        assert asyncio.run(post()).json()['ok']
+        assert monotonic() - start >= 1
+        assert len(slack.calls) == 2
+        assert scheduler.metrics()['throttled'] == 1
+
+    def test_sharedWithSyncCalls(self, slack, monkeypatch):
+        monkeypatch.setitem(slackRateLimit.TIER_LIMITS, 2, 600)
+        slack.responses['conversations.create'] = lambda params: {'ok': True}
+        scheduler = SlackScheduler()
+        scheduler.bucket('xoxb-test', 'conversations.create').tokens = 0
+
+        async def create():
+            try:
+                # a waiting call does not hold up the event loop, so the calls wait alongside each other
+                await asyncio.gather(*[scheduler.callAsync('GET', 'conversations.create', 'xoxb-test', {'name': str(i)}) for i in range(4)])
+            finally:
+                await closeTransport()
+
+        start = monotonic()
+        thread = Thread(target=scheduler.call, args=('GET', 'conversations.create', 'xoxb-test', {'name': 'sync'}))
+        thread.start()
+        asyncio.run(create())
+        thread.join()
+
+        # every call is delivered, spaced at 10 a second whether it was made from asyncio or a thread
+        assert len(slack.calls) == 5
+        assert monotonic() - start >= 0.45
+        assert scheduler.metrics()['delayed'] == 5
@@ -0,0 +1,98 @@
+import threading
+from time import perf_counter
+from integration.directories.slackUsers import SlackUserDirectory, userDirectory
+from integration.events.slackEvents import slackCustomPrefix
+
+
+def users(count):
+    """
+    Returns count Slack user objects with the IDs U0, U1, ...
+    """
+    return [{'id': 'U' + str(i), 'name': 'user' + str(i), 'real_name': 'User ' + str(i), 'profile': {'email': 'user' + str(i) + '@example.com', 'image_72': 'x'}} for i in range(count)]
+
+
+def methods(slack):
+    return [method for method, params in slack.calls]
+
+
+class TestUserDirectory:
+    def test_warmedFromPages(self, slack):
+        slack.items['users.list'] = ('members', users(450))
+        directory = SlackUserDirectory('xoxb-test')
+        assert directory.email('U0') == 'user0@example.com'
+        assert directory.user('U449')['real_name'] == 'User 449'
+        assert methods(slack) == ['users.list'] * 3
+
+    def test_onlyUsedFieldsKept(self, slack):
+        slack.items['users.list'] = ('members', users(450))
+        assert SlackUserDirectory('xoxb-test').user('U1') == {'id': 'U1', 'name': 'user1', 'real_name': 'User 1', 'profile': {'email': 'user1@example.com'}}
+
+    def test_newUserLookedUp(self, slack):
+        slack.items['users.list'] = ('members', users(450))
+        slack.responses['users.info'] = lambda params: {'ok': True, 'user': {'id': params['user'], 'real_name': 'New User', 'profile': {'email': 'new@example.com'}}}
+        directory = SlackUserDirectory('xoxb-test')
+        assert directory.email('UNEW') == 'new@example.com'
+        assert directory.email('UNEW') == 'new@example.com'
+        assert methods(slack).count('users.info') == 1
+
+    def test_expiredDirectoryListedAgain(self, slack):
+        slack.items['users.list'] = ('members', users(450))
+        directory = SlackUserDirectory('xoxb-test', ttl=0)
+        directory.user('U0')
+        directory.user('U0')
+        directory.resync.join()
+        assert methods(slack).count('users.list') == 6
+
+    def test_expiredDirectoryUsedWhileListed(self, slack):
+        slack.items['users.list'] = ('members', users(450))
+        directory = SlackUserDirectory('xoxb-test', ttl=0)
+        directory.user('U0')
+
+        # the users are listed again slowly, the lookups made meanwhile use the expired directory
+        listed = threading.Event()
+        slack.responses['users.list'] = lambda params: listed.wait(5) and {'ok': True, 'members': users(1)}
+        start = perf_counter()
+        assert directory.email('U449') == 'user449@example.com'
+        assert directory.email('U449') == 'user449@example.com'
+        assert perf_counter() - start < 1
+
+        # one listing was started for both lookups
+        listed.set()
+        directory.resync.join()
+        assert methods(slack).count('users.list') == 4
+        assert list(directory.users) == ['U0']
+
+    def test_failedRefreshBacksOff(self, slack):
+        slack.responses['users.list'] = lambda params: {'ok': False, 'error': 'ratelimited'}
+        directory = SlackUserDirectory('xoxb-test')
+        directory.ensureFresh()
+        directory.ensureFresh()
+        assert methods(slack).count('users.list') == 1
+
+    def test_directoryPerToken(self, slack):
+        assert userDirectory('xoxb-one') is userDirectory('xoxb-one')
+        assert userDirectory('xoxb-one') is not userDirectory('xoxb-two')
+
+
+class TestUserEvents:
+    def test_userChange(self, slack):
+        slack.items['users.list'] = ('members', users(450))
+        directory = SlackUserDirectory('xoxb-test')
+        directory.user('U0')
+        directory.applyEvent({'type': 'user_change', 'user': {'id': 'U0', 'real_name': 'Renamed', 'profile': {'email': 'renamed@example.com'}}})
+        assert directory.user('U0')['real_name'] == 'Renamed'
+        assert directory.email('U0') == 'renamed@example.com'
+        assert methods(slack).count('users.list') == 3
+
+    def test_teamJoin(self, slack):
+        slack.items['users.list'] = ('members', users(450))
+        directory = SlackUserDirectory('xoxb-test')
+        directory.user('U0')
+        directory.applyEvent({'type': 'team_join', 'user': {'id': 'U999', 'real_name': 'Joined', 'profile': {}}})
+        assert directory.user('U999')['real_name'] == 'Joined'
+        assert 'users.info' not in methods(slack)
+
+    def test_prefixFromDirectory(self, slack):
+        slack.items['users.list'] = ('members', users(450))
+        sender = SlackUserDirectory('xoxb-test').user('U3')
+        assert slackCustomPrefix(sender, 'general', testing='{name} {email} {channel} |') == 'User 3 user3@example.com general |'
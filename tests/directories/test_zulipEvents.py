@@ -0,0 +1,30 @@
+from pytest import fixture
+from integration.events import zulipEvents
+from integration.events.zulipEvents import handleZulipEvents
+
+
+@fixture
+def handler(monkeypatch):
+    monkeypatch.setattr(zulipEvents, 'runUserBootstrap', lambda user: None)
+
+    # events with broken content cannot be handled
+    def zulipEvent(event):
+        if event.get('broken'):
+            raise KeyError('message')
+        return event['id']
+    monkeypatch.setattr(zulipEvents, 'zulipEvent', zulipEvent)
+
+
+class TestHandleZulipEvents:
+    def test_failedEventSkipped(self, handler, caplog):
+        results, handledID = handleZulipEvents([{'id': 3}, {'id': 4, 'broken': True}, {'id': 5}])
+
+        assert results == [3, None, 5]
+        assert handledID == 5
+        assert 'Zulip event 4 could not be handled' in caplog.text
+
+    def test_lastEventFailed(self, handler):
+        assert handleZulipEvents([{'id': 3}, {'id': 4, 'broken': True}]) == ([3, None], 3)
+
+    def test_noEventsHandled(self, handler):
+        assert handleZulipEvents([{'id': 4, 'broken': True}]) == ([None], -1)
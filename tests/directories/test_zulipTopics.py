@@ -0,0 +1,158 @@
+from types import SimpleNamespace
+from pytest import fixture
+from integration.directories import zulipTopics
+from integration.directories.zulipTopics import ZulipTopicIndex, topicIndex
+from integration.webhooks import zulipWebHook
+from integration.webhooks.zulipWebHook import renameTopic
+from tests.directories.zulipStandIn import ZulipStandIn, startZulipStandIn
+
+
+@fixture
+def zulip():
+    server, zulipRC = startZulipStandIn()
+    ZulipStandIn.topics = {'general': [1, 5], 'random': [2, 3, 9]}
+
+    yield ZulipStandIn, zulipRC
+    server.shutdown()
+
+
+async def uploaded(filename, fileurl, deadline, slackAuth, zulipAuth):
+    return f"[{filename}](/user_uploads/{filename})"
+
+
+def message(topic, messageID, streamID=7, stream='Slack'):
+    return {'type': 'message', 'message': {'type': 'stream', 'stream_id': streamID, 'display_recipient': stream, 'subject': topic, 'id': messageID}}
+
+
+class TestZulipTopicIndex:
+    def test_listedOnce(self, zulip):
+        standIn, zulipRC = zulip
+        index = ZulipTopicIndex(zulipRC)
+
+        assert index.streamID() == 7
+        assert index.hasTopic('general') and not index.hasTopic('missing')
+        assert sorted(index.topicNames()) == ['general', 'random']
+        assert index.latestMessageID('random') == 9
+        assert len(standIn.calls) == 2
+
+    def test_missingStream(self, zulip):
+        standIn, zulipRC = zulip
+        standIn.streamID = None
+        index = ZulipTopicIndex(zulipRC)
+
+        assert index.streamID() is None and index.missing
+        standIn.streamID = 8
+        assert index.streamID() == 8 and not index.missing
+
+    def test_unansweredLookupNotMissing(self, zulip, monkeypatch):
+        standIn, zulipRC = zulip
+        monkeypatch.setattr(standIn, 'do_GET', lambda handler: handler.respond(502, {'result': 'error', 'msg': 'Bad gateway'}))
+        index = ZulipTopicIndex(zulipRC)
+
+        assert index.streamID() is None and not index.missing
+
+    def test_messageEvent(self, zulip):
+        standIn, zulipRC = zulip
+        index = ZulipTopicIndex(zulipRC)
+        index.applyEvent(message('bridged', 12))
+        index.applyEvent(message('random', 10))
+        index.applyEvent(message('elsewhere', 11, streamID=3, stream='other'))
+
+        assert index.latestMessageID('bridged') == 12 and index.latestMessageID('random') == 10
+        assert not index.hasTopic('elsewhere')
+        assert len(standIn.calls) == 2
+
+    def test_olderMessageDeleted(self, zulip):
+        standIn, zulipRC = zulip
+        index = ZulipTopicIndex(zulipRC)
+        index.applyEvent({'type': 'delete_message', 'message_type': 'stream', 'stream_id': 7, 'topic': 'random', 'message_id': 3})
+
+        assert index.hasTopic('random')
+        assert len(standIn.calls) == 2
+
+    def test_lastMessageDeleted(self, zulip):
+        standIn, zulipRC = zulip
+        index = ZulipTopicIndex(zulipRC)
+        index.streamID()
+
+        standIn.topics['general'] = [1]
+        index.applyEvent({'type': 'delete_message', 'message_type': 'stream', 'stream_id': 7, 'topic': 'general', 'message_ids': [5]})
+        assert index.latestMessageID('general') == 1
+
+        standIn.topics['general'] = []
+        index.applyEvent({'type': 'delete_message', 'message_type': 'stream', 'stream_id': 7, 'topic': 'general', 'message_ids': [1]})
+        assert not index.hasTopic('general')
+        assert [path for path, params in standIn.calls].count('/api/v1/messages') == 2
+
+    def test_topicRenamed(self, zulip):
+        standIn, zulipRC = zulip
+        index = ZulipTopicIndex(zulipRC)
+        index.applyEvent({'type': 'update_message', 'stream_id': 7, 'orig_subject': 'random', 'subject': 'chat', 'propagate_mode': 'change_all', 'message_ids': [2, 3, 9]})
+
+        assert not index.hasTopic('random')
+        assert index.latestMessageID('chat') == 9
+
+    def test_reconciled(self, zulip):
+        standIn, zulipRC = zulip
+        index = ZulipTopicIndex(zulipRC, ttl=0)
+        index.applyEvent(message('stale', 20))
+
+        # the topics listed from Zulip replace those seen in events once the index expires
+        assert not index.hasTopic('stale')
+
+
+class TestRenameTopic:
+    @fixture
+    def bot(self, zulip, monkeypatch):
+        standIn, zulipRC = zulip
+        monkeypatch.setattr(zulipWebHook, 'current_user', SimpleNamespace(zulipBotRC=zulipRC, slackToken='xoxb-rename'))
+        monkeypatch.setattr(zulipTopics, 'topicIndexes', {})
+        topicIndex(zulipRC).streamID()
+        standIn.calls.clear()
+        return standIn
+
+    def test_singlePatch(self, bot):
+        renameTopic('random', 'chat')
+
+        assert bot.calls == [('/api/v1/messages/9', {'topic': 'chat', 'propagate_mode': 'change_all'})]
+        assert sorted(bot.topics['chat']) == [2, 3, 9]
+
+    def test_unknownTopicLookedUp(self, bot):
+        bot.topics['quiet'] = [4]
+        renameTopic('quiet', 'loud')
+
+        assert [path for path, params in bot.calls] == ['/api/v1/messages', '/api/v1/messages/4']
+        assert bot.topics['loud'] == [4]
+
+    def test_staleAnchorLookedUp(self, bot):
+        bot.topics['random'] = [2, 3]
+        renameTopic('random', 'chat')
+
+        assert [path for path, params in bot.calls] == ['/api/v1/messages/9', '/api/v1/messages', '/api/v1/messages/3']
+        assert sorted(bot.topics['chat']) == [2, 3]
+
+
+class TestZulipWebhookFiles:
+    @fixture
+    def bot(self, zulip, monkeypatch):
+        standIn, zulipRC = zulip
+        monkeypatch.setattr(zulipWebHook, 'current_user', SimpleNamespace(zulipBotRC=zulipRC, slackToken='xoxb-files'))
+        monkeypatch.setattr(zulipTopics, 'topicIndexes', {})
+        monkeypatch.setattr(zulipWebHook, 'uploadToZulip', uploaded)
+        return standIn
+
+    def posts(self, bot):
+        return [params['content'] for path, params in bot.calls if path == '/api/v1/messages']
+
+    def test_textPostedWithFiles(self, bot):
+        zulipWebHook.zulipWebhook('general', 'hello', files=[('a.txt', 'https://slack.example/a.txt')])
+        assert self.posts(bot) == ['hello[a.txt](/user_uploads/a.txt)\n']
+
+    def test_textFirst(self, bot):
+        zulipWebHook.zulipWebhook('general', 'hello', files=[('a.txt', 'https://slack.example/a.txt')], textFirst=True)
+        assert self.posts(bot) == ['hello', '[a.txt](/user_uploads/a.txt)\n']
+
+    def test_textFirstByDefault(self, bot, monkeypatch):
+        monkeypatch.setattr(zulipWebHook, 'TEXT_FIRST', True)
+        zulipWebHook.zulipWebhook('general', 'hello', files=[('a.txt', 'https://slack.example/a.txt')])
+        assert self.posts(bot) == ['hello', '[a.txt](/user_uploads/a.txt)\n']
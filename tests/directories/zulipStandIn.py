@@ -0,0 +1,96 @@
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from urllib import parse
+
+
+class ZulipStandIn(BaseHTTPRequestHandler):
+    """
+    Local stand-in for the Zulip API holding the Slack stream, with the message IDs of each of its topics and the emails
+    subscribed to it, and recording every call as a tuple of the path and its parameters.
+    """
+    calls = []
+    streamID = 7
+    topics = {}
+    subscribers = []
+
+    def respond(self, status, body):
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        path = parse.urlsplit(self.path).path
+        params = dict(parse.parse_qsl(parse.urlsplit(self.path).query))
+        self.calls.append((path, params))
+
+        if path == '/api/v1/get_stream_id':
+            if self.streamID is None or params.get('stream') != 'Slack':
+                return self.respond(400, {'result': 'error', 'msg': "Invalid stream name 'Slack'"})
+            return self.respond(200, {'result': 'success', 'stream_id': self.streamID})
+
+        if path == f'/api/v1/users/me/{self.streamID}/topics':
+            return self.respond(200, {'result': 'success', 'topics': [{'name': name, 'max_id': max(ids)} for name, ids in self.topics.items() if ids]})
+
+        if path == '/api/v1/messages':
+            topic = [term['operand'] for term in json.loads(params['narrow']) if term['operator'] == 'topic'][0]
+            ids = sorted(self.topics.get(topic, []))[-int(params['num_before']):]
+            return self.respond(200, {'result': 'success', 'messages': [{'id': messageID, 'subject': topic} for messageID in ids]})
+
+        self.respond(404, {'result': 'error'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        params = dict(parse.parse_qsl(self.rfile.read(length).decode()))
+        path = parse.urlsplit(self.path).path
+        self.calls.append((path, params))
+
+        # subscribing creates the stream if it is missing
+        if path == '/api/v1/users/me/subscriptions':
+            if ZulipStandIn.streamID is None:
+                ZulipStandIn.streamID = 7
+            self.subscribers.extend(email for email in json.loads(params['principals']) if email not in self.subscribers)
+            return self.respond(200, {'result': 'success', 'subscribed': {}, 'already_subscribed': {}})
+
+        if path == '/api/v1/messages':
+            if self.streamID is None:
+                return self.respond(400, {'result': 'error', 'code': 'STREAM_DOES_NOT_EXIST', 'msg': "Stream 'Slack' does not exist"})
+            messageID = max([messageID for ids in self.topics.values() for messageID in ids], default=0) + 1
+            self.topics.setdefault(params['topic'], []).append(messageID)
+            return self.respond(200, {'result': 'success', 'id': messageID})
+
+        self.respond(404, {'result': 'error'})
+
+    def do_PATCH(self):
+        length = int(self.headers.get('Content-Length', 0))
+        params = dict(parse.parse_qsl(self.rfile.read(length).decode()))
+        path = parse.urlsplit(self.path).path
+        self.calls.append((path, params))
+
+        # move every message of the topic holding the message to the new topic
+        messageID = int(path.rsplit('/', 1)[-1])
+        for topic, ids in list(self.topics.items()):
+            if messageID in ids:
+                self.topics[params['topic']] = self.topics.pop(topic) + self.topics.get(params['topic'], [])
+                return self.respond(200, {'result': 'success'})
+        self.respond(400, {'result': 'error', 'msg': 'Invalid message(s)'})
+
+    def log_message(self, *args):
+        pass
+
+
+def startZulipStandIn():
+    """
+    Start the stand-in on a free port with the Slack stream and no topics, returns the server and the zuliprc of a bot.
+    """
+    ZulipStandIn.calls = []
+    ZulipStandIn.streamID = 7
+    ZulipStandIn.topics = {}
+    ZulipStandIn.subscribers = []
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ZulipStandIn)
+    Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+    return server, f"[api] email=bot@zulip.example key=key site=http://127.0.0.1:{server.server_address[1]}"
@@ -1,8 +1,8 @@
 from json import dumps
 from urllib import parse
-from flask import session
 from flask_login import current_user
 from requests import get, post, head, delete
+from integration.directories.slackChannels import channelDirectory
 from integration.events.zulipEvents import zulipEvents, zulipCustomPrefix
 from integration.webhooks.slackWebHook import deleteChannel, slackWebhook
 from integration.utilities import parseZulipRC, slackHeader
@@ -428,9 +428,11 @@ class TestSlackGeneralChannelRename:
 
 class TestDelete:
     def test_delete_slack(self):
-        session['slackChannels'][getChannelID('test_channel_new')] = 'test_channel_new'
         deletedChannelID = getChannelID('test_channel_new')
         deleteChannel('test_channel_new')
+
+        # the channel was renamed before it was archived, so the directory is given the name the topic has in Zulip
+        channelDirectory(current_user.slackToken).addChannel(deletedChannelID, 'test_channel_new')
         deleteChannelJSON = {'type': 'channel_deleted', 'channel' : deletedChannelID}
         deleteChannelEvent = slackEvents(deleteChannelJSON)
         assert deleteChannelEvent == "Slack deleted a channel", "Zulip could not delete channel"
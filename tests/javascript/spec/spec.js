@@ -546,6 +546,154 @@ describe("registerZulipQueue", () => {
 });
 
 
+describe("startZulip batches", () => {
+    beforeAll(() => {
+        // create labels
+        let zulipState = document.createElement('label');
+        zulipState.id = "zulipState";
+
+        let zulipStatus = document.createElement('img');
+        zulipStatus.id = "zulipStatus";
+
+        // add to dom
+        document.body.appendChild(zulipState);
+        document.body.appendChild(zulipStatus);
+    });
+
+    afterAll(() => ['zulipState', 'zulipStatus'].forEach(e => document.getElementById(e).remove()));
+
+    afterEach(() => {
+        lastEventID = -1;
+        zulipRetries = 0;
+        queue_id = null;
+    });
+
+    it("Every event of a poll is sent at once", done => {
+        let events = [
+            {id: 3, type: 'message', message: {content: 'first'}},
+            {id: 4, type: 'message', message: {content: 'second'}},
+            {id: 5, type: 'heartbeat'}
+        ];
+        let responses = [
+            new Response(JSON.stringify({result: 'success', events: events})),
+            new Response(JSON.stringify({last_event_id: 4}), {status: 200})
+        ];
+
+        queue_id = '1517975029:0';
+
+        // the third fetch is the next poll, which is left unanswered
+        spyOn(window, 'fetch').and.callFake(() => {
+            if (responses.length > 0) {
+                return Promise.resolve(responses.shift());
+            }
+
+            let zulipEndpointCall = window.fetch.calls.argsFor(1);
+            expect(zulipEndpointCall[0]).toEqual("\\api\\zulipEvents");
+            expect(JSON.parse(zulipEndpointCall[1].body).events).toEqual(events.slice(0, 2));
+
+            // the next poll starts after every event received, including the heartbeat
+            expect(lastEventID).toBe(5);
+            expect(window.fetch.calls.argsFor(2)[0]).toEqual("test/api/v1/events?queue_id=1517975029%3A0&last_event_id=5");
+            done();
+            return new Promise(() => {});
+        });
+
+        startZulip();
+    });
+
+
+    it("A poll of only heartbeats is not sent", done => {
+        let responses = [
+            new Response(JSON.stringify({result: 'success', events: [{id: 7, type: 'heartbeat'}]}))
+        ];
+
+        spyOn(window, 'fetch').and.callFake(() => {
+            if (responses.length > 0) {
+                return Promise.resolve(responses.shift());
+            }
+
+            expect(window.fetch.calls.count()).toBe(2);
+            expect(lastEventID).toBe(7);
+            done();
+            return new Promise(() => {});
+        });
+
+        startZulip();
+    });
+
+
+    it("A poll the endpoint could not handle is polled again", done => {
+        let responses = [
+            new Response(JSON.stringify({result: 'success', events: [{id: 3, type: 'message', message: {content: 'first'}}]})),
+            new Response(JSON.stringify({}), {status: 500})
+        ];
+
+        queue_id = '1517975029:0';
+
+        spyOn(window, 'fetch').and.callFake(() => {
+            if (responses.length > 0) {
+                return Promise.resolve(responses.shift());
+            }
+
+            // the next poll starts from the same event
+            expect(lastEventID).toBe(-1);
+            expect(window.fetch.calls.argsFor(2)[0]).toEqual("test/api/v1/events?queue_id=1517975029%3A0&last_event_id=-1");
+            done();
+            return new Promise(() => {});
+        });
+
+        startZulip();
+    });
+
+
+    it("A poll is continued from the last event the endpoint handled", done => {
+        let events = [
+            {id: 3, type: 'message', message: {content: 'first'}},
+            {id: 4, type: 'message', message: {content: 'second'}}
+        ];
+        let responses = [
+            new Response(JSON.stringify({result: 'success', events: events})),
+            new Response(JSON.stringify({last_event_id: 3}), {status: 200})
+        ];
+
+        queue_id = '1517975029:0';
+
+        spyOn(window, 'fetch').and.callFake(() => {
+            if (responses.length > 0) {
+                return Promise.resolve(responses.shift());
+            }
+
+            // the event that failed is polled again
+            expect(lastEventID).toBe(3);
+            expect(window.fetch.calls.argsFor(2)[0]).toEqual("test/api/v1/events?queue_id=1517975029%3A0&last_event_id=3");
+            done();
+            return new Promise(() => {});
+        });
+
+        startZulip();
+    });
+
+
+    it("A poll the endpoint keeps failing closes the integration", done => {
+        let poll = () => new Response(JSON.stringify({result: 'success', events: [{id: 3, type: 'message', message: {content: 'first'}}]}));
+        let failure = () => new Response(JSON.stringify({}), {status: 500});
+        let responses = [poll(), failure(), poll(), failure(), poll(), failure()];
+
+        queue_id = '1517975029:0';
+        spyOn(window, 'safeStop');
+        spyOn(window, 'fetch').and.callFake(() => Promise.resolve(responses.shift()));
+        let openSocket = socket;
+        socket = {close: () => {
+            socket = openSocket;
+            expect(window.fetch.calls.count()).toBe(6);
+            expect(document.getElementById('zulipState').innerHTML).toEqual("<b>CLOSED BY EXCEPTION</b>");
+            done();
+        }};
+
+        startZulip();
+    });
+});
+
 describe("registerSlackSocket without socketURL", () => {
     beforeAll(() => {
         // create labels
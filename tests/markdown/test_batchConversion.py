@@ -0,0 +1,34 @@
+from integration.markdown.batchConversion import convertMany, messageChunks, TO_SLACK, TO_ZULIP
+from integration.markdown.conversionContext import ConversionContext
+from integration.markdown.linkValidation import TRUST
+from integration.markdown.toSlack import slackMarkdown
+from integration.markdown.toZulip import zulipMarkdown
+
+# messages are converted outside of a request, without checking links
+context = ConversionContext(linkMode=TRUST)
+
+slackMessages = ["plain message", "*bold* _italic_ ~strike~", "- list *item*", "<https://example.com|*link*>", "```block```"] * 7
+zulipMessages = ["plain message", "**bold** *italic* ~~strike~~", "1. one\n2. two", "> quote\nline", "[link](https://example.com)"] * 7
+
+
+class TestMessageChunks:
+    def test_chunks(self):
+        assert list(messageChunks(range(7), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+
+    def test_chunksAreLazy(self):
+        chunks = messageChunks(iter(range(10)), 4)
+        assert next(chunks) == [0, 1, 2, 3]
+
+
+class TestConvertMany:
+    def test_sameAsSingleConversion(self):
+        assert list(convertMany(slackMessages, TO_ZULIP, context)) == [zulipMarkdown(message, context) for message in slackMessages]
+        assert list(convertMany(zulipMessages, TO_SLACK, context)) == [slackMarkdown(message, context) for message in zulipMessages]
+
+    def test_resultsStreamed(self):
+        results = convertMany(iter(slackMessages), TO_ZULIP, context)
+        assert next(results) == ('plain message', [])
+
+    def test_workerProcessesKeepOrder(self):
+        expected = [zulipMarkdown(message, context) for message in slackMessages]
+        assert list(convertMany(slackMessages, TO_ZULIP, context, workers=2, chunkSize=4)) == expected
@@ -0,0 +1,58 @@
+from integration.markdown.conversionCache import ConversionCache, resultSize
+from integration.markdown.conversionContext import ConversionContext
+from integration.markdown.linkValidation import TRUST
+from integration.markdown.toSlack import SlackConverter
+from integration.markdown.toZulip import ZulipConverter
+
+
+class TestConversionCache:
+    def test_hitsAndMisses(self):
+        cache = ConversionCache()
+        assert cache.get(('toZulip', 'a')) is None
+        cache.set(('toZulip', 'a'), ('b', []))
+        assert cache.get(('toZulip', 'a')) == ('b', [])
+        assert cache.stats() == {'hits': 1, 'misses': 1, 'entries': 1, 'bytes': resultSize(('toZulip', 'a'), ('b', []))}
+
+    def test_evictedBySize(self):
+        entrySize = resultSize(('toZulip', 'message 0'), ('result 0', []))
+        cache = ConversionCache(maxBytes=entrySize * 3)
+
+        for i in range(3):
+            cache.set(('toZulip', 'message ' + str(i)), ('result ' + str(i), []))
+        cache.get(('toZulip', 'message 0'))
+        cache.set(('toZulip', 'message 3'), ('result 3', []))
+
+        # the least recently used message is removed to make room
+        assert cache.get(('toZulip', 'message 1')) is None
+        assert cache.get(('toZulip', 'message 0')) == ('result 0', [])
+        assert cache.stats()['bytes'] <= entrySize * 3
+
+    def test_largeResultNotStored(self):
+        cache = ConversionCache(maxBytes=100)
+        cache.set(('toZulip', 'a' * 200), ('b' * 200, []))
+        assert cache.stats()['entries'] == 0
+
+
+class TestCachedConverters:
+    def test_repeatedMessageCached(self):
+        cache = ConversionCache()
+        converter = ZulipConverter(ConversionContext(linkMode=TRUST), cache)
+
+        assert converter.convert("*alert* fired") == ('**alert** fired', [])
+        assert converter.convert("*alert* fired") == ('**alert** fired', [])
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_emojiAdditionsChangeKey(self):
+        cache = ConversionCache()
+        assert ZulipConverter(ConversionContext(-20, '{":a:" : ":b:"}'), cache).convert("*hi* :a:") == ('**hi** :b:', [])
+        assert ZulipConverter(ConversionContext(-20, '{":a:" : ":c:"}'), cache).convert("*hi* :a:") == ('**hi** :c:', [])
+
+    def test_validatedLinksNotCached(self):
+        cache = ConversionCache()
+        ZulipConverter(ConversionContext(), cache).convert("*hi* <http://127.0.0.1:9/down>")
+        assert cache.stats()['entries'] == 0
+
+    def test_filesNotShared(self):
+        converter = SlackConverter(ConversionContext(zulipSite="https://zulip.example.com"), ConversionCache())
+        converter.convert("**file** [file](/user_uploads/file.png)")[1].clear()
+        assert converter.convert("**file** [file](/user_uploads/file.png)")[1] == [('file', 'https://zulip.example.com/user_uploads/file.png')]
@@ -0,0 +1,42 @@
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+from integration.markdown.conversionContext import ConversionContext, userContext
+from integration.markdown.linkValidation import TRUST
+from integration.markdown.toSlack import SlackConverter, slackMarkdown
+from integration.markdown.toZulip import ZulipConverter, zulipMarkdown
+
+
+def convertInProcess(converter, message):
+    return converter.convert(message)
+
+
+class TestConversionContext:
+    def test_userContext(self):
+        user = SimpleNamespace(id=1, emojiAdditions="{}", zulipBotRC="[api] email=bot@zulip.com key=abc site=https://zulip.example.com")
+        context = userContext(user, TRUST)
+        assert (context.userID, context.zulipSite, context.linkMode) == (1, "https://zulip.example.com", TRUST)
+
+    def test_userWithoutZulipBot(self):
+        user = SimpleNamespace(id=1, emojiAdditions="{}", zulipBotRC="NONE")
+        assert userContext(user).zulipSite == ""
+
+    def test_emojiAdditions(self):
+        context = ConversionContext(-10, '{":slack_only:" : ":zulip_only:"}')
+        assert zulipMarkdown("Hello :slack_only:", context) == ('Hello :zulip_only:', [])
+        assert slackMarkdown("Hello :zulip_only:", context) == ('Hello :slack_only:', [])
+
+    def test_uploadsUseZulipSite(self):
+        context = ConversionContext(zulipSite="https://zulip.example.com")
+        assert slackMarkdown("A file [file](/user_uploads/file.png)", context) == ('A file ', [('file', 'https://zulip.example.com/user_uploads/file.png')])
+
+
+class TestConverters:
+    def test_convertersPickle(self):
+        converter = pickle.loads(pickle.dumps(ZulipConverter(ConversionContext(linkMode=TRUST))))
+        assert converter.convert("*bold* <https://example.com>") == ('**bold** https://example.com', [])
+
+    def test_convertInWorkerProcess(self):
+        converter = SlackConverter(ConversionContext())
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            assert pool.submit(convertInProcess, converter, "**bold** *italic*").result() == ('*bold* _italic_', [])
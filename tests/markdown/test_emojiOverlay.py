@@ -0,0 +1,35 @@
+from integration.markdown.emojis.emojiOverlay import emojiOverlay, invalidateEmojiOverlay
+from integration.markdown.emojis.shortCodeDict import slackToZulipDict, zulipToSlackDict, slackToZulipTable, zulipToSlackTable
+
+
+class TestEmojiTables:
+    def test_tablesMatchDictionaries(self):
+        assert dict(slackToZulipTable) == slackToZulipDict()
+        assert dict(zulipToSlackTable) == zulipToSlackDict()
+
+    def test_noAdditionsUsesSharedTables(self):
+        overlay = emojiOverlay(-1, "{}")
+        assert overlay.slackToZulip is slackToZulipTable
+        assert overlay.zulipToSlack is zulipToSlackTable
+
+
+class TestEmojiOverlay:
+    def test_additionsMerged(self):
+        overlay = emojiOverlay(-2, '{":heart_slack:" : ":heart_zulip:"}')
+        assert overlay.slackToZulip[':heart_slack:'] == ':heart_zulip:'
+        assert overlay.zulipToSlack[':heart_zulip:'] == ':heart_slack:'
+        assert ':heart_slack:' not in slackToZulipTable
+
+    def test_overlayCachedUntilAdditionsChange(self):
+        overlay = emojiOverlay(-3, '{":a:" : ":b:"}')
+        assert emojiOverlay(-3, '{":a:" : ":b:"}') is overlay
+
+        changed = emojiOverlay(-3, '{":a:" : ":c:"}')
+        assert changed is not overlay
+        assert changed.version != overlay.version
+        assert changed.slackToZulip[':a:'] == ':c:'
+
+    def test_invalidateOverlay(self):
+        overlay = emojiOverlay(-4, '{":a:" : ":b:"}')
+        invalidateEmojiOverlay(-4)
+        assert emojiOverlay(-4, '{":a:" : ":b:"}') is not overlay
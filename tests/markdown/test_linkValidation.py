@@ -0,0 +1,114 @@
+import os
+from importlib.util import module_from_spec, spec_from_file_location
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from time import sleep, perf_counter
+from pytest import fixture
+from integration.markdown import linkValidation
+from integration.markdown.linkValidation import validateLinks, TRUST
+from integration.markdown.conversionContext import ConversionContext
+from integration.markdown.toZulip import zulipMarkdown
+
+
+class LinkHandler(BaseHTTPRequestHandler):
+    """
+    Local stand-in for the sites linked to in messages, counts the requests made for each path.
+    """
+    requests = []
+
+    def respond(self, method):
+        self.requests.append((method, self.path))
+
+        if self.path.startswith('/slow'):
+            sleep(0.5)
+        if self.path.startswith('/hang'):
+            sleep(3)
+
+        if self.path.startswith('/missing'):
+            self.send_response(404)
+        elif self.path.startswith('/nohead') and method == 'HEAD':
+            self.send_response(405)
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_HEAD(self):
+        self.respond('HEAD')
+
+    def do_GET(self):
+        self.respond('GET')
+
+    def log_message(self, *args):
+        pass
+
+
+@fixture
+def site(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), LinkHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+
+    LinkHandler.requests = []
+    linkValidation.linkCache.clear()
+    monkeypatch.setattr(linkValidation, 'LINK_DEADLINE', 2)
+
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+class TestLinkValidation:
+    def test_validLink(self, site):
+        assert validateLinks([site + "/ok"]) == {site + "/ok": True}
+        assert LinkHandler.requests == [('HEAD', '/ok')]
+
+    def test_invalidLink(self, site):
+        assert validateLinks([site + "/missing"]) == {site + "/missing": False}
+
+    def test_headNotAllowed(self, site):
+        assert validateLinks([site + "/nohead"]) == {site + "/nohead": True}
+        assert LinkHandler.requests == [('HEAD', '/nohead'), ('GET', '/nohead')]
+
+    def test_resultsCached(self, site):
+        validateLinks([site + "/ok", site + "/ok"])
+        validateLinks([site + "/ok"])
+        assert len(LinkHandler.requests) == 1
+
+    def test_linksCheckedConcurrently(self, site):
+        links = [site + "/slow" + str(i) for i in range(8)]
+        start = perf_counter()
+        assert all(validateLinks(links).values())
+        assert perf_counter() - start < 2
+
+    def test_deadline(self, site):
+        start = perf_counter()
+        assert validateLinks([site + "/hang"]) == {site + "/hang": False}
+        assert perf_counter() - start < 2.5
+        assert linkValidation.linkCache.get(site + "/hang") is None
+
+    def test_deadlineSharedByQueuedLinks(self, site):
+        # more links than workers, so the last links are still waiting for a worker at the deadline
+        links = [site + "/hang" + str(i) for i in range(linkValidation.LINK_WORKERS + 2)]
+        start = perf_counter()
+        assert not any(validateLinks(links).values())
+        assert perf_counter() - start < 2.5
+        assert all(linkValidation.linkCache.get(link) is None for link in links)
+
+    def test_trustMode(self, site):
+        assert validateLinks([site + "/missing"], mode=TRUST) == {site + "/missing": True}
+        assert LinkHandler.requests == []
+
+
+class TestWithoutFork:
+    def test_importedWithoutForkHooks(self, monkeypatch):
+        # Windows has no os.register_at_fork, so a separate copy of the module is imported without it
+        monkeypatch.delattr(os, 'register_at_fork')
+        spec = spec_from_file_location('linkValidationWithoutFork', linkValidation.__file__)
+        spec.loader.exec_module(module_from_spec(spec))
+
+
+class TestLinkMarkdown:
+    def test_validLinkConverted(self, site):
+        assert zulipMarkdown("This is a link <" + site + "/ok>", ConversionContext()) == ('This is a link ' + site + '/ok', [])
+
+    def test_invalidLinkKept(self, site):
+        assert zulipMarkdown("This is a link <" + site + "/missing>", ConversionContext()) == ('This is a link <' + site + '/missing>', [])
@@ -0,0 +1,72 @@
+from time import perf_counter
+from integration.markdown.conversionContext import ConversionContext
+from integration.markdown.markdownEngine import messageTokens
+from integration.markdown.toSlack import SlackConverter, slackLexer
+from integration.markdown.toZulip import ZulipConverter, zulipLexer
+
+# runs of plain text are coalesced into one token, so each message is repeated until it lexes to this many tokens
+TOKEN_COUNT = 100_000
+
+# seconds allowed to convert one message, a quadratic pass over 100k tokens takes far longer than this
+TIME_BUDGET = 5
+
+# messages are converted outside of a request, for a user without emoji additions
+zulipMarkdown = ZulipConverter(ConversionContext()).convert
+slackMarkdown = SlackConverter(ConversionContext()).convert
+
+
+def tokenCount(lexer, message):
+    return sum(1 for token in messageTokens(lexer.clone(), message))
+
+
+def repeatTo(line, lexer):
+    """
+    Repeat a line until the message lexes to at least TOKEN_COUNT tokens.
+
+    :param line: The line to repeat
+    :type line: String
+
+    :param lexer: Lexer of the converter the message is for
+    :type lexer: Lexer
+    """
+    perLine = tokenCount(lexer, line * 100) / 100
+    message = line * (int(TOKEN_COUNT / perLine) + 1)
+    assert tokenCount(lexer, message) >= TOKEN_COUNT
+    return message
+
+
+def timeConversion(converter, message):
+    start = perf_counter()
+    converter(message)
+    return perf_counter() - start
+
+
+class TestZulipComplexity:
+    def test_unmatchedTags(self):
+        assert timeConversion(zulipMarkdown, repeatTo("*open\n*closed* _this_ ~and this\n", zulipLexer)) < TIME_BUDGET
+
+    def test_multilineBlocks(self):
+        assert timeConversion(zulipMarkdown, repeatTo("```block``` *unmatched\n", zulipLexer)) < TIME_BUDGET
+
+    def test_boldItalic(self):
+        assert timeConversion(zulipMarkdown, repeatTo("***bold italic*** ", zulipLexer)) < TIME_BUDGET
+
+
+class TestSlackComplexity:
+    def test_unmatchedTags(self):
+        assert timeConversion(slackMarkdown, repeatTo("**open\n**closed** *this* ~~and this\n", slackLexer)) < TIME_BUDGET
+
+    def test_quoteBlocks(self):
+        assert timeConversion(slackMarkdown, repeatTo("```quote\nquoted\n```\n> quote\n", slackLexer)) < TIME_BUDGET
+
+    def test_lists(self):
+        assert timeConversion(slackMarkdown, repeatTo("1. first\nsecond\n- bullet\n    indented\n", slackLexer)) < TIME_BUDGET
+
+
+class TestUnchangedOutput:
+    def test_unmatchedTagsOnLaterLines(self):
+        assert zulipMarkdown("x *a\ny *b*") == ('x *a\ny *b*', [])
+        assert slackMarkdown("**a\n**b**") == ('**a\n**b**', [])
+
+    def test_boldItalicPairs(self):
+        assert zulipMarkdown("***a*** ***b***") == ('*_a_* _*b_*', [])
@@ -0,0 +1,25 @@
+from integration.markdown.markdownEngine import MarkdownToken, MessageState, emitTokens, emitText, keepValue, messageTokens
+from integration.markdown.toSlack import SlackTokens, slackEmitters
+from integration.markdown.toZulip import ZulipTokens, zulipEmitters, zulipLexer
+
+
+class TestMarkdownToken:
+    def test_noInstanceDictionary(self):
+        token = MarkdownToken('STRING', 'text')
+        assert not hasattr(token, '__dict__')
+        assert (token.type, token.value) == ('STRING', 'text')
+
+    def test_plainTextJoined(self):
+        tokens = list(messageTokens(zulipLexer.clone(), "some text *bold*"))
+        assert [(tok.type, tok.value) for tok in tokens] == [('STRING', 'some text '), ('BOLD', '*'), ('STRING', 'bold'), ('BOLD', '*')]
+
+
+class TestEmitters:
+    def test_everyTokenHasAnEmitter(self):
+        assert set(ZulipTokens.tokens) <= set(zulipEmitters)
+        assert set(SlackTokens.tokens) <= set(slackEmitters)
+
+    def test_tokensWithoutEmitterDropped(self):
+        tokens = [MarkdownToken('STRING', 'a'), MarkdownToken('UNKNOWN', 'b'), MarkdownToken('BOLD', '*')]
+        emitters = {'STRING': keepValue, 'BOLD': emitText('**')}
+        assert emitTokens(tokens, emitters, MessageState(None)) == 'a**'
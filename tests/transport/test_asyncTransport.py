@@ -0,0 +1,166 @@
+import asyncio
+from base64 import b64encode
+from contextvars import ContextVar
+from http.server import ThreadingHTTPServer
+from threading import Thread
+from time import monotonic
+from flask import Flask
+from flask_login import AnonymousUserMixin, LoginManager, current_user
+from pytest import fixture, raises
+from integration import asyncTransport
+from integration.asyncTransport import blocking, bridgedUser, closeTransport, get, operationSlot, post, runSync
+from tests.transport.test_transport import KeepAliveHandler
+
+caller = ContextVar('caller', default=None)
+
+
+@fixture
+def upstream():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+    Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+    KeepAliveHandler.ports = []
+
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def runAsync(coroutine):
+    async def run():
+        try:
+            return await coroutine
+        finally:
+            await closeTransport()
+    return asyncio.run(run())
+
+
+class Operations:
+    """
+    Stand-in bridge operation that holds its slot for a number of seconds, recording the most operations running at
+    once in total and for each tenant.
+    """
+    def __init__(self, seconds=0.01):
+        self.seconds = seconds
+        self.running = {}
+        self.most = 0
+        self.tenantMost = 0
+
+    async def __call__(self, tenant):
+        async with operationSlot(tenant):
+            self.running[tenant] = self.running.get(tenant, 0) + 1
+            self.most = max(self.most, sum(self.running.values()))
+            self.tenantMost = max(self.tenantMost, self.running[tenant])
+            await asyncio.sleep(self.seconds)
+            self.running[tenant] -= 1
+        return tenant
+
+
+class TestRequests:
+    def test_connectionReused(self, upstream):
+        async def send():
+            texts = [(await get(upstream + "/api", headers={'Authorization': 'Bearer a'})).text for _ in range(5)]
+            await post(upstream + "/api", data={'a': 1}, auth=('bot@example.com', 'key'))
+            return texts
+
+        assert runAsync(send()) == ['ok'] * 5
+        assert len(set(KeepAliveHandler.ports)) == 1
+
+    def test_basicAuth(self):
+        kwargs = asyncTransport.requestArguments({'auth': ('bot@example.com', 'key'), 'params': {'a': 1, 'b': None}})
+        assert kwargs['headers'] == {'Authorization': 'Basic ' + b64encode(b'bot@example.com:key').decode()}
+        assert kwargs['params'] == {'a': '1'}
+
+    def test_defaultTimeout(self, upstream, monkeypatch):
+        monkeypatch.setattr(asyncTransport, 'TIMEOUT', (1, 0.2))
+        with raises(asyncio.TimeoutError):
+            runAsync(get(upstream + "/slow"))
+
+    def test_connectionFailure(self, monkeypatch):
+        monkeypatch.setattr(asyncTransport, 'RETRY_BACKOFF', 0)
+        with raises(OSError):
+            runAsync(get("http://127.0.0.1:9/unreachable", timeout=1))
+
+
+class TestOperationSlot:
+    def test_thousandsInFlight(self, monkeypatch):
+        monkeypatch.setattr(asyncTransport, 'IN_FLIGHT_LIMIT', 100)
+        monkeypatch.setattr(asyncTransport, 'TENANT_LIMIT', 8)
+        operations = Operations()
+
+        async def bridge():
+            return await asyncio.gather(*[operations('tenant' + str(i % 50)) for i in range(5000)])
+
+        start = monotonic()
+        assert runAsync(bridge()) == ['tenant' + str(i % 50) for i in range(5000)]
+        assert operations.most == 100 and operations.tenantMost <= 8
+        assert monotonic() - start < 5
+
+    def test_tenantCannotHoldEverySlot(self, monkeypatch):
+        monkeypatch.setattr(asyncTransport, 'IN_FLIGHT_LIMIT', 4)
+        monkeypatch.setattr(asyncTransport, 'TENANT_LIMIT', 2)
+        operations = Operations(0.05)
+
+        async def bridge():
+            # the busy tenant's operations are queued first, the quiet tenant still runs alongside them
+            busy = asyncio.gather(*[operations('busy') for _ in range(20)])
+            await asyncio.sleep(0.01)
+            start = monotonic()
+            await operations('quiet')
+            waited = monotonic() - start
+            await busy
+            return waited
+
+        assert runAsync(bridge()) < 0.2
+
+    def test_nestedOperationUsesHeldSlot(self, monkeypatch):
+        monkeypatch.setattr(asyncTransport, 'TENANT_LIMIT', 1)
+
+        async def outer():
+            async with operationSlot('tenant'):
+                async with operationSlot('tenant'):
+                    return 'done'
+
+        assert runAsync(asyncio.wait_for(outer(), 1)) == 'done'
+
+
+class TestRunSync:
+    def test_result(self):
+        async def operation():
+            await asyncio.sleep(0.01)
+            return 'sent'
+
+        assert runSync(operation()) == 'sent'
+
+    def test_exceptionRaised(self):
+        async def operation():
+            raise KeyError('stream_id')
+
+        with raises(KeyError):
+            runSync(operation())
+
+    def test_callerContextCopied(self):
+        async def operation():
+            return caller.get(), await blocking(caller.get)
+
+        token = caller.set('flask')
+        try:
+            assert runSync(operation()) == ('flask', 'flask')
+        finally:
+            caller.reset(token)
+
+    def test_notFromBridgeLoop(self):
+        async def operation():
+            return 'sent'
+
+        async def nested():
+            return runSync(operation())
+
+        with raises(RuntimeError):
+            runSync(nested())
+
+    def test_bridgedUser(self):
+        app = Flask(__name__)
+        LoginManager(app).user_loader(lambda userID: None)
+
+        with app.test_request_context('/api/slackEvents'):
+            user = bridgedUser(current_user)
+        assert isinstance(user, AnonymousUserMixin)
@@ -0,0 +1,357 @@
+import asyncio
+import json
+import tracemalloc
+from hashlib import sha256
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import monotonic, sleep
+from uuid import uuid4
+from pytest import fixture, raises
+from integration import fileRelay
+from integration.asyncTransport import closeTransport, post as postAsync
+from integration.fileRelay import FileTooLarge, MultipartStream, RelayTimeout, limitedChunks, multipartBody, multipartBodyAsync, openDownload, openDownloadAsync, relayFiles, relayFilesAsync, sizedChunks, sizedChunksAsync
+from integration.transport import closeSessions, post
+
+FILE_SIZE = 20_000_000
+
+
+def fileBytes(size):
+    """
+    Yield the bytes of a test file of a given size 64KB at a time.
+    """
+    block = bytes(range(256)) * 256
+    for start in range(0, size, len(block)):
+        yield block[:min(len(block), size - start)]
+
+
+class RelayHandler(BaseHTTPRequestHandler):
+    """
+    Local upstream serving test files from /file/<size>, with no Content-Length from /unsized/<size>, and recording the
+    size and hash of the file in each multipart upload.
+    """
+    protocol_version = 'HTTP/1.1'
+    uploads = []
+
+    def do_GET(self):
+        size = int(self.path.rsplit('/', 1)[-1])
+        self.send_response(200)
+        if self.path.startswith('/file'):
+            self.send_header('Content-Length', str(size))
+        else:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+
+        try:
+            for block in fileBytes(size):
+                self.wfile.write(block)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def bodyChunks(self):
+        if 'Content-Length' in self.headers:
+            remaining = int(self.headers['Content-Length'])
+            while remaining:
+                chunk = self.rfile.read(min(remaining, 64 * 1024))
+                remaining -= len(chunk)
+                yield chunk
+            return
+
+        # chunked transfer encoding, an empty line means the client gave up on the upload
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                raise ConnectionAbortedError
+            length = int(line.strip(), 16)
+            if length == 0:
+                self.rfile.readline()
+                return
+            yield self.rfile.read(length)
+            self.rfile.readline()
+
+    def do_POST(self):
+        boundary = self.headers['Content-Type'].split('boundary=')[1].encode()
+        digest, size, head, tail = sha256(), 0, None, b''
+
+        # hash the file between the part headers and the closing boundary without holding the upload
+        try:
+            for chunk in self.bodyChunks():
+                if head is None or not head.endswith(b'\r\n\r\n'):
+                    head = (head or b'') + chunk
+                    if b'\r\n\r\n' not in head:
+                        continue
+                    head, chunk = head.split(b'\r\n\r\n', 1)
+                    head += b'\r\n\r\n'
+                data = tail + chunk
+                keep = len(boundary) + 8
+                digest.update(data[:-keep])
+                size += len(data[:-keep])
+                tail = data[-keep:]
+        except ConnectionAbortedError:
+            return
+
+        assert tail == b'\r\n--' + boundary + b'--\r\n'
+        self.uploads.append({'size': size, 'sha256': digest.hexdigest(), 'chunked': 'Content-Length' not in self.headers})
+
+        content = json.dumps({'uri': '/user_uploads/1'}).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+@fixture
+def upstream():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RelayHandler)
+    Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+    RelayHandler.uploads = []
+    closeSessions()
+
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    closeSessions()
+    server.shutdown()
+
+
+def relay(upstream, path, limit=None):
+    with openDownload(upstream + path) as download:
+        body, contentType = multipartBody(download, 'file', 'report.pdf', limit)
+        return post(upstream + '/upload', data=body, headers={'Content-Type': contentType})
+
+
+def runAsync(coroutine):
+    async def run():
+        try:
+            return await coroutine
+        finally:
+            await closeTransport()
+    return asyncio.run(run())
+
+
+async def relayAsync(upstream, path, limit=None):
+    async with openDownloadAsync(upstream + path) as download:
+        body, headers = multipartBodyAsync(download, 'file', 'report.pdf', limit)
+        return await postAsync(upstream + '/upload', data=body, headers=headers)
+
+
+def fileHash(size):
+    digest = sha256()
+    [digest.update(block) for block in fileBytes(size)]
+    return digest.hexdigest()
+
+
+class TestMultipartStream:
+    def test_length(self):
+        stream = MultipartStream('file', 'a.txt', [b'abc', b'de'], 5)
+        assert len(stream) == len(b''.join(stream))
+
+    def test_unsizedStreamHasNoLength(self):
+        body = MultipartStream('file', 'a.txt', [b'abc'], None).body()
+        assert not hasattr(body, '__len__')
+
+    def test_filenameQuoted(self):
+        stream = MultipartStream('file', 'a"b\r\n.txt', [], 0)
+        assert b'filename="a%22b.txt"' in stream.head
+
+
+class TestFileRelay:
+    def test_fileRelayed(self, upstream):
+        assert relay(upstream, '/file/3000000').json()['uri'] == '/user_uploads/1'
+        assert RelayHandler.uploads == [{'size': 3000000, 'sha256': fileHash(3000000), 'chunked': False}]
+
+    def test_unsizedFileRelayed(self, upstream):
+        relay(upstream, '/unsized/1500000')
+        assert RelayHandler.uploads == [{'size': 1500000, 'sha256': fileHash(1500000), 'chunked': True}]
+
+    def test_tooLargeFromHeaders(self, upstream):
+        with openDownload(upstream + '/file/30000000') as download:
+            with raises(FileTooLarge):
+                multipartBody(download, 'file', 'large.zip', 25_000_000)
+            assert download.raw.tell() == 0
+
+    def test_unsizedTooLarge(self, upstream):
+        with raises(FileTooLarge):
+            relay(upstream, '/unsized/3000000', limit=2_000_000)
+        assert RelayHandler.uploads == []
+
+    def test_unsizedFileSized(self, upstream):
+        with openDownload(upstream + '/unsized/1500000') as download:
+            chunks, size = sizedChunks(download)
+            stream = MultipartStream('file', 'report.pdf', chunks, size)
+            post(upstream + '/upload', data=stream.body(), headers={'Content-Type': stream.contentType})
+        assert size == 1500000
+        assert RelayHandler.uploads == [{'size': 1500000, 'sha256': fileHash(1500000), 'chunked': False}]
+
+    def test_constantMemory(self, upstream):
+        tracemalloc.start()
+        try:
+            relay(upstream, f'/file/{FILE_SIZE}')
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        assert RelayHandler.uploads[0]['size'] == FILE_SIZE
+        assert peak < FILE_SIZE / 20
+
+
+class TestAsyncFileRelay:
+    def test_fileRelayed(self, upstream):
+        assert runAsync(relayAsync(upstream, '/file/3000000')).json()['uri'] == '/user_uploads/1'
+        assert RelayHandler.uploads == [{'size': 3000000, 'sha256': fileHash(3000000), 'chunked': False}]
+
+    def test_unsizedFileRelayed(self, upstream):
+        runAsync(relayAsync(upstream, '/unsized/1500000'))
+        assert RelayHandler.uploads == [{'size': 1500000, 'sha256': fileHash(1500000), 'chunked': True}]
+
+    def test_unsizedFileSized(self, upstream):
+        async def relay():
+            async with openDownloadAsync(upstream + '/unsized/1500000') as download:
+                chunks, size = await sizedChunksAsync(download)
+                body, headers = MultipartStream('file', 'report.pdf', chunks, size).asyncBody()
+                await postAsync(upstream + '/upload', data=body, headers=headers)
+                return size
+
+        assert runAsync(relay()) == 1500000
+        assert RelayHandler.uploads == [{'size': 1500000, 'sha256': fileHash(1500000), 'chunked': False}]
+
+    def test_tooLargeFromHeaders(self, upstream):
+        async def relay():
+            async with openDownloadAsync(upstream + '/file/30000000') as download:
+                with raises(FileTooLarge):
+                    multipartBodyAsync(download, 'file', 'large.zip', 25_000_000)
+
+        runAsync(relay())
+        assert RelayHandler.uploads == []
+
+    def test_unsizedTooLarge(self, upstream):
+        with raises(FileTooLarge):
+            runAsync(relayAsync(upstream, '/unsized/3000000', limit=2_000_000))
+        assert RelayHandler.uploads == []
+
+    def test_constantMemory(self, upstream):
+        tracemalloc.start()
+        try:
+            runAsync(relayAsync(upstream, f'/file/{FILE_SIZE}'))
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        # aiohttp reads ahead up to about a megabyte of the download, however large the file
+        assert RelayHandler.uploads[0]['size'] == FILE_SIZE
+        assert peak < FILE_SIZE / 10
+
+
+class SlowDownload:
+    """
+    Stand-in download yielding a chunk every interval seconds.
+    """
+    def __init__(self, chunks, interval):
+        self.chunks = chunks
+        self.interval = interval
+
+    def iter_content(self, size):
+        for i in range(self.chunks):
+            sleep(self.interval)
+            yield b'x' * size
+
+
+class SlowRelay:
+    """
+    Stand-in relay taking the number of seconds in the URL of each file and recording the most files relayed at once.
+    """
+    def __init__(self):
+        self.running = 0
+        self.most = 0
+        self.lock = Lock()
+
+    def __call__(self, filename, fileurl, deadline):
+        with self.lock:
+            self.running += 1
+            self.most = max(self.most, self.running)
+        sleep(float(fileurl))
+        with self.lock:
+            self.running -= 1
+
+        if filename == 'broken':
+            raise ConnectionError(filename)
+        return filename
+
+
+class TestRelayFiles:
+    def test_resultsInOrder(self):
+        files = [('a', '0.15'), ('b', '0.05'), ('broken', '0'), ('c', '0.1')]
+        results = relayFiles(files, SlowRelay(), uuid4().hex)
+        assert results[:2] == ['a', 'b'] and results[3] == 'c'
+        assert isinstance(results[2], ConnectionError)
+
+    def test_filesRelayedAtOnce(self):
+        start = monotonic()
+        relayFiles([(str(i), '0.2') for i in range(4)], SlowRelay(), uuid4().hex)
+        assert monotonic() - start < 0.6
+
+    def test_tenantLimited(self, monkeypatch):
+        monkeypatch.setattr(fileRelay, 'TENANT_FILE_LIMIT', 2)
+        relay = SlowRelay()
+        relayFiles([(str(i), '0.05') for i in range(6)], relay, uuid4().hex)
+        assert relay.most == 2
+
+    def test_stalledFileGivenUp(self):
+        start = monotonic()
+        results = relayFiles([('a', '0.05'), ('stalled', '1')], SlowRelay(), uuid4().hex, deadline=0.3)
+        assert results[0] == 'a' and isinstance(results[1], RelayTimeout)
+        assert monotonic() - start < 0.6
+
+    def test_slotWaitBounded(self, monkeypatch):
+        # the second file is still waiting for the tenant's only slot at the deadline
+        monkeypatch.setattr(fileRelay, 'TENANT_FILE_LIMIT', 1)
+        start = monotonic()
+        results = relayFiles([('stalled', '1'), ('b', '0')], SlowRelay(), uuid4().hex, deadline=0.3)
+        assert all(isinstance(result, RelayTimeout) for result in results)
+        assert monotonic() - start < 0.6
+
+    def test_deadline(self):
+        with raises(RelayTimeout):
+            list(limitedChunks(SlowDownload(10, 0.05), deadline=0.1))
+        assert len(list(limitedChunks(SlowDownload(2, 0.01), deadline=1))) == 2
+
+
+class AsyncSlowRelay(SlowRelay):
+    """
+    Stand-in relay for relayFilesAsync, waiting on the event loop rather than a thread.
+    """
+    async def __call__(self, filename, fileurl, deadline):
+        self.running += 1
+        self.most = max(self.most, self.running)
+        try:
+            await asyncio.sleep(float(fileurl))
+        finally:
+            self.running -= 1
+
+        if filename == 'broken':
+            raise ConnectionError(filename)
+        return filename
+
+
+class TestRelayFilesAsync:
+    def test_resultsInOrder(self):
+        files = [('a', '0.15'), ('b', '0.05'), ('broken', '0'), ('c', '0.1')]
+        results = runAsync(relayFilesAsync(files, AsyncSlowRelay(), uuid4().hex))
+        assert results[:2] == ['a', 'b'] and results[3] == 'c'
+        assert isinstance(results[2], ConnectionError)
+
+    def test_tenantLimited(self, monkeypatch):
+        monkeypatch.setattr(fileRelay, 'TENANT_FILE_LIMIT', 2)
+        relay = AsyncSlowRelay()
+        runAsync(relayFilesAsync([(str(i), '0.05') for i in range(6)], relay, uuid4().hex))
+        assert relay.most == 2
+
+    def test_stalledFileCancelled(self, monkeypatch):
+        # the third file is still waiting for a slot at the deadline
+        monkeypatch.setattr(fileRelay, 'TENANT_FILE_LIMIT', 2)
+        relay = AsyncSlowRelay()
+        start = monotonic()
+        results = runAsync(relayFilesAsync([('a', '0.05'), ('stalled', '5'), ('c', '0.3')], relay, uuid4().hex, deadline=0.2))
+        assert results[0] == 'a' and isinstance(results[1], RelayTimeout) and isinstance(results[2], RelayTimeout)
+        assert monotonic() - start < 0.5
+        assert relay.running == 0
@@ -0,0 +1,77 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from time import sleep
+from pytest import fixture, raises
+from requests.exceptions import ConnectionError, Timeout
+from integration import transport
+from integration.transport import closeSessions, get, post, sessionKey, transportSession
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    """
+    Local upstream that keeps connections open and records the client port of each request.
+    """
+    protocol_version = 'HTTP/1.1'
+    ports = []
+
+    def respond(self):
+        self.ports.append(self.client_address[1])
+        if self.path.startswith('/slow'):
+            sleep(1)
+
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def do_GET(self):
+        self.respond()
+
+    def do_POST(self):
+        self.respond()
+
+    def log_message(self, *args):
+        pass
+
+
+@fixture
+def upstream():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+    Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+    KeepAliveHandler.ports = []
+    closeSessions()
+
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    closeSessions()
+    server.shutdown()
+
+
+class TestSessions:
+    def test_sessionPerHostAndCredential(self):
+        slackSession = transportSession("https://slack.com/api/chat.postMessage", headers={'Authorization': 'Bearer a'})
+        assert transportSession("https://slack.com/api/auth.test", headers={'Authorization': 'Bearer a'}) is slackSession
+        assert transportSession("https://slack.com/api/auth.test", headers={'Authorization': 'Bearer b'}) is not slackSession
+        assert transportSession("https://zulip.example.com/api/v1/messages", auth=('bot@example.com', 'key')) is not slackSession
+
+    def test_sessionKey(self):
+        assert sessionKey("https://zulip.example.com/api/v1/messages", auth=('bot@example.com', 'key')) == ('https', 'zulip.example.com', ('bot@example.com', 'key'))
+
+
+class TestKeepAlive:
+    def test_connectionReused(self, upstream):
+        for _ in range(5):
+            assert get(upstream + "/api", headers={'Authorization': 'Bearer a'}).text == 'ok'
+        post(upstream + "/api", headers={'Authorization': 'Bearer a'}, data={'a': 1})
+        assert len(set(KeepAliveHandler.ports)) == 1
+
+    def test_defaultTimeout(self, upstream, monkeypatch):
+        monkeypatch.setattr(transport, 'TIMEOUT', (1, 0.2))
+        with raises(Timeout):
+            get(upstream + "/slow")
+
+    def test_connectionFailure(self):
+        with raises(ConnectionError):
+            get("http://127.0.0.1:9/unreachable", timeout=1)